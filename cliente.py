@@ -1,9 +1,13 @@
 from __future__ import annotations
 import argparse
 import base64
+import hashlib
+import io
 import json
 import os
 import queue
+import re
+import selectors
 import shutil
 import socket
 import subprocess
@@ -14,9 +18,23 @@ import time
 from typing import Optional, Tuple
 import http.server
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+from core.protocolo import KIND_TEXT, cabecalho_frame, send_frame
 
 BUFFER = 65536
 RECV_TIMEOUT = 1.0  # timeout para recv non-blocking em loops
+SOCK_RCVBUF = 4 * 1024 * 1024  # áudio chega em rajadas de centenas de KB
+SOCK_SNDBUF = 1 * 1024 * 1024
+
+# protocolo binário opcional (--binary-proto): header fixo (tipo, tamanho) + payload,
+# sem passar pelo serializador JSON. O servidor detecta pelo primeiro byte; o layout
+# fica em core/protocolo.py, compartilhado com o servidor.
+
+# servidor na mesma máquina (--shm): o áudio chega num arquivo em tmpfs (memória
+# compartilhada POSIX) em vez de pelo socket; o cliente anuncia isso no hello
+SHM_DIR = "/dev/shm"
+HELLO_SHM = b'{"type":"hello","caps":["shm"]}\n'
 
 try:
     import tkinter as tk
@@ -25,6 +43,14 @@ except Exception:
     tk = None
     TK_AVAILABLE = False
 
+# orjson é opcional: parse de headers mais rápido; fallback para json da stdlib
+try:
+    import orjson
+    _json_loads = orjson.loads
+except Exception:
+    orjson = None
+    _json_loads = json.loads
+
 
 # ---------------- pygame init (lazy) ----------------
 _pygame_available = False
@@ -48,15 +74,30 @@ def _init_pygame_mixer() -> bool:
     except Exception:
         return False
 
-def play_with_pygame(path: str) -> bool:
+_PLAYBACK_END = (pygame.USEREVENT + 1) if _pygame_available else None
+
+def _wait_pygame_music() -> None:
+    """Bloqueia até a música terminar, acordando pelo endevent do mixer (sem polling)."""
+    try:
+        while pygame.mixer.music.get_busy():
+            # timeout só como salvaguarda caso o evento se perca
+            ev = pygame.event.wait(1000)
+            if ev.type == _PLAYBACK_END:
+                break
+    except pygame.error:
+        # subsistema de eventos indisponível (sem display): volta ao polling
+        while pygame.mixer.music.get_busy():
+            time.sleep(0.05)
+
+def _play_pygame_music(source, namehint: str = "") -> bool:
     try:
         if not _init_pygame_mixer():
             return False
-        # pygame.music lida bem com wav/ogg; blocking é feito com busy loop
-        pygame.mixer.music.load(path)
+        # pygame.music lida bem com wav/ogg; o fim é sinalizado por endevent
+        pygame.mixer.music.set_endevent(_PLAYBACK_END)
+        pygame.mixer.music.load(source, namehint)
         pygame.mixer.music.play()
-        while pygame.mixer.music.get_busy():
-            time.sleep(0.05)
+        _wait_pygame_music()
         try:
             # tenta descarregar se suportado
             pygame.mixer.music.unload()
@@ -66,17 +107,29 @@ def play_with_pygame(path: str) -> bool:
     except Exception:
         return False
 
+def play_with_pygame(path: str) -> bool:
+    return _play_pygame_music(path)
+
+def play_with_pygame_stream(stream: io.BytesIO, filename: str) -> bool:
+    """Toca áudio direto da memória (sem passar pelo disco); filename só dá a extensão."""
+    return _play_pygame_music(stream, os.path.splitext(filename)[1].lstrip("."))
+
+# players do sistema resolvidos uma vez (shutil.which percorre o PATH a cada chamada)
+_APLAY = shutil.which("aplay")
+_MPV = shutil.which("mpv")
+
 def play_with_command(path: str) -> bool:
     """Fallback para players do sistema (aplay/mpv)."""
-    if shutil.which("aplay"):
+    quiet = {"stdin": subprocess.DEVNULL, "stdout": subprocess.DEVNULL, "stderr": subprocess.DEVNULL}
+    if _APLAY:
         try:
-            subprocess.run(["aplay", path], check=True)
+            subprocess.run([_APLAY, path], check=True, **quiet)
             return True
         except Exception:
             pass
-    if shutil.which("mpv"):
+    if _MPV:
         try:
-            subprocess.run(["mpv", "--no-video", "--really-quiet", path], check=True)
+            subprocess.run([_MPV, "--no-video", "--really-quiet", path], check=True, **quiet)
             return True
         except Exception:
             pass
@@ -112,21 +165,37 @@ def atomic_write_and_replace(final_path: str, data: bytes) -> bool:
         return False
 
 # ---------------- leitura de linha (header) + resto ----------------
-def recv_line_and_rest(sock: socket.socket, timeout: float = 5.0) -> Tuple[Optional[str], bytes]:
-    """Lê até a primeira newline (\n) e retorna (linha_decodificada, rest_bytes)."""
+def recv_line_and_rest(sock: socket.socket, timeout: float = 5.0,
+                       rx_mv: Optional[memoryview] = None,
+                       pending: bytes = b"") -> Tuple[Optional[bytes], bytes]:
+    """
+    Lê até a primeira newline (\n) e retorna (linha, rest_bytes), ambos em bytes:
+    o parser JSON aceita bytes, então não há decode intermediário para str.
+    rx_mv: buffer de recepção reutilizável (recv_into); se None, aloca um local.
+    pending: bytes que sobraram da leitura anterior; se já contêm uma linha
+    completa, ela é devolvida sem nenhum recv. No timeout o parcial volta em rest.
+    """
+    data = bytearray(pending)
+    idx = data.find(b"\n")
+    if idx >= 0:
+        return bytes(data[:idx]), bytes(data[idx + 1:])
+    if rx_mv is None:
+        rx_mv = memoryview(bytearray(4096))
     sock.settimeout(timeout)
-    data = b""
+    scan_start = len(data)  # só procura newline nos bytes ainda não examinados
     try:
         while True:
-            chunk = sock.recv(4096)
-            if not chunk:
+            n = sock.recv_into(rx_mv)
+            if not n:
                 break
-            data += chunk
-            if b"\n" in data:
-                line, rest = data.split(b"\n", 1)
-                return line.decode("utf-8", errors="ignore"), rest
+            data += rx_mv[:n]
+            idx = data.find(b"\n", scan_start)
+            if idx < 0:
+                scan_start = len(data)
+                continue
+            return bytes(data[:idx]), bytes(data[idx + 1:])
     except socket.timeout:
-        return None, b""
+        return None, bytes(data)
     except Exception:
         return None, b""
     finally:
@@ -135,115 +204,251 @@ def recv_line_and_rest(sock: socket.socket, timeout: float = 5.0) -> Tuple[Optio
         except Exception:
             pass
     if data:
-        try:
-            return data.decode("utf-8", errors="ignore"), b""
-        except Exception:
-            return None, data
+        return bytes(data), b""
     return None, b""
 
 # ---------------- threads: receiver + playback ----------------
+class AudioRing:
+    """
+    Fila circular limitada do pipeline de áudio (consumidor único: playback_worker).
+    O consumidor não toma lock; os produtores (receiver, decoder base64 e o
+    sentinel de parada) se serializam num lock curto. Events só acordam quem
+    está esperando por fila vazia/cheia.
+    """
+    def __init__(self, capacity: int = 16):
+        self._slots = [None] * capacity
+        self._cap = capacity
+        self._head = 0  # escrito só pelo consumidor
+        self._tail = 0  # escrito só pelos produtores (sob _put_lock)
+        self._put_lock = threading.Lock()
+        self._not_empty = threading.Event()
+        self._not_full = threading.Event()
+        self._not_full.set()
+
+    def put(self, item) -> None:
+        with self._put_lock:
+            while self._tail - self._head >= self._cap:
+                self._not_full.clear()
+                # rechecagem após o clear evita perder o set() do consumidor
+                if self._tail - self._head >= self._cap:
+                    self._not_full.wait()
+            self._slots[self._tail % self._cap] = item
+            self._tail += 1
+            self._not_empty.set()
+
+    def get(self):
+        while self._head == self._tail:
+            self._not_empty.clear()
+            if self._head != self._tail:
+                break
+            self._not_empty.wait()
+        i = self._head % self._cap
+        item = self._slots[i]
+        self._slots[i] = None
+        self._head += 1
+        self._not_full.set()
+        return item
+
 playing_event: Optional[threading.Event] = None  # criado no main e usado pelo GUI
 
-def playback_worker(audio_q: "queue.Queue[Tuple[bytes,str]]", audio_dir: str, stop_event: threading.Event) -> None:
+def playback_worker(audio_q: AudioRing, audio_dir: str, stop_event: threading.Event) -> None:
     """
-    Consome áudios da fila e toca um a um. Remove arquivos após reprodução.
-    Cada item da fila: (audio_bytes, filename)
+    Consome áudios da fila e toca um a um, direto da memória quando há pygame.
+    Arquivos só são gravados para players externos e removidos após reprodução.
+    Cada item da fila: (audio_bytes, filename), com audio_bytes bytes, bytearray ou um
+    arquivo aberto (memória compartilhada, fechado após tocar); audio_bytes None indica
+    que filename é um arquivo já gravado pelo receiver.
+    None encerra o worker.
     """
     while not stop_event.is_set():
-        try:
-            item = audio_q.get(timeout=0.5)
-        except queue.Empty:
-            continue
+        item = audio_q.get()
         if item is None:
             break
         audio_bytes, filename = item
-        filepath = os.path.join(audio_dir, filename or "recv_audio.wav")
-        ok = atomic_write_and_replace(filepath, audio_bytes)
-        if not ok:
-            print("[player] falha ao salvar áudio.")
-            continue
+        filename = filename or "recv_audio.wav"
 
         # sinaliza GUI que estamos reproduzindo
         if playing_event:
             playing_event.set()
 
+        filepath = None
         try:
-            played = False
-            if play_with_pygame(filepath):
-                played = True
+            if audio_bytes is None:
+                # receiver já gravou direto do socket (sem pygame)
+                filepath = filename
+                played = play_with_command(filepath)
             else:
-                if play_with_command(filepath):
-                    played = True
+                # toca da memória; o disco só é usado pelo fallback de players externos
+                stream = audio_bytes if hasattr(audio_bytes, "read") else io.BytesIO(audio_bytes)
+                played = play_with_pygame_stream(stream, filename)
+            if not played and audio_bytes is not None:
+                if hasattr(audio_bytes, "read"):
+                    audio_bytes.seek(0)
+                    audio_bytes = audio_bytes.read()
+                filepath = os.path.join(audio_dir, filename)
+                if not atomic_write_and_replace(filepath, audio_bytes):
+                    print("[player] falha ao salvar áudio.")
+                    continue
+                played = play_with_command(filepath)
 
             if not played:
                 print("[player] nenhum player disponível para reproduzir o áudio.")
         finally:
             # limpa evento e arquivo
+            if hasattr(item[0], "close"):
+                item[0].close()
             if playing_event:
                 try:
                     playing_event.clear()
                 except Exception:
                     pass
             try:
-                if os.path.exists(filepath):
+                if filepath and os.path.exists(filepath):
                     os.remove(filepath)
             except Exception:
                 pass
 
-def receiver_loop(sock: socket.socket, audio_q: "queue.Queue[Tuple[bytes,str]]", stop_event: threading.Event) -> None:
+# header de áudio base64 inline (legado): reconhecido nos bytes, sem parsear a linha
+_RE_AUDIO_INLINE = re.compile(rb'"type"\s*:\s*"audio"')
+INLINE_MIN = 1024  # headers normais são bem menores; só linhas grandes são candidatas
+
+def _decode_inline_audio(audio_q: AudioRing, linha: bytes) -> None:
+    """Parse do JSON e decode do base64 de um áudio inline (formato legado), fora da thread de recepção."""
+    try:
+        hdr = _json_loads(linha)
+        audio_q.put((base64.b64decode(hdr["content"]), hdr.get("filename") or "recv_audio.wav"))
+    except Exception as e:
+        print("[receiver] áudio base64 inválido:", e)
+
+def _abrir_audio_compartilhado(name: str):
+    """
+    Abre o segmento de áudio que o servidor local deixou em SHM_DIR e já o tira do
+    diretório: os dados seguem acessíveis pelo arquivo aberto e a memória é liberada
+    quando ele é fechado (inclusive se o cliente cair). Retorna o arquivo ou None.
+    """
+    if not name or os.path.basename(name) != name or name.startswith("."):
+        return None
+    path = os.path.join(SHM_DIR, name)
+    try:
+        f = open(path, "rb")
+    except OSError as e:
+        print("[receiver] memória compartilhada indisponível:", e)
+        return None
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+    return f
+
+def _write_all(fd: int, data) -> None:
+    with memoryview(data) as mv:
+        while mv:
+            n = os.write(fd, mv)
+            mv = mv[n:]
+
+def recv_audio_to_file(sock: socket.socket, rest: bytes, size: int, audio_dir: str,
+                       filename: str, rx_mv: memoryview) -> Optional[str]:
+    """
+    Grava o corpo de áudio direto do socket num arquivo único em audio_dir
+    (recv_into + os.write), sem montar o áudio inteiro em bytes. Retorna o caminho.
+    """
+    safe_mkdir(audio_dir)
+    suffix = os.path.splitext(filename)[1] or ".wav"
+    fd, path = tempfile.mkstemp(prefix="recv_", suffix=suffix, dir=audio_dir)
+    try:
+        off = min(len(rest), size)
+        _write_all(fd, rest[:off])
+        while off < size:
+            n = sock.recv_into(rx_mv[:min(size - off, BUFFER)])
+            if not n:
+                break
+            _write_all(fd, rx_mv[:n])
+            off += n
+    except Exception:
+        os.close(fd)
+        try:
+            os.remove(path)
+        except Exception:
+            pass
+        raise
+    os.close(fd)
+    return path
+
+def receiver_loop(sock: socket.socket, audio_q: AudioRing, stop_event: threading.Event,
+                  audio_dir: Optional[str] = None) -> None:
     """
     Lê continuamente mensagens do servidor.
     Aceita:
       - uma linha JSON com header {"type":"audio","size":N}
         seguido por N bytes de áudio
-      - uma linha JSON com {"type":"audio","content":"<base64>"} (inline)
+      - uma linha JSON com {"type":"audio","shm":"<nome>","size":N}
+        (servidor na mesma máquina, só após o hello com "shm"; áudio em SHM_DIR/<nome>)
+      - uma linha JSON com {"type":"audio","content":"<base64>"} (inline, legado)
       - {"type":"text","content":"..."}
+    Com audio_dir e sem pygame, o áudio vai do socket direto para arquivo
+    (o player externo precisaria dele em disco de qualquer forma).
     """
+    decoder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="b64")
+    # buffer de recepção único, reaproveitado por todos os recv_into deste socket
+    rx_buf = bytearray(BUFFER)
+    rx_mv = memoryview(rx_buf)
+    # bytes lidos além da mensagem atual (vários frames pequenos num só recv)
+    pending = b""
     sock.settimeout(RECV_TIMEOUT)
     while not stop_event.is_set():
         try:
-            header_line, rest = recv_line_and_rest(sock, timeout=RECV_TIMEOUT)
+            header_line, rest = recv_line_and_rest(sock, timeout=RECV_TIMEOUT, rx_mv=rx_mv, pending=pending)
+            pending = rest
             if not header_line:
                 continue
-            # tenta carregar JSON do header_line
+            # o header sempre termina em newline; checagem barata de formato antes do
+            # parse, para lixo não custar um raise/except a cada linha
+            header_line = header_line.strip()
+            if not (header_line[:1] == b"{" and header_line[-1:] == b"}" and b'"type"' in header_line):
+                continue
+            if len(header_line) > INLINE_MIN and _RE_AUDIO_INLINE.search(header_line):
+                # legado: áudio base64 dentro do JSON; nem o parse da linha (centenas de KB)
+                # nem o decode rodam na thread de recepção
+                decoder.submit(_decode_inline_audio, audio_q, header_line)
+                continue
             try:
-                hdr = json.loads(header_line)
-            except Exception:
-                # tenta juntar rest e decodificar (caso JSON tenha vindo tudo junto)
-                try:
-                    combined = header_line
-                    if rest:
-                        combined = header_line + rest.decode("utf-8", errors="ignore")
-                    js = json.loads(combined)
-                    if isinstance(js, dict):
-                        if js.get("type") == "audio" and js.get("content"):
-                            audio_bytes = base64.b64decode(js.get("content"))
-                            audio_q.put((audio_bytes, js.get("filename") or "recv_audio.wav"))
-                            continue
-                        if js.get("type") == "text":
-                            print("Assistente:", js.get("content", ""))
-                            continue
-                except Exception:
-                    continue
+                hdr = _json_loads(header_line)
+            except ValueError:
                 continue
 
             tipo = hdr.get("type")
-            if tipo == "audio" and "size" in hdr:
+            if tipo == "audio" and hdr.get("shm"):
+                # o arquivo aberto vai direto para o player: nenhuma cópia do áudio no cliente
+                audio_f = _abrir_audio_compartilhado(hdr["shm"])
+                if audio_f is not None:
+                    audio_q.put((audio_f, hdr.get("filename") or "recv_audio.wav"))
+                continue
+            elif tipo == "audio" and "size" in hdr:
                 size = int(hdr.get("size", 0))
-                audio_bytes = b""
-                if rest:
-                    audio_bytes += rest
-                while len(audio_bytes) < size:
-                    chunk = sock.recv(BUFFER)
-                    if not chunk:
-                        break
-                    audio_bytes += chunk
-                audio_bytes = audio_bytes[:size]
-                audio_q.put((audio_bytes, hdr.get("filename") or "recv_audio.wav"))
+                if audio_dir and not _pygame_available:
+                    path = recv_audio_to_file(sock, rest, size, audio_dir,
+                                              hdr.get("filename") or "recv_audio.wav", rx_mv)
+                    pending = rest[size:]
+                    audio_q.put((None, path))
+                    continue
+                # buffer do tamanho exato, preenchido in-place pelo recv_into
+                audio_buf = bytearray(size)
+                off = min(len(rest), size)
+                audio_buf[:off] = rest[:off]
+                pending = rest[size:]
+                with memoryview(audio_buf) as audio_mv:
+                    while off < size:
+                        n = sock.recv_into(audio_mv[off:])
+                        if not n:
+                            break
+                        off += n
+                if off < size:
+                    del audio_buf[off:]  # conexão caiu no meio: entrega o que chegou
+                audio_q.put((audio_buf, hdr.get("filename") or "recv_audio.wav"))
                 continue
             elif tipo == "audio" and hdr.get("content"):
-                audio_bytes = base64.b64decode(hdr.get("content"))
-                audio_q.put((audio_bytes, hdr.get("filename") or "recv_audio.wav"))
+                # áudio inline minúsculo (abaixo de INLINE_MIN): já parseado, só o decode sai daqui
+                decoder.submit(_decode_inline_audio, audio_q, header_line)
                 continue
             elif tipo == "cmd":
                 action = hdr.get("action")
@@ -255,13 +460,11 @@ def receiver_loop(sock: socket.socket, audio_q: "queue.Queue[Tuple[bytes,str]]",
                         try:
                             subprocess.Popen(["mgba", rom_path], start_new_session=True)
                             msg = {"type": "text", "content": f"Iniciando '{game}' via mGBA."}
-                            sock.sendall((json.dumps(msg) + "\n").encode("utf-8"))
                         except Exception as e:
-                            err = {"type": "text", "content": f"Erro ao iniciar mGBA: {e}"}
-                            sock.sendall((json.dumps(err) + "\n").encode("utf-8"))
+                            msg = {"type": "text", "content": f"Erro ao iniciar mGBA: {e}"}
                     else:
                         msg = {"type": "text", "content": "Comando inválido ou ROM não especificada."}
-                        sock.sendall((json.dumps(msg) + "\n").encode("utf-8"))
+                    send_frame(sock, (json.dumps(msg) + "\n").encode("utf-8"))
                     continue
                 else:
                     # ações futuras
@@ -278,35 +481,86 @@ def receiver_loop(sock: socket.socket, audio_q: "queue.Queue[Tuple[bytes,str]]",
         except Exception as e:
             print("[receiver] erro:", e)
             break
+    decoder.shutdown(wait=False)
 
 # ---------------- cliente (rede) ----------------
+def configure_socket(s: socket.socket) -> None:
+    """
+    Buffers grandes para absorver rajadas de áudio e keepalive para detectar
+    conexão morta. Chamado antes do connect (o RCVBUF define a janela TCP).
+    """
+    try:
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCK_RCVBUF)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCK_SNDBUF)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        # timers de keepalive só existem em alguns SOs (Linux)
+        if hasattr(socket, "TCP_KEEPIDLE"):
+            s.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 30)
+        if hasattr(socket, "TCP_KEEPINTVL"):
+            s.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 10)
+        if hasattr(socket, "TCP_KEEPCNT"):
+            s.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3)
+    except OSError as e:
+        print("[client] aviso: não foi possível ajustar o socket:", e)
+
+def tty_input_loop(q: "queue.Queue[Optional[str]]") -> bool:
+    """
+    Lê linhas de /dev/tty (aberto uma vez) com selectors + os.read e enfileira cada uma.
+    Retorna False se não houver tty; EOF (Ctrl+D) enfileira None e encerra.
+    """
+    try:
+        fd = os.open("/dev/tty", os.O_RDONLY | os.O_NONBLOCK)
+    except OSError:
+        return False
+    sel = selectors.DefaultSelector()
+    sel.register(fd, selectors.EVENT_READ)
+    buf = bytearray()
+    try:
+        while True:
+            for key, _ in sel.select():
+                try:
+                    chunk = os.read(key.fd, 4096)
+                except BlockingIOError:
+                    continue
+                if not chunk:
+                    print("\nEncerrando cliente (input).")
+                    q.put(None)
+                    return True
+                buf += chunk
+                idx = buf.find(b"\n")
+                while idx >= 0:
+                    msg = bytes(buf[:idx]).decode("utf-8", errors="ignore").strip()
+                    del buf[:idx + 1]
+                    if msg:
+                        q.put(msg)
+                    idx = buf.find(b"\n")
+    finally:
+        sel.close()
+        os.close(fd)
+
 def run_client(args, send_q=None) -> None:
+    binary_proto = getattr(args, "binary_proto", False)
     safe_mkdir(args.audio_dir)
-    audio_q: "queue.Queue[Tuple[bytes,str]]" = queue.Queue()
+    audio_q = AudioRing()
     stop_event = threading.Event()
 
     if send_q is None:
         send_q: "queue.Queue[Optional[str]]" = queue.Queue()
 
         def input_thread(q: "queue.Queue[Optional[str]]"):
+            # tenta ler do /dev/tty (caso você rode via systemd ou ssh sem tty)
+            if tty_input_loop(q):
+                return
+            # fallback para input() quando /dev/tty não existir
             while True:
                 try:
-                    # tenta ler do /dev/tty (caso você rode via systemd ou ssh sem tty)
-                    with open('/dev/tty', 'r') as tty:
-                        for line in tty:
-                            msg = line.strip()
-                            if msg:
-                                q.put(msg)
-                except Exception:
-                    # fallback para input() quando /dev/tty não existir
-                    try:
-                        msg = input("Você: ").strip()
-                        if msg:
-                            q.put(msg)
-                    except (EOFError, KeyboardInterrupt):
-                        print("\nEncerrando cliente (input).")
-                        q.put(None)
-                        return
+                    msg = input("Você: ").strip()
+                    if msg:
+                        q.put(msg)
+                except (EOFError, KeyboardInterrupt):
+                    print("\nEncerrando cliente (input).")
+                    q.put(None)
+                    return
         threading.Thread(target=input_thread, args=(send_q,), daemon=True).start()
 
     else:
@@ -324,22 +578,29 @@ def run_client(args, send_q=None) -> None:
 
         threading.Thread(target=input_thread, args=(send_q,), daemon=True).start()
 
+    # um único worker de playback, bloqueado na fila até chegar áudio ou o sentinel None
+    play_stop = threading.Event()
+    threading.Thread(target=playback_worker, args=(audio_q, args.audio_dir, play_stop), daemon=True).start()
+
     while True:
         try:
             print(f"Tentando conectar em {args.server}:{args.port} ...")
             with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+                configure_socket(s)
                 s.settimeout(5.0)
                 s.connect((args.server, args.port))
                 s.settimeout(None)
+                # mensagens curtas e interativas: sem esperar o algoritmo de Nagle
+                s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
                 print("Conectado ao servidor! Digite suas mensagens. Ctrl+C para sair.")
+                if getattr(args, "shm", False) and os.path.isdir(SHM_DIR):
+                    # o servidor só usa memória compartilhada com quem anunciar suporte
+                    send_frame(s, HELLO_SHM)
 
-                # iniciar receiver + playback threads
+                # iniciar receiver (o playback sobrevive às reconexões)
                 recv_stop = threading.Event()
-                play_stop = threading.Event()
-                recv_thread = threading.Thread(target=receiver_loop, args=(s, audio_q, recv_stop), daemon=True)
-                play_thread = threading.Thread(target=playback_worker, args=(audio_q, args.audio_dir, play_stop), daemon=True)
+                recv_thread = threading.Thread(target=receiver_loop, args=(s, audio_q, recv_stop, args.audio_dir), daemon=True)
                 recv_thread.start()
-                play_thread.start()
 
                 # loop principal apenas envia mensagens (recebimento é assíncrono)
                 while True:
@@ -349,6 +610,7 @@ def run_client(args, send_q=None) -> None:
                             # sinaliza parada para threads e fecha socket
                             recv_stop.set()
                             play_stop.set()
+                            audio_q.put(None)
                             try:
                                 s.shutdown(socket.SHUT_RDWR)
                             except Exception:
@@ -357,7 +619,11 @@ def run_client(args, send_q=None) -> None:
                             return
                         if not msg:
                             continue
-                        s.sendall((msg + "\n").encode("utf-8"))
+                        if binary_proto:
+                            payload = msg.encode("utf-8")
+                            send_frame(s, cabecalho_frame(KIND_TEXT, payload), payload)
+                        else:
+                            send_frame(s, (msg + "\n").encode("utf-8"))
                     except (BrokenPipeError, ConnectionResetError) as e:
                         print("[client] conexão perdida:", e)
                         break
@@ -368,25 +634,29 @@ def run_client(args, send_q=None) -> None:
                 # final do while-> tentar reconectar
         except KeyboardInterrupt:
             print("\nCliente finalizado pelo usuário.")
+            audio_q.put(None)
             return
         except Exception as e:
             print(f"Conexão falhou: {e}. Tentando novamente em 5s...")
             time.sleep(5)
 
 # ---------------- GUI/rostinho ----------------
-try:
-    import tkinter as tk
-    TK_AVAILABLE = True
-except Exception:
-    tk = None
-    TK_AVAILABLE = False
-
+# tkinter já foi importado no topo do módulo (TK_AVAILABLE)
 try:
     from PIL import Image, ImageSequence, ImageTk
     PIL_AVAILABLE = True
 except Exception:
     PIL_AVAILABLE = False
 
+# frames de GIF já redimensionados ficam num atlas PNG para não refazer o resize a cada boot
+GIF_CACHE_DIR = os.path.expanduser(os.getenv("CHATBOT_CACHE_DIR", "~/.cache/chatbot"))
+IDLE_FRAME_MS = 250   # idle (piscar) não precisa de mais que 4 FPS
+SPEEK_FRAME_MS = 100  # usado quando o GIF de fala não informa a duração dos frames
+
+def _duracao_frame(frame) -> int:
+    """Duração (ms) de um frame de GIF; SPEEK_FRAME_MS quando o GIF não informa."""
+    return max(20, int(frame.info.get("duration") or SPEEK_FRAME_MS))
+
 class FaceAnimator:
     def __init__(self, playing_event: threading.Event, gif_idle="IDLE.gif", gif_speek="speek.gif", size=(480, 320), send_q=None):
         self.playing_event = playing_event
@@ -399,7 +669,10 @@ class FaceAnimator:
         self.frames_idle = []
         self.frames_speek = []
         self.current_frames = []
+        self.delays_speek = []  # duração (ms) de cada frame do GIF falando
+        self.current_delays = []
         self.frame_index = 0
+        self._last_idx = -1  # último frame desenhado (evita label.config repetido)
         self.mode = None  # 'idle' | 'speek'
         self.headless = not TK_AVAILABLE
 
@@ -424,34 +697,116 @@ class FaceAnimator:
                 break
         return frames
 
+    def _gif_cache_paths(self, caminho: str) -> Optional[Tuple[str, str]]:
+        """Caminhos (png, json) do atlas em cache para este GIF/tamanho/mtime."""
+        try:
+            mtime = os.path.getmtime(caminho)
+        except Exception:
+            return None
+        w, h = self.size
+        key = hashlib.blake2b(f"{os.path.abspath(caminho)}:{mtime}:{w}x{h}".encode("utf-8"), digest_size=8).hexdigest()
+        base = os.path.join(GIF_CACHE_DIR, key)
+        return base + ".png", base + ".json"
+
+    def _carregar_atlas(self, png_path: str, meta_path: str):
+        """Recorta os frames já redimensionados do atlas em cache (sem LANCZOS)."""
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        w, h = meta["cell"]
+        atlas = Image.open(png_path)
+        atlas.load()
+        return [ImageTk.PhotoImage(atlas.crop((i * w, 0, (i + 1) * w, h))) for i in range(meta["frames"])]
+
+    def _salvar_atlas(self, png_path: str, meta_path: str, frames_rgba, delays) -> None:
+        """Grava os frames redimensionados lado a lado num único PNG + metadados (inclui a duração dos frames)."""
+        w, h = self.size
+        atlas = Image.new("RGBA", (w * len(frames_rgba), h), (0, 0, 0, 0))
+        for i, fr in enumerate(frames_rgba):
+            atlas.paste(fr, (i * w, 0))
+        safe_mkdir(GIF_CACHE_DIR)
+        atlas.save(png_path, format="PNG")
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump({"frames": len(frames_rgba), "cell": [w, h], "delays": delays}, f)
+
     def carregar_gif_with_pil(self, caminho: str):
         frames = []
         if not PIL_AVAILABLE:
             return frames
+        cache = self._gif_cache_paths(caminho) if self.size else None
+        if cache and os.path.exists(cache[0]) and os.path.exists(cache[1]):
+            try:
+                return self._carregar_atlas(*cache)
+            except Exception:
+                pass  # cache corrompido: refaz a partir do GIF
         try:
             img = Image.open(caminho)
+            frames_rgba = []
+            delays = []
+            if self.size:
+                # geometria é a mesma para todos os frames: calcula uma vez
+                orig_w, orig_h = img.size
+                target_w, target_h = self.size
+                scale = min(target_w / orig_w, target_h / orig_h)
+                new_w = max(1, int(orig_w * scale))
+                new_h = max(1, int(orig_h * scale))
+                paste_pos = ((target_w - new_w) // 2, (target_h - new_h) // 2)
+                blank = Image.new("RGBA", (target_w, target_h), (0, 0, 0, 0))
             for frame in ImageSequence.Iterator(img):
+                delays.append(_duracao_frame(frame))
                 frame = frame.convert("RGBA")
                 if self.size:
                     # redimensiona preservando proporção e centraliza em background transparente
-                    orig_w, orig_h = frame.size
-                    target_w, target_h = self.size
-                    scale = min(target_w / orig_w, target_h / orig_h)
-                    new_w = max(1, int(orig_w * scale))
-                    new_h = max(1, int(orig_h * scale))
                     resized = frame.resize((new_w, new_h), Image.LANCZOS)
-                    bg = Image.new("RGBA", (target_w, target_h), (0, 0, 0, 0))
-                    paste_x = (target_w - new_w) // 2
-                    paste_y = (target_h - new_h) // 2
-                    bg.paste(resized, (paste_x, paste_y), resized)
+                    bg = blank.copy()
+                    bg.paste(resized, paste_pos, resized)
+                    frames_rgba.append(bg)
                     tkimg = ImageTk.PhotoImage(bg)
                 else:
                     tkimg = ImageTk.PhotoImage(frame)
                 frames.append(tkimg)
+            if cache and frames_rgba:
+                try:
+                    self._salvar_atlas(cache[0], cache[1], frames_rgba, delays)
+                except Exception:
+                    pass
         except Exception:
             pass
         return frames
 
+    def _gif_delays(self, caminho: str):
+        """
+        Duração nativa (ms) de cada frame do GIF. Vem dos metadados do atlas em cache quando
+        existem; senão decodifica o GIF uma vez e guarda as durações no mesmo .json.
+        """
+        delays = []
+        if not PIL_AVAILABLE:
+            return delays
+        cache = self._gif_cache_paths(caminho) if self.size else None
+        meta = {}
+        if cache and os.path.exists(cache[1]):
+            try:
+                with open(cache[1], "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+                if meta.get("delays"):
+                    return meta["delays"]
+            except Exception:
+                meta = {}
+        try:
+            img = Image.open(caminho)
+            for frame in ImageSequence.Iterator(img):
+                delays.append(_duracao_frame(frame))
+        except Exception:
+            pass
+        if cache and delays:
+            try:
+                safe_mkdir(GIF_CACHE_DIR)
+                meta["delays"] = delays
+                with open(cache[1], "w", encoding="utf-8") as f:
+                    json.dump(meta, f)
+            except Exception:
+                pass
+        return delays
+
     def load_gifs(self):
         idle_path = self._resource_path(self.gif_idle)
         speek_path = self._resource_path(self.gif_speek)
@@ -463,6 +818,8 @@ class FaceAnimator:
         elif PIL_AVAILABLE:
             self.frames_idle = self.carregar_gif_with_pil(idle_path)
             self.frames_speek = self.carregar_gif_with_pil(speek_path)
+        # depois dos frames: o atlas recém-gravado já traz as durações
+        self.delays_speek = self._gif_delays(speek_path)
 
     def setup(self):
         if not TK_AVAILABLE:
@@ -618,29 +975,47 @@ class FaceAnimator:
             return
         self.mode = mode
         self.frame_index = 0
+        self._last_idx = -1
         if mode == "idle":
             self.current_frames = self.frames_idle or self.frames_speek
         else:
             self.current_frames = self.frames_speek or self.frames_idle
+        # ritmo nativo do GIF só quando os frames exibidos são mesmo os de fala
+        if self.current_frames is self.frames_speek and len(self.delays_speek) == len(self.frames_speek):
+            self.current_delays = self.delays_speek
+        else:
+            self.current_delays = []
 
     def _update(self):
-        if not self.root or not self.label:
+        # atributos quentes em locais: este método roda a cada frame
+        root = self.root
+        label = self.label
+        if not root or not label:
             return
+        playing_event = self.playing_event
         try:
-            is_playing = bool(self.playing_event and self.playing_event.is_set())
+            is_playing = bool(playing_event and playing_event.is_set())
         except Exception:
             is_playing = False
 
         self._set_mode("speek" if is_playing else "idle")
-        if self.current_frames:
-            idx = self.frame_index % len(self.current_frames)
-            try:
-                self.label.config(image=self.current_frames[idx])
-            except Exception:
-                pass
+        delay_ms = IDLE_FRAME_MS if self.mode == "idle" else SPEEK_FRAME_MS
+        frames = self.current_frames
+        if frames:
+            idx = self.frame_index % len(frames)
+            # só redesenha quando o frame muda (GIF de 1 frame não gera tráfego)
+            if idx != self._last_idx:
+                try:
+                    label.config(image=frames[idx])
+                    self._last_idx = idx
+                except Exception:
+                    pass
+            delays = self.current_delays
+            if delays:
+                delay_ms = delays[idx]
             self.frame_index += 1
         try:
-            self.root.after(100, self._update)
+            root.after(delay_ms, self._update)
         except Exception:
             pass
 
@@ -676,33 +1051,39 @@ class FaceAnimator:
             pass
 
 # ---------------- small webserver to accept messages (useful when headless) ----------------
+# Página simples com um formulário (constante: codificada uma única vez)
+_INDEX_HTML_BYTES = ("<html><head><meta charset='utf-8'><title>Enviar Mensagem</title></head>"
+                     "<body><h2>Enviar mensagem ao servidor</h2>"
+                     "<form method='POST' action='/send'>"
+                     "<input type='text' name='msg' style='width:80%' placeholder='Digite a mensagem'/>"
+                     "<input type='submit' value='Enviar'/>"
+                     "</form>"
+                     "<p>Feche o navegador quando terminar.</p>"
+                     "</body></html>").encode("utf-8")
+
 class _SimpleSendHandler(http.server.BaseHTTPRequestHandler):
     send_q_ref: Optional[queue.Queue] = None
+    # keep-alive: toda resposta precisa de Content-Length
+    protocol_version = "HTTP/1.1"
+
+    def _not_found(self):
+        self.send_response(404)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
 
     def do_GET(self):
         if self.path.startswith('/static'):
-            self.send_response(404)
-            self.end_headers()
+            self._not_found()
             return
-        # Página simples com um formulário
-        html = ("<html><head><meta charset='utf-8'><title>Enviar Mensagem</title></head>"
-                "<body><h2>Enviar mensagem ao servidor</h2>"
-                "<form method='POST' action='/send'>"
-                "<input type='text' name='msg' style='width:80%%' placeholder='Digite a mensagem'/>"
-                "<input type='submit' value='Enviar'/>"
-                "</form>"
-                "<p>Feche o navegador quando terminar.</p>"
-                "</body></html>")
         self.send_response(200)
         self.send_header('Content-Type', 'text/html; charset=utf-8')
-        self.send_header('Content-Length', str(len(html.encode('utf-8'))))
+        self.send_header('Content-Length', str(len(_INDEX_HTML_BYTES)))
         self.end_headers()
-        self.wfile.write(html.encode('utf-8'))
+        self.wfile.write(_INDEX_HTML_BYTES)
 
     def do_POST(self):
         if self.path != '/send':
-            self.send_response(404)
-            self.end_headers()
+            self._not_found()
             return
         length = int(self.headers.get('Content-Length', '0'))
         data = self.rfile.read(length)
@@ -718,10 +1099,12 @@ class _SimpleSendHandler(http.server.BaseHTTPRequestHandler):
                 response = "ERRO"
         else:
             response = "VAZIO"
+        body = response.encode('utf-8')
         self.send_response(200)
         self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
         self.end_headers()
-        self.wfile.write(response.encode('utf-8'))
+        self.wfile.write(body)
 
 def start_web_server(send_q: queue.Queue, host='0.0.0.0', port=8080):
     _SimpleSendHandler.send_q_ref = send_q
@@ -740,6 +1123,8 @@ def main():
     parser.add_argument("--gif-idle", default="IDLE.gif", help="GIF idle (piscar)")
     parser.add_argument("--gif-speek", default="speek.gif", help="GIF falando")
     parser.add_argument("--no-web", action='store_true', help="Não iniciar webserver automático quando headless")
+    parser.add_argument("--shm", action='store_true', help="Com servidor na mesma máquina, recebe o áudio por memória compartilhada (/dev/shm)")
+    parser.add_argument("--binary-proto", action='store_true', help="Envia mensagens com header binário (tipo, tamanho) em vez de texto+newline")
     args = parser.parse_args()
 
     args.audio_dir = os.path.expanduser(args.audio_dir)
@@ -2,15 +2,50 @@
 from __future__ import annotations
 
 import os
+import re
+import sys
+import json
+import hashlib
 import logging
+import threading
+import weakref
+from collections import OrderedDict
 from contextlib import contextmanager
-from typing import Optional, List, Tuple, Any
+from datetime import datetime, timedelta
+from typing import Optional, Dict, List, Tuple, Any
 
+import numpy as np
 import mysql.connector
-from mysql.connector import pooling, Error
+from mysql.connector import pooling, Error, PoolError
 
 from config import BANCO_SQL  # path para banco.sql (data/)
 from normalizacao import normalizar
+import embedding_store
+from embedding_store import quantizar_i8
+
+# orjson é opcional: parse/serialização do JSON de embeddings mais rápido
+try:
+    import orjson
+    _json_loads = orjson.loads
+except Exception:
+    orjson = None
+    _json_loads = json.loads
+
+
+def embedding_para_json(embedding) -> str:
+    """Embedding (lista ou ndarray) como texto JSON para as colunas embedding/embedding_resposta."""
+    if orjson is not None:
+        return orjson.dumps(embedding, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+    return json.dumps(embedding if isinstance(embedding, list) else np.asarray(embedding).tolist(), ensure_ascii=False)
+
+# simsimd é opcional: com PIPELINE_INT8=1 a matriz de respostas ganha uma cópia int8
+# (1/4 da memória) pontuada por simsimd.cdist(metric="cosine"), que usa VNNI/dot-product
+# de int8 quando a CPU tem. Sem simsimd o flag é ignorado (ver buscar_resposta_por_pergunta_embedding).
+try:
+    import simsimd
+except Exception:
+    simsimd = None
+PIPELINE_INT8 = os.getenv("PIPELINE_INT8", "0") == "1" and simsimd is not None
 
 logger = logging.getLogger("core.banco")
 if not logger.handlers:
@@ -45,6 +80,19 @@ except Exception as e:
     _pool = None
 
 
+def obter_conexao():
+    """
+    Conexão do pool (close() devolve ao pool em vez de destruir).
+    Sem pool, ou com o pool esgotado, abre uma conexão direta.
+    """
+    if _pool:
+        try:
+            return _pool.get_connection()
+        except PoolError as e:
+            logger.warning("Pool %s esgotado; abrindo conexão direta: %s", POOL_NAME, e)
+    return mysql.connector.connect(**MYSQL_CONFIG)
+
+
 @contextmanager
 def get_conn():
     """
@@ -53,10 +101,7 @@ def get_conn():
     """
     conn = None
     try:
-        if _pool:
-            conn = _pool.get_connection()
-        else:
-            conn = mysql.connector.connect(**MYSQL_CONFIG)
+        conn = obter_conexao()
         yield conn
     finally:
         try:
@@ -66,43 +111,87 @@ def get_conn():
             pass
 
 
+# ALTER TABLE ... ADD COLUMN (statement inteiro, até o ';') e a checagem de coluna existente
+_ALTER_ADD_RE = re.compile(r"ALTER\s+TABLE\s+`?(\w+)`?\s+ADD\s+COLUMN\s+`?(\w+)`?[^;]*;?", re.IGNORECASE)
+_CHECK_COLUNA_SQL = ("SELECT COUNT(*) FROM information_schema.COLUMNS "
+                     "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s")
+
+
+def _executar_multi(cur, sql: str) -> None:
+    """Manda o script inteiro numa chamada e consome todos os result sets."""
+    try:
+        resultados = cur.execute(sql, multi=True)  # mysql-connector 8.x: gerador por statement
+    except TypeError:
+        resultados = None  # 9.x: execute() já aceita vários statements
+        cur.execute(sql)
+    if resultados is not None:
+        for r in resultados:
+            if r.with_rows:
+                r.fetchall()
+        return
+    while True:
+        if cur.with_rows:
+            cur.fetchall()
+        if not cur.nextset():
+            break
+
+
+def _executar_um_a_um(cur, sql: str) -> int:
+    """Fallback: divide em ';' e ignora statements que falharem. Retorna o nº de falhas."""
+    falhas = 0
+    for stmt in (s.strip() for s in sql.split(";")):
+        if not stmt:
+            continue
+        try:
+            cur.execute(stmt)
+            try:
+                _ = cur.fetchall()
+            except Exception:
+                pass
+        except Exception as e:
+            falhas += 1
+            logger.exception("Erro ao executar statement SQL (ignorando e continuando): %s", e)
+    return falhas
+
+
 def _execute_sql_file(path: str, conn) -> None:
     """
-    Executa statements SQL contidos em arquivo (compatível com vários drivers).
+    Executa o arquivo SQL numa chamada multi-statement do driver (statement a statement se falhar).
     Se encontrar ALTER TABLE ... ADD COLUMN <col>, checa information_schema e pula quando coluna já existe.
+    Depois de uma aplicação sem erros grava um marcador .schema_<sha256> ao lado do arquivo
+    (hash do SQL + servidor/banco); enquanto o marcador existir o arquivo não é reaplicado.
     """
-    import re
     if not path or not os.path.exists(path):
         raise FileNotFoundError(f"Arquivo SQL não encontrado: {path}")
 
     with open(path, "r", encoding="utf-8") as f:
         sql = f.read()
 
+    h = hashlib.sha256(f"{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DB}\n{sql}".encode("utf-8")).hexdigest()
+    marker = os.path.join(os.path.dirname(os.path.abspath(path)), f".schema_{h}")
+    if os.path.exists(marker):
+        logger.info("Schema de %s já aplicado (marcador %s) — pulando.", path, os.path.basename(marker))
+        return
+
+    falhas = 0
     cur = conn.cursor()
     try:
-        statements = [s.strip() for s in sql.split(";") if s.strip()]
-        alter_add_re = re.compile(r"ALTER\s+TABLE\s+`?(\w+)`?\s+ADD\s+COLUMN\s+`?(\w+)`?", re.IGNORECASE)
-        for stmt in statements:
-            try:
-                m = alter_add_re.search(stmt)
-                if m:
-                    table = m.group(1)
-                    col = m.group(2)
-                    # checar existence via information_schema
-                    check_sql = ("SELECT COUNT(*) FROM information_schema.COLUMNS "
-                                 "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s")
-                    cur.execute(check_sql, (table, col))
-                    exists = cur.fetchone()
-                    if exists and exists[0] > 0:
-                        logger.info("Coluna %s.%s já existe — pulando ALTER.", table, col)
-                        continue
-                cur.execute(stmt)
-                try:
-                    _ = cur.fetchall()
-                except Exception:
-                    pass
-            except Exception as e:
-                logger.exception("Erro ao executar statement SQL (ignorando e continuando): %s", e)
+        # só os ALTER ... ADD COLUMN precisam de checagem prévia; os que já existem saem do script
+        def _pular_coluna_existente(m):
+            cur.execute(_CHECK_COLUNA_SQL, (m.group(1), m.group(2)))
+            exists = cur.fetchone()
+            if exists and exists[0] > 0:
+                logger.info("Coluna %s.%s já existe — pulando ALTER.", m.group(1), m.group(2))
+                return ""
+            return m.group(0)
+
+        sql = _ALTER_ADD_RE.sub(_pular_coluna_existente, sql)
+        # o resto vai inteiro para o driver (multi-statement), que entende comentários e strings
+        try:
+            _executar_multi(cur, sql)
+        except Exception as e:
+            logger.warning("Execução multi-statement falhou (%s); aplicando statement a statement.", e)
+            falhas = _executar_um_a_um(cur, sql)
         try:
             conn.commit()
         except Exception:
@@ -113,15 +202,22 @@ def _execute_sql_file(path: str, conn) -> None:
         except Exception:
             pass
 
+    if not falhas:
+        try:
+            with open(marker, "w", encoding="utf-8") as f:
+                f.write("ok\n")
+        except OSError as e:
+            logger.debug("Não foi possível gravar marcador de schema %s: %s", marker, e)
+
 
 def inicializar_banco(ensure_schema: bool = True):
     """
-    Retorna uma conexão pronta.
+    Retorna uma conexão pronta (do pool quando disponível; close() a devolve).
     Se ensure_schema=True e existir core.config.BANCO_SQL, aplica o script SQL para criar schema/tabelas.
+    Para obter conexões no dia a dia use get_conn()/obter_conexao(), que não reaplicam o schema.
     """
-    # tenta criar conexão direta (não via pool) para inicialização segura
     try:
-        conn = mysql.connector.connect(**MYSQL_CONFIG)
+        conn = obter_conexao()
     except Exception as e:
         logger.error("Falha ao conectar ao banco: %s", e)
         raise
@@ -146,37 +242,144 @@ def _dict_cursor(conn):
     return conn.cursor(dictionary=True)
 
 
-def inserir_resposta(conn, texto: str) -> int:
-    texto_norm = normalizar(texto)
+# Cursores preparados (prepared=True) por conexão, chaveados pelo SQL: o servidor faz o
+# parse uma vez e as próximas chamadas só mandam os parâmetros. Vivem enquanto o objeto
+# de conexão viver (uma retirada do pool; o reset da sessão descarta os statements).
+_preparados: "weakref.WeakKeyDictionary[Any, dict]" = weakref.WeakKeyDictionary()
+
+
+def _no_cursor_preparado(conn, sql: str, params: tuple, ler):
+    """Executa `sql` num cursor preparado reaproveitado e devolve ler(cursor)."""
+    for _ in range(2):
+        try:
+            por_sql = _preparados.setdefault(conn, {})
+            cur = por_sql.get(sql)
+            novo = cur is None
+            if novo:
+                cur = por_sql[sql] = conn.cursor(prepared=True)
+        except TypeError:
+            # conexão sem weakref/prepared (driver diferente): cursor comum descartável
+            cur = conn.cursor()
+            try:
+                cur.execute(sql, params)
+                return ler(cur)
+            finally:
+                try: cur.close()
+                except Exception: pass
+        try:
+            cur.execute(sql, params)
+            return ler(cur)
+        except Exception:
+            por_sql.pop(sql, None)
+            try: cur.close()
+            except Exception: pass
+            # um cursor antigo pode ter perdido o statement no reset da sessão: tenta de novo com um novo
+            if novo:
+                raise
+
+
+def _executar_preparado(conn, sql: str, params: tuple) -> int:
+    """Executa `sql` num cursor preparado reaproveitado; retorna o lastrowid."""
+    return _no_cursor_preparado(conn, sql, params, lambda cur: int(cur.lastrowid or 0))
+
+
+def consultar_preparado(conn, sql: str, params: tuple) -> list:
+    """SELECT num cursor preparado reaproveitado; retorna todas as linhas (tuplas)."""
+    return _no_cursor_preparado(conn, sql, params, lambda cur: cur.fetchall())
+
+
+def _executar_bloco(conn, sql: str, params: tuple, n: int) -> int:
+    """
+    Executa um statement em lote de `n` linhas (SQL montado pelo tamanho do bloco); retorna o lastrowid.
+    Só o bloco cheio (n == BULK_CHUNK) tem texto fixo e vai para o cursor preparado em cache;
+    o bloco final, de tamanho variável, usa um cursor comum: preparado, cada tamanho deixaria
+    um statement aberto no servidor pela vida da conexão.
+    """
+    if n == BULK_CHUNK:
+        return _executar_preparado(conn, sql, params)
     cur = conn.cursor()
     try:
-        cur.execute("INSERT INTO respostas (texto, texto_normalizado) VALUES (%s, %s)", (texto, texto_norm))
-        conn.commit()
-        return int(cur.lastrowid)
+        cur.execute(sql, params)
+        return int(cur.lastrowid or 0)
     finally:
         try: cur.close()
         except Exception: pass
 
 
-def inserir_pergunta(conn, texto: str, resposta_id: Optional[int] = None) -> int:
+def inserir_resposta(conn, texto: str, commit: bool = True) -> int:
     texto_norm = normalizar(texto)
-    cur = conn.cursor()
-    try:
-        cur.execute("INSERT INTO perguntas (texto, texto_normalizado, resposta_id) VALUES (%s, %s, %s)",
-                    (texto, texto_norm, resposta_id))
+    rid = _executar_preparado(conn, "INSERT INTO respostas (texto, texto_normalizado) VALUES (%s, %s)", (texto, texto_norm))
+    _caches_busca_limpar()
+    if commit:
         conn.commit()
-        return int(cur.lastrowid)
-    finally:
-        try: cur.close()
-        except Exception: pass
+    return rid
+
+
+def inserir_pergunta(conn, texto: str, resposta_id: Optional[int] = None, commit: bool = True) -> int:
+    texto_norm = normalizar(texto)
+    pid = _executar_preparado(conn, "INSERT INTO perguntas (texto, texto_normalizado, resposta_id) VALUES (%s, %s, %s)",
+                              (texto, texto_norm, resposta_id))
+    _caches_busca_limpar()
+    if commit:
+        conn.commit()
+    return pid
 
 
-def inserir_qna(conn, pergunta: str, resposta: str) -> Tuple[int, int]:
-    rid = inserir_resposta(conn, resposta)
-    pid = inserir_pergunta(conn, pergunta, rid)
+def inserir_qna(conn, pergunta: str, resposta: str, commit: bool = True) -> Tuple[int, int]:
+    # par pergunta/resposta numa transação só
+    rid = inserir_resposta(conn, resposta, commit=False)
+    pid = inserir_pergunta(conn, pergunta, rid, commit=commit)
     return pid, rid
 
 
+# linhas por INSERT multi-row (mantém cada pacote bem abaixo do max_allowed_packet)
+BULK_CHUNK = int(os.getenv("DB_BULK_CHUNK", "500"))
+
+
+def _inserir_multi(conn, prefixo: str, linha_sql: str, linhas: List[tuple], commit: bool = True) -> List[int]:
+    """
+    INSERT ... VALUES (...),(...),... em blocos de BULK_CHUNK (commit por bloco se `commit`;
+    com commit=False a importação inteira fica na transação de quem chamou).
+    Retorna os ids gerados na ordem das linhas: num INSERT multi-row de contagem conhecida o
+    InnoDB aloca ids sem buracos em todos os innodb_autoinc_lock_mode, a partir do lastrowid
+    (primeiro id do bloco) e de @@auto_increment_increment em diante.
+    """
+    ids: List[int] = []
+    if not linhas:
+        return ids
+    _caches_busca_limpar()
+    passo = _auto_increment_increment(conn)
+    # blocos cheios têm o mesmo SQL: o statement preparado é reaproveitado entre eles (_executar_bloco)
+    for i in range(0, len(linhas), BULK_CHUNK):
+        bloco = linhas[i:i + BULK_CHUNK]
+        sql = prefixo + ",".join([linha_sql] * len(bloco))
+        primeiro = _executar_bloco(conn, sql, tuple(v for linha in bloco for v in linha), len(bloco))
+        ids.extend(range(primeiro, primeiro + passo * len(bloco), passo))
+        if commit:
+            conn.commit()
+    return ids
+
+
+def _auto_increment_increment(conn) -> int:
+    """@@auto_increment_increment da sessão (1 salvo em replicação multi-primário)."""
+    linhas = consultar_preparado(conn, "SELECT @@auto_increment_increment", ())
+    return int(linhas[0][0]) if linhas and linhas[0][0] else 1
+
+
+def inserir_respostas_bulk(conn, textos: List[str], commit: bool = True) -> List[int]:
+    """Insere várias respostas com INSERT multi-row; retorna os ids na ordem de `textos`."""
+    linhas = [(t, normalizar(t)) for t in textos]
+    return _inserir_multi(conn, "INSERT INTO respostas (texto, texto_normalizado) VALUES ", "(%s, %s)", linhas,
+                          commit=commit)
+
+
+def inserir_perguntas_bulk(conn, pares: List[Tuple[str, Optional[int]]], commit: bool = True) -> List[int]:
+    """Insere várias perguntas (texto, resposta_id) com INSERT multi-row; retorna os ids."""
+    linhas = [(t, normalizar(t), rid) for t, rid in pares]
+    return _inserir_multi(conn, "INSERT INTO perguntas (texto, texto_normalizado, resposta_id) VALUES ",
+                          "(%s, %s, %s)", linhas, commit=commit)
+
+
 def listar_memorias(conn, tipo: Optional[str] = None) -> List[Tuple]:
     cur = conn.cursor()
     try:
@@ -190,14 +393,50 @@ def listar_memorias(conn, tipo: Optional[str] = None) -> List[Tuple]:
         except Exception: pass
 
 
-def adicionar_memoria(conn, tipo, descricao, data_evento=None, repetir_anualmente=False, prioridade=None, tags=None) -> int:
+def listar_memorias_filtradas(conn, tipo: Optional[str] = None, tag: Optional[str] = None,
+                              date_from=None, date_to=None) -> List[Tuple]:
+    """
+    listar_memorias com os filtros no WHERE (só entram os predicados informados, para o
+    MySQL usar idx_memoria_tipo_data / idx_memoria_data). `tag` casa como substring de tags.
+    Com intervalo de datas, ordena por data_evento.
+    """
+    where, params = [], []
+    if tipo:
+        where.append("tipo = %s")
+        params.append(tipo)
+    if tag:
+        where.append("tags LIKE %s")
+        params.append("%" + tag.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+    if date_from is not None:
+        where.append("data_evento >= %s")
+        params.append(date_from)
+    if date_to is not None:
+        where.append("data_evento <= %s")
+        params.append(date_to)
+    sql = "SELECT id, tipo, descricao, data_evento, repetir_anualmente, prioridade, tags FROM memoria_pessoal"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    if date_from is not None or date_to is not None:
+        sql += " ORDER BY data_evento ASC"
+    cur = conn.cursor()
+    try:
+        cur.execute(sql, tuple(params))
+        return cur.fetchall()
+    finally:
+        try: cur.close()
+        except Exception: pass
+
+
+def adicionar_memoria(conn, tipo, descricao, data_evento=None, repetir_anualmente=False, prioridade=None, tags=None,
+                      commit: bool = True) -> int:
     cur = conn.cursor()
     try:
         cur.execute("""
             INSERT INTO memoria_pessoal (tipo, descricao, data_evento, repetir_anualmente, prioridade, tags)
             VALUES (%s, %s, %s, %s, %s, %s)
             """, (tipo, descricao, data_evento, bool(repetir_anualmente), prioridade, tags))
-        conn.commit()
+        if commit:
+            conn.commit()
         return int(cur.lastrowid)
     finally:
         try: cur.close()
@@ -215,7 +454,7 @@ def remover_memoria_por_id(conn, memoria_id: int) -> None:
 
 
 def editar_memoria(conn, memoria_id: int, nova_descricao: Optional[str] = None, nova_data: Optional[str] = None,
-                   nova_prioridade: Optional[str] = None, nova_tags: Optional[str] = None) -> None:
+                   nova_prioridade: Optional[str] = None, nova_tags: Optional[str] = None, commit: bool = True) -> None:
     cur = conn.cursor()
     try:
         sets = []
@@ -233,7 +472,8 @@ def editar_memoria(conn, memoria_id: int, nova_descricao: Optional[str] = None,
         sql = "UPDATE memoria_pessoal SET " + ", ".join(sets) + " WHERE id = %s"
         params.append(memoria_id)
         cur.execute(sql, tuple(params))
-        conn.commit()
+        if commit:
+            conn.commit()
     finally:
         try: cur.close()
         except Exception: pass
@@ -242,17 +482,19 @@ def editar_memoria(conn, memoria_id: int, nova_descricao: Optional[str] = None,
 def get_id_memoria_por_posicao(conn, tipo_desejado: str, posicao: int) -> Optional[int]:
     if tipo_desejado not in ["tarefa", "evento", "aniversario", "lembrete"]:
         return None
+    if posicao <= 0:
+        return None
     cur = conn.cursor()
     try:
+        # o MySQL devolve só a linha pedida (índice em (tipo, data_evento))
         cur.execute("""
             SELECT id FROM memoria_pessoal
             WHERE tipo = %s
             ORDER BY COALESCE(data_evento, '9999-12-31') ASC
-        """, (tipo_desejado,))
-        resultados = cur.fetchall()
-        if 0 < posicao <= len(resultados):
-            return int(resultados[posicao - 1][0])
-        return None
+            LIMIT 1 OFFSET %s
+        """, (tipo_desejado, posicao - 1))
+        row = cur.fetchone()
+        return int(row[0]) if row else None
     finally:
         try: cur.close()
         except Exception: pass
@@ -261,7 +503,6 @@ def get_id_memoria_por_posicao(conn, tipo_desejado: str, posicao: int) -> Option
 def buscar_memorias_proximas(conn, dias=14) -> List[Tuple]:
     cur = conn.cursor()
     try:
-        from datetime import datetime, timedelta
         agora = datetime.now()
         limite = agora + timedelta(days=dias)
         cur.execute("""
@@ -292,88 +533,461 @@ def gerar_alertas(conn) -> str:
 # ---------------------------
 # Embeddings helpers (DB)
 # ---------------------------
+def embedding_para_blob(embedding) -> bytes:
+    """Embedding como float32 cru e já normalizado (colunas embedding_resposta_bin / embedding_bin):
+    com norma 1 gravada, o cosseno vira produto escalar puro na leitura."""
+    v = np.asarray(embedding, dtype=np.float32)
+    v = v / (np.linalg.norm(v) + 1e-12)
+    return v.tobytes()
+
+
+def _emb_de_linha(binario, texto_json) -> Optional[np.ndarray]:
+    """Lê o embedding de uma linha: prefere o BLOB float32; cai para o JSON/CSV antigo."""
+    if binario:
+        return np.frombuffer(binario, dtype=np.float32)
+    if not texto_json:
+        return None
+    try:
+        return np.asarray(_json_loads(texto_json), dtype=np.float32)
+    except Exception:
+        try:
+            return np.asarray([float(x) for x in str(texto_json).split(',') if x != ''], dtype=np.float32)
+        except Exception:
+            return None
+
+
+# tabela -> (coluna JSON, coluna BLOB float32)
+_COLUNAS_EMB = {"perguntas": ("embedding", "embedding_bin"),
+                "respostas": ("embedding_resposta", "embedding_resposta_bin")}
+
+_SQL_RESPOSTAS_EMB = ("SELECT id, texto, embedding_resposta_bin, embedding_resposta FROM respostas "
+                      "WHERE embedding_resposta_bin IS NOT NULL OR embedding_resposta IS NOT NULL")
+
+
 def buscar_respostas_com_embedding(conn) -> List[Tuple[int, str, Optional[list]]]:
-    cur = conn.cursor(dictionary=True)
+    cur = conn.cursor()
     try:
-        cur.execute("SELECT id, texto, embedding_resposta FROM respostas WHERE embedding_resposta IS NOT NULL")
+        cur.execute(_SQL_RESPOSTAS_EMB)
         out = []
-        for r in cur.fetchall():
-            emb = None
-            if r.get('embedding_resposta'):
-                try:
-                    import json
-                    emb = json.loads(r['embedding_resposta'])
-                except Exception:
-                    try:
-                        emb = [float(x) for x in str(r['embedding_resposta']).split(',') if x != '']
-                    except Exception:
-                        emb = None
-            out.append((int(r['id']), r['texto'], emb))
+        for rid, texto, binario, texto_json in cur:
+            v = _emb_de_linha(binario, texto_json)
+            out.append((int(rid), texto, v.tolist() if v is not None else None))
         return out
     finally:
         try: cur.close()
         except Exception: pass
 
 
-def atualizar_embedding_resposta(conn, resposta_id: int, embedding: list) -> None:
+# Por tabela, (ids, textos, M): matriz (N, D) float32 dos embeddings já normalizados
+# (norma 1), montada uma vez e reaproveitada entre consultas e pelo seed_qna; textos só
+# em respostas (None em perguntas). Invalidada quando um embedding da tabela muda.
+_emb_cache: Dict[str, Tuple[List[int], Optional[List[str]], np.ndarray]] = {}
+# (M float32 de origem, cópia int8) para PIPELINE_INT8; refeita quando _emb_cache muda
+_emb_cache_i8: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+
+def invalidar_cache_embeddings(tabela: Optional[str] = None) -> None:
+    """Chamado a cada escrita de embedding em `tabela` (None: todas): memória e .npy em disco."""
+    global _emb_cache_i8
+    if tabela is None:
+        _emb_cache.clear()
+    else:
+        _emb_cache.pop(tabela, None)
+    if tabela in (None, "respostas"):
+        _emb_cache_i8 = None
+        _sem_cache_limpar()
+    embedding_store.remover(tabela)
+
+
+def _impressao_embeddings(conn, tabela: str) -> Tuple[int, int]:
+    """(COUNT, MAX(id)) das linhas de `tabela` com embedding: identifica o cache em disco."""
+    col_json, col_bin = _COLUNAS_EMB[tabela]
     cur = conn.cursor()
-    import json
     try:
-        cur.execute("UPDATE respostas SET embedding_resposta = %s WHERE id = %s", (json.dumps(embedding, ensure_ascii=False), resposta_id))
-        conn.commit()
+        cur.execute(f"SELECT COUNT(*), COALESCE(MAX(id), 0) FROM {tabela} "
+                    f"WHERE {col_bin} IS NOT NULL OR {col_json} IS NOT NULL")
+        row = cur.fetchone()
+        return (int(row[0]), int(row[1])) if row else (0, 0)
     finally:
         try: cur.close()
         except Exception: pass
 
 
-def atualizar_embedding_pergunta(conn, pergunta_id: int, embedding: list) -> None:
+# Cache semântico na frente da busca por embedding: guarda (pergunta normalizada,
+# vetor unitário, resposta, score da resposta) das últimas consultas que acertaram.
+# Pergunta idêntica nem recalcula o embedding; pergunta parecida (cosseno >= SEM_CACHE_SIM)
+# evita a varredura das respostas. Uma entrada só vale para quem pede threshold <= score
+# com que a resposta foi aceita. Anel FIFO de SEM_CACHE_CAP entradas (0 desliga).
+# Limpo quando embeddings mudam e a cada INSERT em perguntas/respostas.
+SEM_CACHE_CAP = int(os.getenv("SEM_CACHE_CAP", "4096"))
+SEM_CACHE_SIM = float(os.getenv("SEM_CACHE_SIM", "0.90"))
+_sem_lock = threading.Lock()
+_sem_cache: dict = {"M": None, "chaves": [], "respostas": [], "scores": [], "por_texto": {}, "pos": 0}
+
+
+def _sem_cache_limpar() -> None:
+    with _sem_lock:
+        _sem_cache.update(M=None, chaves=[], respostas=[], scores=[], por_texto={}, pos=0)
+
+
+def _sem_cache_texto(chave: str, threshold: float) -> Optional[str]:
+    """Resposta guardada para a pergunta normalizada idêntica, se aceita com score >= threshold."""
+    with _sem_lock:
+        entrada = _sem_cache["por_texto"].get(chave)
+    if entrada is None or entrada[1] < threshold:
+        return None
+    return entrada[0]
+
+
+def _sem_cache_buscar(q: np.ndarray, threshold: float) -> Optional[str]:
+    with _sem_lock:
+        M = _sem_cache["M"]
+        respostas = _sem_cache["respostas"]
+        n = len(respostas)
+        if M is None or not n or M.shape[1] != q.size:
+            return None
+        scores = M[:n] @ q
+        i = int(scores.argmax())
+        if float(scores[i]) < SEM_CACHE_SIM or _sem_cache["scores"][i] < threshold:
+            return None
+        return respostas[i]
+
+
+def _sem_cache_guardar(chave: str, q: np.ndarray, resposta: str, score: float) -> None:
+    if SEM_CACHE_CAP <= 0:
+        return
+    with _sem_lock:
+        c = _sem_cache
+        if c["M"] is None or c["M"].shape[1] != q.size:
+            c.update(M=np.zeros((SEM_CACHE_CAP, q.size), dtype=np.float32), chaves=[], respostas=[], scores=[],
+                     por_texto={}, pos=0)
+        if len(c["respostas"]) < SEM_CACHE_CAP:
+            i = len(c["respostas"])
+            c["chaves"].append(chave)
+            c["respostas"].append(resposta)
+            c["scores"].append(score)
+        else:
+            i = c["pos"]
+            c["pos"] = (i + 1) % SEM_CACHE_CAP
+            c["por_texto"].pop(c["chaves"][i], None)
+            c["chaves"][i] = chave
+            c["respostas"][i] = resposta
+            c["scores"][i] = score
+        c["M"][i] = q
+        c["por_texto"][chave] = (resposta, score)
+
+
+def _matriz_embeddings(conn, tabela: str) -> Tuple[List[int], Optional[List[str]], np.ndarray]:
+    """
+    (ids, textos, M) da tabela. Ordem de busca: memória, .npy em disco (embedding_store,
+    só se a impressão do banco bate) e, por último, todas as linhas do MySQL.
+    """
+    cache = _emb_cache.get(tabela)
+    if cache is not None:
+        return cache
+    impressao = _impressao_embeddings(conn, tabela)
+    salvo = embedding_store.carregar(tabela, impressao)
+    if salvo is not None:
+        ids, M = salvo
+        cache = (ids, _textos_respostas(conn, ids) if tabela == "respostas" else None, M)
+    else:
+        cache = _ler_matriz(conn, tabela, impressao[0])
+        embedding_store.salvar(tabela, cache[0], cache[2], impressao)
+    _emb_cache[tabela] = cache
+    return cache
+
+
+def _matriz_respostas(conn) -> Tuple[List[int], List[str], np.ndarray]:
+    return _matriz_embeddings(conn, "respostas")
+
+
+def carregar_matriz_normalizada(conn, tabela: str = "respostas") -> Tuple[List[int], np.ndarray]:
+    """(ids, M) com os embeddings da tabela em linhas de norma 1: a mesma matriz da busca, não uma cópia."""
+    if tabela not in _COLUNAS_EMB:
+        raise ValueError("tabela deve ser 'perguntas' ou 'respostas'")
+    ids, _, M = _matriz_embeddings(conn, tabela)
+    return ids, M
+
+
+def _textos_respostas(conn, ids: List[int]) -> List[str]:
+    """Textos das respostas na ordem de `ids` (a matriz em disco guarda só ids e vetores)."""
     cur = conn.cursor()
-    import json
     try:
-        cur.execute("UPDATE perguntas SET embedding = %s WHERE id = %s", (json.dumps(embedding, ensure_ascii=False), pergunta_id))
-        conn.commit()
+        cur.execute("SELECT id, texto FROM respostas")
+        por_id = {int(rid): texto for rid, texto in cur.fetchall()}
     finally:
         try: cur.close()
         except Exception: pass
+    return [por_id.get(rid, "") for rid in ids]
+
+
+def _ler_matriz(conn, tabela: str, total: int) -> Tuple[List[int], Optional[List[str]], np.ndarray]:
+    col_json, col_bin = _COLUNAS_EMB[tabela]
+    com_texto = tabela == "respostas"
+    ids: List[int] = []
+    textos: List[str] = []
+    M = np.empty((0, 0), dtype=np.float32)
+    # cursor sem buffer: as linhas vêm do socket direto para a matriz pré-alocada,
+    # sem materializar o resultado inteiro (fetchall) antes
+    cur = conn.cursor(buffered=False)
+    try:
+        cur.execute(f"SELECT id, {'texto' if com_texto else 'NULL'}, {col_bin}, {col_json} FROM {tabela} "
+                    f"WHERE {col_bin} IS NOT NULL OR {col_json} IS NOT NULL ORDER BY id DESC")
+        for rid, texto, binario, texto_json in cur:
+            v = _emb_de_linha(binario, texto_json)
+            if v is None or not v.size:
+                continue
+            if not ids and not M.size:
+                M = np.empty((total, v.size), dtype=np.float32)
+            # dimensão diferente da mais recente (modelo trocado) ou linha nova após o COUNT: fica de fora
+            if v.size != M.shape[1] or len(ids) >= len(M):
+                continue
+            M[len(ids)] = v
+            ids.append(int(rid))
+            textos.append(texto)
+    finally:
+        try: cur.close()
+        except Exception: pass
+    M = M[:len(ids)]
+    if len(ids):
+        M /= np.clip(np.linalg.norm(M, axis=1, keepdims=True), 1e-12, None)
+    return ids, (textos if com_texto else None), M
+
+
+def _pontuar_respostas(M: np.ndarray, q: np.ndarray) -> np.ndarray:
+    """Cosseno de q (norma 1) contra as linhas de M: int8 via simsimd com PIPELINE_INT8, senão M @ q."""
+    if not PIPELINE_INT8:
+        return M @ q
+    global _emb_cache_i8
+    cache = _emb_cache_i8
+    if cache is None or cache[0] is not M:
+        # a escala por linha não muda o cosseno, então a cópia int8 dispensa guardá-la
+        cache = (M, quantizar_i8(M)[0])
+        _emb_cache_i8 = cache
+    q8 = quantizar_i8(q)[0]
+    dist = np.asarray(simsimd.cdist(q8[None, :], cache[1], metric="cosine"), dtype=np.float32)
+    return 1.0 - dist.ravel()
+
+
+def buscar_respostas_top_k(conn, query_emb, k: int = 50) -> List[Tuple[int, str, np.ndarray]]:
+    """
+    As k respostas mais próximas (cosseno) de `query_emb`, em ordem decrescente, como
+    (id, texto, embedding com norma 1). Pontua contra a matriz em cache (_matriz_respostas)
+    em vez de trazer todos os embeddings do banco a cada consulta.
+    """
+    q = np.asarray(query_emb, dtype=np.float32)
+    norma = float(np.linalg.norm(q)) if q.ndim == 1 else 0.0
+    if norma == 0.0 or k <= 0:
+        return []
+    ids, textos, M = _matriz_respostas(conn)
+    if not ids or M.shape[1] != q.size:
+        return []
+    scores = _pontuar_respostas(M, q / norma)
+    k = min(k, len(ids))
+    idx = np.argpartition(-scores, k - 1)[:k]
+    idx = idx[np.argsort(-scores[idx])]
+    return [(ids[i], textos[i], M[i]) for i in idx]
+
+
+def atualizar_embedding_resposta(conn, resposta_id: int, embedding: list, commit: bool = True) -> None:
+    _executar_preparado(conn, "UPDATE respostas SET embedding_resposta = %s, embedding_resposta_bin = %s WHERE id = %s",
+                        (embedding_para_json(embedding), embedding_para_blob(embedding), resposta_id))
+    if commit:
+        conn.commit()
+    invalidar_cache_embeddings("respostas")
+
+
+def atualizar_embeddings_bulk(conn, tabela: str, pares: List[Tuple[int, list]], commit: bool = True) -> None:
+    """
+    Grava vários (id, embedding) de `tabela` com um UPDATE por bloco de BULK_CHUNK:
+    SET col = CASE id WHEN .. THEN .. END WHERE id IN (..), nas colunas JSON e BLOB.
+    (INSERT ... ON DUPLICATE KEY UPDATE não serve aqui: texto/texto_normalizado são
+    NOT NULL sem default e um id inexistente viraria uma linha vazia.)
+    """
+    if not pares:
+        return
+    col_json, col_bin = _COLUNAS_EMB[tabela]
+    for i in range(0, len(pares), BULK_CHUNK):
+        bloco = pares[i:i + BULK_CHUNK]
+        casos = " ".join(["WHEN %s THEN %s"] * len(bloco))
+        params: List[Any] = [v for rid, emb in bloco for v in (rid, embedding_para_json(emb))]
+        params += [v for rid, emb in bloco for v in (rid, embedding_para_blob(emb))]
+        params += [rid for rid, _ in bloco]
+        sql = (f"UPDATE {tabela} SET {col_json} = CASE id {casos} END, "
+               f"{col_bin} = CASE id {casos} END "
+               f"WHERE id IN ({','.join(['%s'] * len(bloco))})")
+        _executar_bloco(conn, sql, tuple(params), len(bloco))
+        if commit:
+            conn.commit()
+    invalidar_cache_embeddings(tabela)
+
+
+def atualizar_embeddings_resposta_bulk(conn, pares: List[Tuple[int, list]], commit: bool = True) -> None:
+    atualizar_embeddings_bulk(conn, "respostas", pares, commit=commit)
+
+
+def atualizar_embedding_pergunta(conn, pergunta_id: int, embedding: list, commit: bool = True) -> None:
+    _executar_preparado(conn, "UPDATE perguntas SET embedding = %s, embedding_bin = %s WHERE id = %s",
+                        (embedding_para_json(embedding), embedding_para_blob(embedding), pergunta_id))
+    if commit:
+        conn.commit()
+    invalidar_cache_embeddings("perguntas")
+
+
+def atualizar_keywords_bulk(conn, pares: List[Tuple[int, str]], commit: bool = True) -> None:
+    """Grava vários (pergunta_id, keywords_json) com um UPDATE ... CASE id por bloco de BULK_CHUNK."""
+    for i in range(0, len(pares), BULK_CHUNK):
+        bloco = pares[i:i + BULK_CHUNK]
+        casos = " ".join(["WHEN %s THEN %s"] * len(bloco))
+        params = [v for par in bloco for v in par] + [pid for pid, _ in bloco]
+        _executar_bloco(conn, f"UPDATE perguntas SET keywords = CASE id {casos} END "
+                              f"WHERE id IN ({','.join(['%s'] * len(bloco))})", tuple(params), len(bloco))
+        if commit:
+            conn.commit()
+
+
+def migrar_embeddings_para_blob(conn) -> int:
+    """
+    Migração única: preenche as colunas BLOB a partir do JSON nas linhas que ainda não
+    têm. O JSON fica (é o vetor cru; a checagem de "sem embedding" usa ele). Retorna o total migrado.
+    """
+    total = 0
+    for tabela, (col_json, col_bin) in _COLUNAS_EMB.items():
+        cur = conn.cursor()
+        cur.execute(f"SELECT id, {col_json} FROM {tabela} "
+                    f"WHERE {col_bin} IS NULL AND {col_json} IS NOT NULL AND {col_json} != ''")
+        pares = []
+        for rid, texto_json in cur.fetchall():
+            v = _emb_de_linha(None, texto_json)
+            if v is not None and v.size:
+                pares.append((rid, embedding_para_blob(v)))
+        cur.close()
+        for i in range(0, len(pares), BULK_CHUNK):
+            bloco = pares[i:i + BULK_CHUNK]
+            casos = " ".join(["WHEN %s THEN %s"] * len(bloco))
+            params = [v for par in bloco for v in par] + [rid for rid, _ in bloco]
+            _executar_bloco(conn, f"UPDATE {tabela} SET {col_bin} = CASE id {casos} END "
+                                  f"WHERE id IN ({','.join(['%s'] * len(bloco))})", tuple(params), len(bloco))
+            conn.commit()
+        logger.info("%d embeddings de %s migrados para BLOB.", len(pares), tabela)
+        total += len(pares)
+    if total:
+        invalidar_cache_embeddings()
+    return total
+
+
+def normalizar_embeddings_salvos(conn, tol: float = 1e-4) -> int:
+    """
+    Migração única: regrava com norma 1 os embeddings JSON antigos (gravados antes de
+    calcular_embedding normalizar na origem), junto com o BLOB. Linhas já unitárias
+    (|norma - 1| <= tol) ficam como estão. Retorna o total regravado.
+    """
+    total = 0
+    for tabela, (col_json, col_bin) in _COLUNAS_EMB.items():
+        cur = conn.cursor()
+        cur.execute(f"SELECT id, {col_json} FROM {tabela} WHERE {col_json} IS NOT NULL AND {col_json} != ''")
+        pares = []
+        for rid, texto_json in cur.fetchall():
+            v = _emb_de_linha(None, texto_json)
+            if v is None or not v.size:
+                continue
+            norma = float(np.linalg.norm(v))
+            if norma > 0.0 and abs(norma - 1.0) > tol:
+                pares.append((rid, v / norma))
+        cur.close()
+        for i in range(0, len(pares), BULK_CHUNK):
+            bloco = pares[i:i + BULK_CHUNK]
+            casos = " ".join(["WHEN %s THEN %s"] * len(bloco))
+            params: List[Any] = [x for rid, v in bloco for x in (rid, embedding_para_json(v))]
+            params += [x for rid, v in bloco for x in (rid, embedding_para_blob(v))]
+            params += [rid for rid, _ in bloco]
+            _executar_bloco(conn, f"UPDATE {tabela} SET {col_json} = CASE id {casos} END, "
+                                  f"{col_bin} = CASE id {casos} END "
+                                  f"WHERE id IN ({','.join(['%s'] * len(bloco))})", tuple(params), len(bloco))
+            conn.commit()
+        logger.info("%d embeddings de %s regravados com norma 1.", len(pares), tabela)
+        total += len(pares)
+    if total:
+        invalidar_cache_embeddings()
+    return total
+
+# LRU das buscas FULLTEXT: texto normalizado -> resposta (None também é guardado).
+# Limpo a cada INSERT em perguntas/respostas.
+FT_CACHE_CAP = int(os.getenv("FT_CACHE_CAP", "512"))
+_ft_lock = threading.Lock()
+_ft_cache: "OrderedDict[str, Optional[str]]" = OrderedDict()
+
+
+def _caches_busca_limpar() -> None:
+    """Chamado a cada INSERT em perguntas/respostas: as buscas em cache podem ter outra resposta agora."""
+    _ft_cache_limpar()
+    _sem_cache_limpar()
+
+
+def _ft_cache_limpar() -> None:
+    with _ft_lock:
+        _ft_cache.clear()
 
 
 def buscar_resposta_por_pergunta_fulltext(conn, pergunta: str, top_n: int = 3) -> Optional[str]:
+    # só a melhor resposta é usada, então top_n não muda o resultado (mantido por compatibilidade)
     texto_norm = normalizar(pergunta)
-    cur = conn.cursor(dictionary=True)
+    with _ft_lock:
+        if texto_norm in _ft_cache:
+            _ft_cache.move_to_end(texto_norm)
+            return _ft_cache[texto_norm]
+    cur = conn.cursor()
     try:
+        # O MATCH fica no WHERE (é o que deixa o índice FULLTEXT filtrar as linhas) e no
+        # ORDER BY; com os mesmos argumentos o MySQL avalia uma vez só. Trocar o WHERE por
+        # HAVING obrigaria a calcular o MATCH para todas as linhas da tabela.
         cur.execute("""
-            SELECT p.id, p.texto, p.texto_normalizado, r.texto AS resposta, MATCH(p.texto_normalizado) AGAINST (%s IN NATURAL LANGUAGE MODE) AS score
+            SELECT r.texto
             FROM perguntas p
             JOIN respostas r ON p.resposta_id = r.id
             WHERE MATCH(p.texto_normalizado) AGAINST (%s IN NATURAL LANGUAGE MODE)
-            ORDER BY score DESC
-            LIMIT %s
-        """, (texto_norm, texto_norm, top_n))
-        rows = cur.fetchall()
-        if rows:
-            return rows[0]['resposta']
-        return None
+            ORDER BY MATCH(p.texto_normalizado) AGAINST (%s IN NATURAL LANGUAGE MODE) DESC
+            LIMIT 1
+        """, (texto_norm, texto_norm))
+        row = cur.fetchone()
+        resposta = row[0] if row else None
     finally:
         try: cur.close()
         except Exception: pass
+    if FT_CACHE_CAP > 0:
+        with _ft_lock:
+            _ft_cache[texto_norm] = resposta
+            if len(_ft_cache) > FT_CACHE_CAP:
+                _ft_cache.popitem(last=False)
+    return resposta
 
 
 def buscar_resposta_por_pergunta_embedding(conn, pergunta: str, top_n: int = 3, threshold: float = 0.60) -> Optional[str]:
+    chave = normalizar(pergunta or "")
+    resposta = _sem_cache_texto(chave, threshold)
+    if resposta is not None:
+        return resposta
     # Lazy import para evitar dependência pesada no momento do import do módulo
-    from core.embeddings import calcular_embedding, cosine_similarity
-    q_emb = calcular_embedding(pergunta)
-    if not q_emb:
+    from core.embeddings import calcular_embedding
+    q = calcular_embedding(pergunta, return_numpy=True)
+    if q is None or not q.size:
         return None
-    candidates = buscar_respostas_com_embedding(conn)
-    scored = []
-    for rid, texto, emb in candidates:
-        if emb:
-            try:
-                sim = float(cosine_similarity(q_emb, emb))
-            except Exception:
-                sim = 0.0
-            scored.append((sim, texto))
-    scored.sort(reverse=True, key=lambda t: t[0])
-    if scored and scored[0][0] >= threshold:
-        return scored[0][1]
+    norma = float(np.linalg.norm(q))
+    if norma == 0.0:
+        return None
+    q = q / norma
+    resposta = _sem_cache_buscar(q, threshold)
+    if resposta is not None:
+        return resposta
+    _, textos, M = _matriz_respostas(conn)
+    if not textos or M.shape[1] != q.size:
+        return None
+    # cosseno contra todas as respostas numa única multiplicação matriz-vetor.
+    # Sem simsimd fica em float32 de propósito: o NumPy não tem caminho BLAS para int8
+    # (M_i8 @ q cai num loop genérico 2-7x mais lento que o sgemv).
+    scores = _pontuar_respostas(M, q)
+    melhor = int(scores.argmax())
+    if float(scores[melhor]) >= threshold:
+        _sem_cache_guardar(chave, q, textos[melhor], float(scores[melhor]))
+        return textos[melhor]
     return None
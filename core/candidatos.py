@@ -0,0 +1,116 @@
+# core/candidatos.py
+"""
+Helpers de candidatos (dicts pergunta/resposta) usados pelos dois pipelines,
+gerenciador_respostas e pipeline_search: vetor de cada candidato parseado uma vez,
+matriz empilhada para pontuar tudo numa multiplicação, tokens e o CSV de fallback em cache.
+"""
+from __future__ import annotations
+
+import csv
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from embeddings import parse_embedding
+from normalizacao import normalizar
+
+# orjson é opcional: parse de embeddings (listas longas de floats) bem mais rápido
+try:
+    import orjson
+    _json_loads = orjson.loads
+except Exception:
+    orjson = None
+    _json_loads = json.loads
+
+
+def parse_embedding_json(maybe_json: Optional[str]) -> Optional[List[float]]:
+    if not maybe_json:
+        return None
+    if isinstance(maybe_json, (list, tuple)):
+        return list(maybe_json)
+    try:
+        return _json_loads(maybe_json)
+    except Exception:
+        try:
+            return _json_loads(maybe_json.strip().strip('"'))
+        except Exception:
+            return None
+
+
+def materialize_embeddings(candidates: List[Dict[str, Any]]) -> None:
+    """
+    Parse do embedding de cada candidato uma vez só: guarda c["_emb_np"] (float32 com
+    norma 1, ou None). Os candidatos passam por rank_candidates mais de uma vez
+    (ranking e rerank) e reaproveitam o vetor.
+    """
+    for c in candidates:
+        if "_emb_np" in c:
+            continue
+        v = parse_embedding(c.get("resposta_embedding") or c.get("pergunta_embedding"))
+        if v is not None:
+            norma = float(np.linalg.norm(v)) if v.ndim == 1 else 0.0
+            v = v / norma if norma > 0.0 else None
+        c["_emb_np"] = v
+
+
+def stack_embeddings(candidates: List[Dict[str, Any]], dim: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Embeddings dos candidatos numa matriz float32 (N, dim) com linhas de norma 1, para
+    pontuar todos com uma multiplicação só. Linha zerada (tem_emb False) quando o candidato
+    não tem embedding ou a dimensão não bate com a da query.
+    """
+    materialize_embeddings(candidates)
+    M = np.zeros((len(candidates), dim), dtype=np.float32)
+    tem_emb = np.zeros(len(candidates), dtype=bool)
+    for i, c in enumerate(candidates):
+        v = c["_emb_np"]
+        if v is not None and v.size == dim:
+            M[i] = v
+            tem_emb[i] = True
+    return M, tem_emb
+
+
+def tokens_candidato(c: Dict[str, Any]) -> frozenset:
+    """Tokens de resposta_norm (ou pergunta_norm), calculados uma vez e guardados em c["_tokens"]."""
+    tokens = c.get("_tokens")
+    if tokens is None:
+        tokens = c["_tokens"] = frozenset((c.get("resposta_norm") or c.get("pergunta_norm") or "").split())
+    return tokens
+
+
+# CSV de fallback já parseado, por caminho: (mtime, registros, tokens de cada
+# resposta_norm, matriz (N, D) com os embeddings de norma 1). Relido só quando o arquivo muda.
+_CSV_CACHE: Dict[str, Tuple[float, List[Dict[str, Any]], List[frozenset], np.ndarray]] = {}
+
+
+def carregar_csv(csv_path: str) -> Tuple[List[Dict[str, Any]], List[frozenset], np.ndarray]:
+    mtime = os.path.getmtime(csv_path)
+    cache = _CSV_CACHE.get(csv_path)
+    if cache is not None and cache[0] == mtime:
+        return cache[1], cache[2], cache[3]
+    registros = []
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            texto = row.get("resposta") or row.get("answer") or row.get("resposta_texto") or row.get("texto") or ""
+            texto_norm = row.get("texto_normalizado") or normalizar(texto)
+            rec = {
+                "pergunta_id": row.get("id") or row.get("pergunta_id"),
+                "pergunta_texto": row.get("pergunta") or "",
+                "pergunta_norm": row.get("pergunta") or "",
+                "pergunta_embedding": None,
+                "resposta_id": row.get("id") or None,
+                "resposta_texto": texto,
+                "resposta_norm": texto_norm,
+                "resposta_embedding": row.get("embedding") or None
+            }
+            registros.append(rec)
+    materialize_embeddings(registros)
+    # dimensão do primeiro embedding válido; linhas sem embedding (ou de outra dimensão) ficam zeradas
+    dim = next((c["_emb_np"].size for c in registros if c["_emb_np"] is not None), 0)
+    M, _ = stack_embeddings(registros, dim)
+    tokens = [tokens_candidato(c) for c in registros]
+    _CSV_CACHE[csv_path] = (mtime, registros, tokens, M)
+    return registros, tokens, M
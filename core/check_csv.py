@@ -1,15 +1,26 @@
 # core/check_csv.py
-import csv, sys
+# grep nos bytes do CSV (mmap + uma regex só), sem parsear as linhas como CSV
+import mmap, os, re, sys
 path = "data/meus_qna.csv"
 terms = ["senha", "alterar senha", "osso", "maior osso"]
 found = {t: [] for t in terms}
-with open(path, newline="", encoding="utf-8") as f:
-    reader = csv.DictReader(f)
-    for row in reader:
-        txt = (row.get("pergunta") or row.get("resposta") or row.get("texto") or "").lower()
+pat = re.compile(b"|".join(re.escape(t.encode("utf-8")) for t in terms), re.IGNORECASE)
+with open(path, "rb") as f:
+    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(path) else b""
+    fim_linha = -1
+    for m in pat.finditer(mm):
+        if m.start() <= fim_linha:
+            continue  # linha já examinada
+        ini = mm.rfind(b"\n", 0, m.start()) + 1
+        fim_linha = mm.find(b"\n", m.end())
+        if fim_linha == -1:
+            fim_linha = len(mm)
+        txt = mm[ini:fim_linha].decode("utf-8", "replace").strip().lower()
         for t in terms:
             if t in txt:
                 found[t].append(txt[:200])
+    if mm:
+        mm.close()
 for t in terms:
     print(f"=== Termo: {t} -> {len(found[t])} ocorrências ===")
     for ex in found[t][:5]:
@@ -1,6 +1,6 @@
 # compute_embeddings.py
 import argparse
-from banco import inicializar_banco
+from banco import get_conn, migrar_embeddings_para_blob, normalizar_embeddings_salvos
 from embeddings import atualizar_embeddings
 
 def main():
@@ -8,16 +8,18 @@ def main():
     p.add_argument("--tabela", choices=["perguntas", "respostas"], default="perguntas")
     p.add_argument("--batch", type=int, default=64, help="batch size para encoding")
     p.add_argument("--throttle", type=float, default=0.0, help="seconds to sleep between batches")
+    p.add_argument("--migrar-blob", action="store_true", help="preenche as colunas BLOB a partir do JSON antigo e sai")
+    p.add_argument("--normalizar", action="store_true", help="regrava com norma 1 os embeddings JSON antigos e sai")
     args = p.parse_args()
 
-    conn = inicializar_banco()
-    try:
+    with get_conn() as conn:
+        if args.migrar_blob:
+            print(f"{migrar_embeddings_para_blob(conn)} embeddings migrados.")
+            return
+        if args.normalizar:
+            print(f"{normalizar_embeddings_salvos(conn)} embeddings normalizados.")
+            return
         atualizar_embeddings(conn, tabela=args.tabela, batch_size=args.batch, throttle_sec=args.throttle)
-    finally:
-        try:
-            conn.close()
-        except Exception:
-            pass
 
 if __name__ == "__main__":
     main()
@@ -40,30 +40,19 @@ def _default_embedding_func_try_load():
         return None
 
 
-def _cosine_similarity_vec(a: Any, b: Any) -> float:
-    """
-    Similaridade de cosseno robusta. Aceita numpy arrays, listas, etc.
-    Se numpy não estiver disponível, tenta fallback com SequenceMatcher sobre strings (menos preciso).
-    """
-    if _np is not None:
-        try:
-            v1 = _np.array(a, dtype=float)
-            v2 = _np.array(b, dtype=float)
-            n1 = _np.linalg.norm(v1)
-            n2 = _np.linalg.norm(v2)
-            if n1 == 0 or n2 == 0:
-                return 0.0
-            return float(_np.dot(v1, v2) / (n1 * n2))
-        except Exception as e:
-            logger.debug("Erro em cosine np: %s", e)
-            return 0.0
-    # fallback string similarity
+def _vetor_unitario(emb: Any) -> Any:
+    """Converte o embedding para float32 com norma 1 (None se vazio/inválido ou sem numpy)."""
+    if _np is None or emb is None:
+        return None
     try:
-        s1 = str(a)
-        s2 = str(b)
-        return SequenceMatcher(None, s1, s2).ratio()
-    except Exception:
-        return 0.0
+        v = _np.asarray(emb, dtype=_np.float32).ravel()
+        n = float(_np.linalg.norm(v))
+        if not v.size or n == 0.0:
+            return None
+        return v / n
+    except Exception as e:
+        logger.debug("Embedding inválido no contexto: %s", e)
+        return None
 
 
 class GerenciadorContexto:
@@ -84,8 +73,14 @@ class GerenciadorContexto:
         embedding_func: Optional[Callable[[str], Any]] = None,
     ) -> None:
         self._lock = threading.Lock()
-        self.historico: deque[Dict[str, Any]] = deque(maxlen=max(1, int(tamanho_maximo)))
-        self.embeddings: deque[Any] = deque(maxlen=max(1, int(tamanho_maximo)))
+        self._cap = max(1, int(tamanho_maximo))
+        self.historico: deque[Dict[str, Any]] = deque(maxlen=self._cap)
+        # embeddings num buffer circular (cap, D) float32 já normalizado, alinhado com
+        # `historico`: a mensagem i-ésima a partir do fim fica no slot (_head - 1 - i) % cap.
+        # D só é conhecido no primeiro embedding, então a matriz é alocada sob demanda.
+        self._emb_buf: Any = None
+        self._valid: Any = _np.zeros(self._cap, dtype=bool) if _np is not None else None
+        self._head = 0
         self.timeout: timedelta = timedelta(minutes=max(0, int(timeout_minutos)))
         # se não foi passada, tentamos carregar lazy
         if embedding_func is None:
@@ -112,7 +107,7 @@ class GerenciadorContexto:
         with self._lock:
             # limpar contexto se timeout expirou
             if self.ultima_interacao and (agora - self.ultima_interacao) > self.timeout:
-                self.limpar_contexto()
+                self._limpar()
 
             emb_obj = None
             if embedding is not None:
@@ -120,24 +115,45 @@ class GerenciadorContexto:
             else:
                 if callable(self.embedding_func):
                     try:
-                        emb_raw = self.embedding_func(texto)
-                        emb_obj = (_np.array(emb_raw, dtype=float) if (_np is not None and emb_raw is not None) else emb_raw)
+                        emb_obj = self.embedding_func(texto)
                     except Exception as e:
                         logger.debug("Falha ao gerar embedding para contexto: %s", e)
                         emb_obj = None
 
             self.historico.append({"texto": texto, "timestamp": agora, "autor": autor})
-            self.embeddings.append(emb_obj)
+            self._gravar_embedding(_vetor_unitario(emb_obj))
             self.ultima_interacao = agora
 
             logger.debug("Contexto adicionado: %s (autor=%s)", texto[:120], autor)
 
+    def _gravar_embedding(self, v: Any) -> None:
+        """Ocupa o próximo slot do buffer com `v` (vetor unitário ou None). Chamar com _lock."""
+        slot = self._head
+        self._head = (slot + 1) % self._cap
+        if self._valid is None:
+            return
+        self._valid[slot] = False
+        if v is None:
+            return
+        if self._emb_buf is None or self._emb_buf.shape[1] != v.size:
+            # primeira vez (ou modelo trocado): realoca e descarta vetores de outra dimensão
+            self._emb_buf = _np.zeros((self._cap, v.size), dtype=_np.float32)
+            self._valid[:] = False
+        self._emb_buf[slot] = v
+        self._valid[slot] = True
+
+    def _limpar(self) -> None:
+        """Zera histórico e embeddings. Chamar com _lock."""
+        self.historico.clear()
+        if self._valid is not None:
+            self._valid[:] = False
+        self._head = 0
+        self.ultima_interacao = None
+        logger.debug("Contexto limpo por timeout/ação manual.")
+
     def limpar_contexto(self) -> None:
         with self._lock:
-            self.historico.clear()
-            self.embeddings.clear()
-            self.ultima_interacao = None
-            logger.debug("Contexto limpo por timeout/ação manual.")
+            self._limpar()
 
     # -------------------
     # Query / repetição
@@ -166,24 +182,32 @@ class GerenciadorContexto:
         vetor_novo = None
         if callable(self.embedding_func):
             try:
-                emb_raw = self.embedding_func(texto)
-                vetor_novo = (_np.array(emb_raw, dtype=float) if (_np is not None and emb_raw is not None) else emb_raw)
+                vetor_novo = _vetor_unitario(self.embedding_func(texto))
             except Exception as e:
                 logger.debug("Falha ao calcular embedding p/ mensagem_repetida: %s", e)
                 vetor_novo = None
 
         with self._lock:
-            historico_recent = list(self.historico)[-k:] if k > 0 else list(self.historico)
-            emb_recent = list(self.embeddings)[-k:] if k > 0 else list(self.embeddings)
+            n = len(self.historico)
+            n = min(k, n) if k > 0 else n
+            # mais recentes primeiro
+            recentes = [self.historico[-1 - i] for i in range(n)]
+            slots = [(self._head - 1 - i) % self._cap for i in range(n)]
+            scores_emb = None
+            validos = [False] * n
+            if vetor_novo is not None and n and self._emb_buf is not None and self._emb_buf.shape[1] == vetor_novo.size:
+                validos = self._valid[slots].tolist()
+                # cosseno contra as k últimas de uma vez (linhas já normalizadas)
+                scores_emb = (self._emb_buf[slots] @ vetor_novo).tolist()
 
         melhor_sim = 0.0
         melhor_msg = None
 
-        # iterar reverso: compara com as mensagens mais recentes primeiro
-        for msg, emb in zip(reversed(historico_recent), reversed(emb_recent)):
+        # compara com as mensagens mais recentes primeiro (empate fica com a mais recente)
+        for i, msg in enumerate(recentes):
             try:
-                if vetor_novo is not None and emb is not None:
-                    sim = _cosine_similarity_vec(vetor_novo, emb)
+                if validos[i]:
+                    sim = float(scores_emb[i])
                 else:
                     sim = SequenceMatcher(None, texto, msg.get("texto", "")).ratio()
             except Exception:
@@ -193,7 +217,7 @@ class GerenciadorContexto:
                 melhor_msg = msg
 
         # decidir qual threshold usar
-        if (vetor_novo is not None) and any(e is not None for e in emb_recent):
+        if any(validos):
             flag = melhor_sim >= float(thresh_embed)
         else:
             flag = melhor_sim >= float(thresh_texto)
@@ -203,37 +227,34 @@ class GerenciadorContexto:
     # -------------------
     # utilitários de acesso
     # -------------------
+    # Leituras sem lock: tuple(deque) copia o deque numa única operação em C (atômica sob
+    # o GIL do CPython), então cada leitor trabalha sobre um snapshot consistente e não
+    # disputa o _lock com adicionar_mensagem. O lock fica só nas sequências de escrita.
     def obter_contexto(self) -> str:
         """Retorna o histórico formatado (autor: texto), do mais antigo ao mais recente."""
-        with self._lock:
-            return "\n".join(f"{m['autor']}: {m['texto']}" for m in self.historico).strip()
+        return "\n".join(f"{m['autor']}: {m['texto']}" for m in tuple(self.historico)).strip()
 
     def obter_ultimas_mensagens(self, n: int) -> List[Dict[str, Any]]:
-        with self._lock:
-            return list(self.historico)[-max(0, int(n)):] if n > 0 else []
+        return list(tuple(self.historico)[-max(0, int(n)):]) if n > 0 else []
 
     def exportar_historico(self) -> List[Dict[str, Any]]:
-        with self._lock:
-            return list(self.historico)
+        return list(tuple(self.historico))
 
     def obter_mensagem(self, indice: int) -> Optional[Dict[str, Any]]:
-        with self._lock:
-            try:
-                return list(self.historico)[int(indice)]
-            except Exception:
-                return None
+        try:
+            return tuple(self.historico)[int(indice)]
+        except Exception:
+            return None
 
     def obter_mensagem_por_autor(self, autor: str) -> List[Dict[str, Any]]:
-        with self._lock:
-            return [m for m in self.historico if m.get("autor") == autor]
+        return [m for m in tuple(self.historico) if m.get("autor") == autor]
 
     def obter_mensagem_por_data(self, data: datetime) -> List[Dict[str, Any]]:
-        with self._lock:
-            return [m for m in self.historico if m.get("timestamp") and m["timestamp"].date() == data.date()]
+        return [m for m in tuple(self.historico) if m.get("timestamp") and m["timestamp"].date() == data.date()]
 
     def obter_ultima_mensagem(self) -> Optional[Dict[str, Any]]:
-        with self._lock:
-            return self.historico[-1] if self.historico else None
+        snapshot = tuple(self.historico)
+        return snapshot[-1] if snapshot else None
 
     # -------------------
     # persistência simples (JSON)
@@ -266,8 +287,7 @@ class GerenciadorContexto:
             if not isinstance(historico, list):
                 return 0
             with self._lock:
-                self.historico.clear()
-                self.embeddings.clear()
+                self._limpar()
                 for item in historico:
                     txt = item.get("texto") or ""
                     autor = item.get("autor") or "usuario"
@@ -278,7 +298,7 @@ class GerenciadorContexto:
                         ts_dt = None
                     # embedding não é carregado (preserva None) — pode ser recomputado quando necessário
                     self.historico.append({"texto": txt, "timestamp": ts_dt or datetime.now(), "autor": autor})
-                    self.embeddings.append(None)
+                    self._gravar_embedding(None)
                 self.ultima_interacao = datetime.now()
             logger.info("Contexto carregado de %s (%d itens)", caminho_arquivo, len(historico))
             return len(historico)
@@ -0,0 +1,115 @@
+# core/embedding_store.py
+"""
+Cache em disco das matrizes normalizadas de embeddings (uma por tabela), em .npy:
+
+    data/embeddings/<tabela>.f16.npy   (N, D) float16
+    data/embeddings/<tabela>.i8.npy    (N, D) int8 + <tabela>.escala.npy (N,) float32
+    data/embeddings/<tabela>.ids.npy   (N,) int64
+    data/embeddings/<tabela>.impressao.npy  (COUNT, MAX(id)) das linhas com embedding
+
+O banco continua sendo a fonte da verdade; isto só evita recarregar/parsear todas as
+linhas do MySQL a cada processo. Toda escrita de embedding em banco chama remover();
+a impressão pega o que não passa por aqui (restore do banco, escrita de outra máquina).
+"""
+from __future__ import annotations
+
+import os
+import logging
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+STORE_DIR = os.getenv("EMBEDDINGS_STORE_DIR", os.path.join(DATA_DIR, "embeddings"))
+# float16 (padrão), int8 ou off
+STORE_DTYPE = os.getenv("EMBEDDINGS_STORE_DTYPE", "float16").lower()
+
+_SUFIXOS = {"float16": "f16", "int8": "i8"}
+
+
+def quantizar_i8(M: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """int8 simétrico com escala por linha: M ≈ q * escala[:, None] / 127. Aceita (D,) ou (N, D)."""
+    M = np.asarray(M, dtype=np.float32)
+    escala = np.maximum(np.abs(M).max(axis=-1), 1e-12).astype(np.float32)
+    q = np.round(M / escala[..., None] * 127).astype(np.int8)
+    return q, escala
+
+
+def _caminho(tabela: str, parte: str) -> str:
+    return os.path.join(STORE_DIR, f"{tabela}.{parte}.npy")
+
+
+def _salvar_npy(path: str, arr: np.ndarray) -> None:
+    # grava em .tmp e troca atomicamente: leitor nunca vê arquivo pela metade
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        np.save(f, arr)
+    os.replace(tmp, path)
+
+
+def salvar(tabela: str, ids: List[int], M: np.ndarray, impressao: Optional[Sequence[int]] = None) -> None:
+    """Grava (ids, M) quantizados em STORE_DTYPE. M já deve ter linhas com norma 1."""
+    sufixo = _SUFIXOS.get(STORE_DTYPE)
+    if sufixo is None or not len(ids):
+        return
+    try:
+        os.makedirs(STORE_DIR, exist_ok=True)
+        remover(tabela)
+        if sufixo == "i8":
+            q, escala = quantizar_i8(M)
+            _salvar_npy(_caminho(tabela, "escala"), escala)
+            _salvar_npy(_caminho(tabela, sufixo), q)
+        else:
+            _salvar_npy(_caminho(tabela, sufixo), M.astype(np.float16))
+        if impressao is not None:
+            _salvar_npy(_caminho(tabela, "impressao"), np.asarray(impressao, dtype=np.int64))
+        # ids por último: é ele que marca o cache como completo
+        _salvar_npy(_caminho(tabela, "ids"), np.asarray(ids, dtype=np.int64))
+    except Exception as e:
+        logger.warning("Falha ao gravar cache de embeddings (%s): %s", tabela, e)
+
+
+def carregar(tabela: str, impressao: Optional[Sequence[int]] = None) -> Optional[Tuple[List[int], np.ndarray]]:
+    """
+    (ids, M float32 normalizada) do cache em disco, ou None se ausente/inconsistente.
+    Com `impressao`, o cache só vale se foi gravado com a mesma impressão do banco.
+    """
+    sufixo = _SUFIXOS.get(STORE_DTYPE)
+    if sufixo is None or not os.path.exists(_caminho(tabela, "ids")):
+        return None
+    try:
+        if impressao is not None:
+            if not os.path.exists(_caminho(tabela, "impressao")):
+                return None
+            if np.load(_caminho(tabela, "impressao")).tolist() != [int(x) for x in impressao]:
+                return None
+        ids = np.load(_caminho(tabela, "ids"))
+        dados = np.load(_caminho(tabela, sufixo), mmap_mode="r")
+        if dados.ndim != 2 or len(dados) != len(ids):
+            return None
+        M = np.asarray(dados, dtype=np.float32)
+        if sufixo == "i8":
+            escala = np.load(_caminho(tabela, "escala"))
+            M *= escala[:, None] / 127.0
+        # a quantização tira a norma de 1; renormaliza para o cosine continuar um produto escalar
+        M /= np.maximum(np.linalg.norm(M, axis=1, keepdims=True), 1e-12)
+        return ids.tolist(), M
+    except Exception as e:
+        logger.debug("Cache de embeddings (%s) ilegível: %s", tabela, e)
+        return None
+
+
+def remover(tabela: Optional[str] = None) -> None:
+    """Apaga o cache da tabela (ou de todas). Chamado sempre que um embedding muda."""
+    tabelas = (tabela,) if tabela else ("perguntas", "respostas")
+    for t in tabelas:
+        for parte in ("ids", "f16", "i8", "escala", "impressao"):
+            try:
+                os.remove(_caminho(t, parte))
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logger.debug("Falha ao remover %s: %s", _caminho(t, parte), e)
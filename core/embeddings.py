@@ -2,32 +2,115 @@
 from __future__ import annotations
 
 import os
+import math
 import json
 import time
+import queue
+import threading
 import hashlib
 import logging
+from functools import lru_cache
 from typing import List, Optional, Any
 
 import numpy as np
 
 from normalizacao import normalizar
+from config import DATA_DIR
+# gravação dos embeddings e a matriz normalizada em cache ficam no banco (uma cópia só);
+# atualizar_embedding_resposta e carregar_matriz_normalizada seguem exportados daqui
+from banco import (atualizar_embeddings_bulk, atualizar_embedding_resposta,
+                   carregar_matriz_normalizada, invalidar_cache_embeddings)
+
+try:
+    from rapidfuzz import fuzz  # type: ignore
+except Exception:
+    fuzz = None
+
+# orjson é opcional: JSON dos embeddings (listas longas de floats) bem mais rápido
+try:
+    import orjson
+    _json_loads = orjson.loads
+except Exception:
+    orjson = None
+    _json_loads = json.loads
+
+# SimSIMD é opcional: kernels AVX-512/NEON para cosine; sem ele fica tudo em NumPy
+try:
+    import simsimd
+    _HAS_SIMD = True
+except Exception:
+    simsimd = None
+    _HAS_SIMD = False
 
 logger = logging.getLogger(__name__)
 
 # Modelo padrão (pode ajustar)
 MODEL_NAME = os.getenv("EMBEDDING_MODEL", "distiluse-base-multilingual-cased-v1")
 
+# modelo exportado para ONNX (usado no lugar do PyTorch se existir model.onnx aqui):
+#   optimum-cli export onnx --model sentence-transformers/<MODEL_NAME> --library sentence_transformers <dir>
+ONNX_DIR = os.getenv("EMBEDDING_ONNX_DIR", os.path.join(DATA_DIR, "onnx", os.path.basename(MODEL_NAME)))
+
 # lazy-loaded model (pode ser None se não instalado)
 _model = None
 
+class _OnnxEncoder:
+    """Mesmo encode() do SentenceTransformer, rodando o grafo exportado no onnxruntime."""
+
+    def __init__(self, sessao, tokenizer):
+        self.sessao = sessao
+        self.tokenizer = tokenizer
+        self.entradas = {i.name for i in sessao.get_inputs()}
+        saidas = [o.name for o in sessao.get_outputs()]
+        # export com --library sentence_transformers já inclui pooling (+ Dense do distiluse)
+        self.saida = "sentence_embedding" if "sentence_embedding" in saidas else saidas[0]
+
+    def encode(self, textos, batch_size: int = 64, convert_to_numpy: bool = True, show_progress_bar: bool = False):
+        partes = []
+        for i in range(0, len(textos), batch_size):
+            tok = self.tokenizer(list(textos[i:i + batch_size]), padding=True, truncation=True, return_tensors="np")
+            feed = {k: v.astype(np.int64) for k, v in tok.items() if k in self.entradas}
+            out = self.sessao.run([self.saida], feed)[0]
+            if out.ndim == 3:
+                # só o transformer: mean pooling pelos tokens válidos
+                mask = tok["attention_mask"][..., None].astype(np.float32)
+                out = (out * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            partes.append(out.astype(np.float32, copy=False))
+        return np.vstack(partes) if partes else np.zeros((0, 0), dtype=np.float32)
+
+def _load_onnx():
+    caminho = os.path.join(ONNX_DIR, "model.onnx")
+    if not os.path.exists(caminho):
+        return None
+    try:
+        import onnxruntime as ort  # type: ignore
+        from transformers import AutoTokenizer  # type: ignore
+        providers = [p for p in ("CUDAExecutionProvider", "CPUExecutionProvider") if p in ort.get_available_providers()]
+        sessao = ort.InferenceSession(caminho, providers=providers)
+        modelo = _OnnxEncoder(sessao, AutoTokenizer.from_pretrained(ONNX_DIR, use_fast=True))
+        logger.info("Modelo ONNX carregado: %s (%s)", caminho, providers[0])
+        return modelo
+    except Exception as e:
+        logger.warning("Falha ao carregar modelo ONNX em %s; usando SentenceTransformer: %s", caminho, e)
+        return None
+
 def _load_model():
     global _model
+    if _model is not None:
+        return _model
+    _model = _load_onnx()
     if _model is not None:
         return _model
     try:
         from sentence_transformers import SentenceTransformer  # type: ignore
-        _model = SentenceTransformer(MODEL_NAME)
-        logger.info("SentenceTransformer carregado: %s", MODEL_NAME)
+        import torch  # type: ignore
+        device = os.getenv("EMB_DEVICE") or ("cuda" if torch.cuda.is_available() else "cpu")
+        _model = SentenceTransformer(MODEL_NAME, device=device)
+        if device.startswith("cuda"):
+            _model.half()  # fp16: metade do tráfego de memória, usa tensor cores
+        else:
+            torch.set_num_threads(int(os.getenv("EMB_THREADS", min(8, os.cpu_count() or 1))))
+        logger.info("SentenceTransformer carregado: %s (%s)", MODEL_NAME, device)
     except Exception as e:
         _model = None
         logger.warning("SentenceTransformer não disponível: %s", e)
@@ -35,159 +118,335 @@ def _load_model():
 
 def _fallback_embedding(texto: str, dim: int = 384) -> List[float]:
     """
-    Fallback determinístico: usa SHA256 do texto para gerar vetor de dimensão `dim`.
+    Fallback determinístico: usa SHA256 do texto para gerar vetor de dimensão `dim` (norma 1).
     Não é semântico como embedding real, mas é determinístico e rápido (útil offline).
     """
     if texto is None:
         texto = ""
     h = hashlib.sha256(texto.encode("utf-8")).digest()
-    # expandir digest para vetor float no intervalo [-1,1]
-    vals = []
-    i = 0
-    while len(vals) < dim:
-        # use slices de 4 bytes -> uint32 -> normalize
-        chunk = h[i % len(h):(i % len(h)) + 4]
-        if len(chunk) < 4:
-            chunk = chunk.ljust(4, b"\0")
-        num = int.from_bytes(chunk, "big", signed=False)
-        # map num -> float [-1,1]
-        vals.append(((num / 0xFFFFFFFF) * 2.0) - 1.0)
-        i += 4
-    return vals[:dim]
-
-def calcular_embedding(texto: str) -> List[float]:
-    """
-    Retorna embedding em formato list[float].
+    # o digest tem só 8 uint32 (big-endian): converte os 8 para [-1,1] e repete a lista até dim
+    base = (np.frombuffer(h, dtype=">u4") / 0xFFFFFFFF) * 2.0 - 1.0
+    # norma do vetor repetido, sem montá-lo: (dim // 8) cópias inteiras + o pedaço final
+    quad = base * base
+    norma = math.sqrt(float(quad.sum()) * (dim // base.size) + float(quad[:dim % base.size].sum()))
+    if norma > 0.0:
+        base = base / norma
+    base = base.tolist()
+    return (base * -(-dim // len(base)))[:dim]
+
+def calcular_embedding(texto: str, return_numpy: bool = False):
+    """
+    Retorna embedding em formato list[float] (para gravar em JSON), ou ndarray float32
+    com return_numpy=True (caminho de busca: sem converter D floats para objetos Python).
     Tenta usar SentenceTransformer se disponível, caso contrário usa fallback determinístico.
+    Sai sempre com norma 1: o cosseno contra outro embedding vira produto escalar.
     """
     txt = "" if texto is None else str(texto)
     model = _load_model()
     if model is not None:
         try:
-            vec = model.encode([txt], show_progress_bar=False)[0]
-            return list(map(float, vec.tolist() if hasattr(vec, "tolist") else vec))
+            vec = np.asarray(model.encode([txt], convert_to_numpy=True, show_progress_bar=False)[0], dtype=np.float32)
+            vec /= max(float(np.linalg.norm(vec)), 1e-12)
+            return vec if return_numpy else vec.tolist()
         except Exception as e:
             logger.warning("Erro ao gerar embedding com modelo (%s). Usando fallback. Erro: %s", MODEL_NAME, e)
     # fallback
-    return _fallback_embedding(normalizar(txt))
+    vals = _fallback_embedding(normalizar(txt))
+    return np.asarray(vals, dtype=np.float32) if return_numpy else vals
+
+# cache LRU de embeddings de consulta (texto já normalizado): as mesmas perguntas voltam muito
+EMB_CONSULTA_CACHE = int(os.getenv("EMB_CONSULTA_CACHE", "2048"))
+# a cada N consultas registra hits/misses do cache no log (0 desliga)
+EMB_CONSULTA_LOG = int(os.getenv("EMB_CONSULTA_LOG", "1000"))
+
+@lru_cache(maxsize=EMB_CONSULTA_CACHE)
+def _embedding_consulta(texto_norm: str) -> np.ndarray:
+    vec = calcular_embedding(texto_norm, return_numpy=True)
+    vec.setflags(write=False)
+    return vec
+
+def embedding_consulta(texto_norm: str) -> np.ndarray:
+    """
+    calcular_embedding(texto_norm, return_numpy=True) com cache LRU pelo texto normalizado.
+    Devolve uma cópia: quem chama pode alterar o vetor sem sujar o cache.
+    """
+    vec = _embedding_consulta("" if texto_norm is None else str(texto_norm)).copy()
+    if EMB_CONSULTA_LOG > 0:
+        info = _embedding_consulta.cache_info()
+        if (info.hits + info.misses) % EMB_CONSULTA_LOG == 0:
+            logger.info("Cache de embeddings de consulta: hits=%d misses=%d tamanho=%d/%s",
+                        info.hits, info.misses, info.currsize, info.maxsize)
+    return vec
 
 def calcular_embeddings_batch(textos: List[str], batch_size: int = 64) -> List[List[float]]:
     """
-    Batch encode: usa modelo quando possível, senão aplica fallback por item.
+    Batch encode: usa modelo quando possível, senão aplica fallback por item. Vetores com norma 1.
     """
     if not textos:
         return []
     model = _load_model()
     if model is not None:
         try:
-            vectors = model.encode(list(textos), batch_size=batch_size, show_progress_bar=False)
-            out = []
-            for v in vectors:
-                if hasattr(v, "tolist"):
-                    out.append(list(map(float, v.tolist())))
-                else:
-                    out.append(list(map(float, v)))
-            return out
+            # ordena por tamanho para cada batch do modelo ter padding mínimo; desfaz a ordem no fim
+            ordem = sorted(range(len(textos)), key=lambda i: len(textos[i] or ""))
+            vecs = model.encode([textos[i] or "" for i in ordem], batch_size=batch_size,
+                                convert_to_numpy=True, show_progress_bar=False)
+            out = np.empty_like(vecs)
+            out[ordem] = vecs
+            out /= np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-12)
+            return out.tolist()
         except Exception as e:
             logger.warning("Erro batch encoding (%s). Fallback por item. Erro: %s", MODEL_NAME, e)
 
-    # fallback item-a-item
+    # fallback item-a-item. Vetorizar o lote (digests empilhados -> np.tile -> tolist) sai
+    # ~2x mais lento: o tolist cria dim floats por linha, e a lista repetida de
+    # _fallback_embedding reaproveita os 8 floats do digest.
     return [ _fallback_embedding(normalizar(t or "")) for t in textos ]
 
-def atualizar_embeddings(conn, tabela: str = "perguntas", batch_size: int = 64, throttle_sec: float = 0.0):
+def atualizar_embeddings(conn, tabela: str = "perguntas", batch_size: int = 64, throttle_sec: float = 0.0,
+                         commit_every: int = 16):
     """
     Atualiza embeddings no banco para linhas sem embedding (compatível com seu esquema).
-    Gera JSON string para armazenamento.
+    Gera JSON string para armazenamento. Um UPDATE por batch; commit a cada `commit_every` batches e no fim.
     """
     if tabela not in ("perguntas", "respostas"):
         raise ValueError("tabela deve ser 'perguntas' ou 'respostas'")
 
-    cur = conn.cursor()
-    if tabela == "perguntas":
-        cur.execute("SELECT id, texto FROM perguntas WHERE embedding IS NULL OR embedding = ''")
-    else:
-        cur.execute("SELECT id, texto FROM respostas WHERE embedding_resposta IS NULL OR embedding_resposta = ''")
-    rows = cur.fetchall()
+    # keyset: páginas de batch_size linhas por id, em vez de um fetchall de tudo que falta
+    col = "embedding" if tabela == "perguntas" else "embedding_resposta"
+    sql_pagina = (f"SELECT id, texto FROM {tabela} WHERE ({col} IS NULL OR {col} = '') "
+                  f"AND id > %s ORDER BY id LIMIT %s")
+    # conn é compartilhada com a gravadora: leitura de página e UPDATE/commit não podem se cruzar
+    conn_lock = threading.Lock()
+
+    def _pagina(ultimo_id: int) -> list:
+        with conn_lock:
+            cur = conn.cursor()
+            try:
+                cur.execute(sql_pagina, (ultimo_id, batch_size))
+                return cur.fetchall()
+            finally:
+                cur.close()
+
+    rows = _pagina(0)
     if not rows:
         logger.info("Nenhuma linha sem embedding encontrada em %s", tabela)
-        cur.close()
         return
+    logger.info("Processando entradas sem embedding em '%s' (batch %d)", tabela, batch_size)
 
-    ids = []
-    texts = []
-    for r in rows:
-        rid = r[0]
-        txt = r[1] if len(r) > 1 else ""
-        ids.append(rid)
-        texts.append(txt or "")
-
-    total = len(ids)
-    logger.info("Processando %d entradas sem embedding em '%s' (batch %d)", total, tabela, batch_size)
-
-    for start in range(0, total, batch_size):
-        end = min(start + batch_size, total)
-        batch_ids = ids[start:end]
-        batch_texts = texts[start:end]
-        try:
-            batch_embs = calcular_embeddings_batch(batch_texts, batch_size=batch_size)
-        except Exception as e:
-            logger.exception("Erro ao gerar embeddings batch; tentando um-a-um: %s", e)
-            batch_embs = []
-            for t in batch_texts:
-                try:
-                    batch_embs.append(calcular_embedding(t))
-                except Exception:
-                    batch_embs.append(None)
-
-        for rid, emb in zip(batch_ids, batch_embs):
-            if not emb:
-                continue
-            emb_json = json.dumps(emb, ensure_ascii=False)
+    # pipeline de 2 estágios: esta thread codifica o próximo batch enquanto a
+    # gravadora faz o UPDATE/commit do anterior (banco.atualizar_embeddings_bulk, sob conn_lock)
+    fila: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=4)
+
+    def _commit():
+        with conn_lock:
             try:
-                if tabela == "perguntas":
-                    cur.execute("UPDATE perguntas SET embedding = %s WHERE id = %s", (emb_json, rid))
-                else:
-                    cur.execute("UPDATE respostas SET embedding_resposta = %s WHERE id = %s", (emb_json, rid))
+                conn.commit()
+            except Exception:
+                pass
+
+    def _gravar():
+        pendentes = 0
+        while True:
+            item = fila.get()
+            if item is None:
+                if pendentes:
+                    _commit()
+                return
+            start, end, pares = item
+            try:
+                if pares:
+                    with conn_lock:
+                        try:
+                            atualizar_embeddings_bulk(conn, tabela, pares, commit=False)
+                        except Exception as e:
+                            logger.exception("Erro no UPDATE em lote %d-%d; tentando um-a-um: %s", start, end, e)
+                            for rid, emb in pares:
+                                try:
+                                    atualizar_embeddings_bulk(conn, tabela, [(rid, emb)], commit=False)
+                                except Exception as e:
+                                    logger.exception("Erro ao atualizar embedding id=%s: %s", rid, e)
+                pendentes += 1
+                if pendentes >= max(1, commit_every):
+                    _commit()
+                    pendentes = 0
+                logger.info("Batch %d-%d salvo.", start, end)
             except Exception as e:
-                logger.exception("Erro ao atualizar embedding id=%s: %s", rid, e)
-        try:
-            conn.commit()
-        except Exception:
-            pass
-        logger.info("Batch %d-%d salvo.", start, end)
-        if throttle_sec and end < total:
-            time.sleep(throttle_sec)
+                logger.exception("Erro ao gravar batch %d-%d: %s", start, end, e)
+
+    gravadora = threading.Thread(target=_gravar, name="embeddings-writer", daemon=True)
+    gravadora.start()
+    start = 0
+    try:
+        while rows:
+            end = start + len(rows)
+            batch_ids = [r[0] for r in rows]
+            batch_texts = [(r[1] if len(r) > 1 else "") or "" for r in rows]
+            try:
+                batch_embs = calcular_embeddings_batch(batch_texts, batch_size=batch_size)
+            except Exception as e:
+                logger.exception("Erro ao gerar embeddings batch; tentando um-a-um: %s", e)
+                batch_embs = []
+                for t in batch_texts:
+                    try:
+                        batch_embs.append(calcular_embedding(t))
+                    except Exception:
+                        batch_embs.append(None)
 
-    cur.close()
+            fila.put((start, end, [(rid, emb) for rid, emb in zip(batch_ids, batch_embs) if emb]))
+            if len(rows) < batch_size:
+                break
+            if throttle_sec:
+                time.sleep(throttle_sec)
+            start = end
+            rows = _pagina(batch_ids[-1])
+    finally:
+        fila.put(None)
+        gravadora.join()
+
+    # de novo depois do último commit: outra conexão pode ter recarregado a matriz no meio
+    invalidar_cache_embeddings(tabela)
     logger.info("Embeddings atualizados.")
 
-def atualizar_embedding_resposta(conn, resposta_id: int, embedding: List[float]):
-    cur = conn.cursor()
-    emb_json = json.dumps(embedding, ensure_ascii=False)
-    cur.execute("UPDATE respostas SET embedding_resposta = %s WHERE id = %s", (emb_json, resposta_id))
-    try:
-        conn.commit()
-    except Exception:
-        pass
-    cur.close()
+@lru_cache(maxsize=4096)
+def _tokens(texto_norm: str) -> frozenset:
+    """Conjunto de tokens de um texto já normalizado (cacheado: os mesmos textos voltam a cada par)."""
+    return frozenset(texto_norm.split())
 
 def validar_palavra_chave(pergunta: str, resposta: str, limite: int = 70) -> bool:
     """
     Usa rapidfuzz se disponível; se não, fallback simples baseado em token overlap.
     """
+    p_norm = normalizar(pergunta or "")
+    r_norm = normalizar(resposta or "")
+    if fuzz is not None:
+        return fuzz.token_set_ratio(p_norm, r_norm) >= limite
+    # fallback simples: proporção de tokens em comum
+    q = _tokens(p_norm)
+    if not q:
+        return False
+    score = (len(q & _tokens(r_norm)) / len(q)) * 100.0
+    return score >= limite
+
+def parse_embedding(emb: Any) -> Optional[np.ndarray]:
+    """
+    Embedding de uma coluna/campo como ndarray float32 (None se vazio/inválido): aceita
+    lista/tupla/ndarray, texto JSON ("[0.1, ...]") ou números separados por vírgula.
+    """
+    if emb is None:
+        return None
+    if isinstance(emb, (list, tuple, np.ndarray)):
+        try:
+            v = np.asarray(emb, dtype=np.float32)
+            return v if v.size else None
+        except Exception:
+            return None
+    if isinstance(emb, str):
+        s = emb.strip().strip('"').strip()
+        # JSON só quando tem cara de lista JSON; "1,2,3" vai direto para o split, sem
+        # pagar uma tentativa de JSON que vai falhar
+        if s.startswith("[") and s.endswith("]"):
+            try:
+                parsed = _json_loads(s)
+                if isinstance(parsed, (list, tuple)):
+                    v = np.asarray(parsed, dtype=np.float32)
+                    return v if v.size else None
+            except Exception:
+                pass
+        try:
+            # o NumPy converte as strings direto para float32, sem um float Python por item
+            v = np.array(s.strip("[] \t\n").split(","), dtype=np.float32)
+            return v if v.size else None
+        except Exception:
+            logger.debug("Falha ao parsear embedding (prefix): %s", emb[:80])
+            return None
+    return None
+
+def vetor_unitario(vec: Any) -> Optional[np.ndarray]:
+    """
+    Vetor float32 com norma 1 (None se vazio/nulo/inválido).
+    Normalize a query uma vez por turno e use cosine_similarity_unit contra os candidatos.
+    """
+    if vec is None:
+        return None
     try:
-        from rapidfuzz import fuzz  # type: ignore
-        score = fuzz.token_set_ratio(normalizar(pergunta or ""), normalizar(resposta or ""))
-        return score >= limite
-    except Exception:
-        # fallback simples: proporção de tokens em comum
-        q = set(normalizar(pergunta or "").split())
-        a = set(normalizar(resposta or "").split())
-        if not q:
-            return False
-        inter = q.intersection(a)
-        score = (len(inter) / max(1, len(q))) * 100.0
-        return score >= limite
+        v = np.asarray(vec, dtype=np.float32)
+        n = float(np.linalg.norm(v))
+        if not v.size or n == 0.0:
+            return None
+        return v / n
+    except Exception as e:
+        logger.debug("Erro vetor_unitario: %s", e)
+        return None
+
+def _simd_ok(v: Any) -> bool:
+    return isinstance(v, np.ndarray) and v.ndim == 1 and v.dtype == np.float32 and v.flags.c_contiguous
+
+def cosine_topk(query: Any, matriz: Any, k: int = 5):
+    """
+    Top-k por cosine de `query` contra as linhas de `matriz` (N, D).
+    Retorna (indices, scores) do maior para o menor. Usa simsimd.cdist quando disponível.
+    """
+    q = np.ascontiguousarray(query, dtype=np.float32).ravel()
+    M = np.ascontiguousarray(matriz, dtype=np.float32)
+    if M.ndim != 2 or not len(M) or k <= 0:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float32)
+    if _HAS_SIMD:
+        scores = 1.0 - np.asarray(simsimd.cdist(q[None, :], M, metric="cosine"), dtype=np.float32).ravel()
+    else:
+        denom = np.sqrt(np.einsum("ij,ij->i", M, M) * float(np.vdot(q, q)))
+        scores = (M @ q) / np.maximum(denom, 1e-12)
+    k = min(k, len(scores))
+    idx = np.argpartition(-scores, k - 1)[:k]
+    idx = idx[np.argsort(-scores[idx])]
+    return idx, scores[idx]
+
+def pontuar_lote(query_vec: Any, matriz_norm: np.ndarray) -> np.ndarray:
+    """
+    Cosine de `query_vec` contra todas as linhas de `matriz_norm` (N, D), já normalizadas:
+    uma multiplicação matriz-vetor em vez de N chamadas a cosine_similarity
+    (simsimd.cdist "dot" quando disponível). Dimensão incompatível (ou query nula) dá scores zerados.
+    """
+    n = len(matriz_norm)
+    q = vetor_unitario(query_vec)
+    if q is None or not n or matriz_norm.ndim != 2 or matriz_norm.shape[1] != q.size:
+        return np.zeros(n, dtype=np.float32)
+    if _HAS_SIMD and matriz_norm.dtype == np.float32 and matriz_norm.flags.c_contiguous:
+        try:
+            return np.asarray(simsimd.cdist(q[None, :], matriz_norm, metric="dot"), dtype=np.float32).ravel()
+        except Exception as e:
+            logger.debug("simsimd.cdist falhou; usando NumPy: %s", e)
+    return matriz_norm @ q
+
+def indices_top_k(scores: np.ndarray, k: Optional[int] = None) -> np.ndarray:
+    """
+    Índices dos k maiores scores em ordem decrescente (todos, com k None), iguais aos
+    primeiros k de um sort estável: seleção parcial em vez de ordenar os N.
+    """
+    s = -np.asarray(scores)
+    if k is None or k >= len(s):
+        return np.argsort(s, kind="stable")
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    # corte no k-ésimo score; empates no corte ficam com os de menor índice, como no sort estável
+    corte = np.partition(s, k - 1)[k - 1]
+    acima = np.flatnonzero(s < corte)
+    idx = np.concatenate((acima, np.flatnonzero(s == corte)[:k - len(acima)]))
+    return idx[np.argsort(s[idx], kind="stable")]
+
+def cosine_similarity_unit(q_hat: Optional[np.ndarray], vec2: Any) -> float:
+    """Cosine entre uma query já normalizada (vetor_unitario) e um vetor qualquer."""
+    if q_hat is None:
+        return 0.0
+    try:
+        v2 = vec2 if isinstance(vec2, np.ndarray) else np.asarray(vec2, dtype=np.float32)
+        d2 = float(np.vdot(v2, v2))
+        if d2 == 0.0:
+            return 0.0
+        return float(np.dot(q_hat, v2)) / math.sqrt(d2)
+    except Exception as e:
+        logger.debug("Erro cosine_similarity_unit: %s", e)
+        return 0.0
 
 def cosine_similarity(vec1: Any, vec2: Any) -> float:
     """
@@ -195,13 +454,16 @@ def cosine_similarity(vec1: Any, vec2: Any) -> float:
     Aceita listas, numpy arrays, etc.
     """
     try:
-        v1 = np.array(vec1, dtype=float)
-        v2 = np.array(vec2, dtype=float)
-        n1 = np.linalg.norm(v1)
-        n2 = np.linalg.norm(v2)
-        if n1 == 0 or n2 == 0:
+        # ndarray entra sem cópia; listas viram float32 (metade da banda de float64)
+        v1 = vec1 if isinstance(vec1, np.ndarray) else np.asarray(vec1, dtype=np.float32)
+        v2 = vec2 if isinstance(vec2, np.ndarray) else np.asarray(vec2, dtype=np.float32)
+        if _HAS_SIMD and _simd_ok(v1) and _simd_ok(v2) and v1.size == v2.size:
+            return 1.0 - float(simsimd.cosine(v1, v2))
+        # um produto escalar por norma ao quadrado e um sqrt só (em vez de dois np.linalg.norm)
+        denom = float(np.vdot(v1, v1)) * float(np.vdot(v2, v2))
+        if denom == 0.0:
             return 0.0
-        return float(np.dot(v1, v2) / (n1 * n2))
+        return float(np.dot(v1, v2)) / math.sqrt(denom)
     except Exception as e:
         logger.debug("Erro cosine_similarity: %s", e)
         return 0.0
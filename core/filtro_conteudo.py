@@ -5,12 +5,16 @@ import os
 import json
 import re
 import logging
-from typing import Set
+from functools import lru_cache
+from typing import FrozenSet, Set
 
 from config import DATA_DIR
 
 logger = logging.getLogger(__name__)
 
+_WS_RE = re.compile(r"\s+")
+_SENT_SPLIT_RE = re.compile(r"(?<=[.!?])\s+")
+
 # caminho padrão do arquivo de palavras proibidas
 _ARQUIVO_PALAVRAS_PROIBIDAS = os.path.join(DATA_DIR, "palavras_proibidas.json")
 
@@ -31,17 +35,36 @@ def carregar_palavras_proibidas(path: str | None = None) -> Set[str]:
         logger.exception("Falha ao carregar palavras proibidas: %s", e)
         return set()
 
+def _compilar_palavras(voc) -> re.Pattern | None:
+    """Uma regex só: \b(?:p1|p2|...)\b, palavras mais longas primeiro."""
+    palavras = sorted((re.escape(p) for p in voc if p), key=len, reverse=True)
+    if not palavras:
+        return None
+    return re.compile(r"\b(?:" + "|".join(palavras) + r")\b", re.UNICODE)
+
+@lru_cache(maxsize=8)
+def _regex_palavras(voc: FrozenSet[str]) -> re.Pattern | None:
+    return _compilar_palavras(voc)
+
 # cache simples
 PALAVRAS_PROIBIDAS = carregar_palavras_proibidas()
+_PALAVRAS_RE = _compilar_palavras(PALAVRAS_PROIBIDAS)
 
 # --- tradução (opcional) ---
-# Tentamos usar googletrans se instalado; se não, a função traduzir retorna o texto original.
-try:
-    from googletrans import Translator  # type: ignore
-    _translator = Translator()
-except Exception:
-    _translator = None
-    logger.debug("googletrans não disponível; tradução desativada.")
+# googletrans (se instalado) só é importado/instanciado na primeira tradução;
+# sem ele, ou com ENABLE_TRANSLATE=0, a função traduzir retorna o texto original.
+ENABLE_TRANSLATE = os.getenv("ENABLE_TRANSLATE", "1") == "1"
+
+@lru_cache(maxsize=1)
+def _get_translator():
+    if not ENABLE_TRANSLATE:
+        return None
+    try:
+        from googletrans import Translator  # type: ignore
+        return Translator()
+    except Exception:
+        logger.debug("googletrans não disponível; tradução desativada.")
+        return None
 
 def traduzir_para_pt_func(texto: str) -> str:
     """
@@ -50,6 +73,7 @@ def traduzir_para_pt_func(texto: str) -> str:
     """
     if not texto:
         return texto
+    _translator = _get_translator()
     if _translator is None:
         return texto
     try:
@@ -62,15 +86,23 @@ def traduzir_para_pt_func(texto: str) -> str:
         logger.debug("Falha tradução (continuando sem traduzir): %s", e)
     return texto
 
-# --- sumarização (opcional, usa sumy se disponível) ---
-try:
-    from sumy.parsers.plaintext import PlaintextParser  # type: ignore
-    from sumy.nlp.tokenizers import Tokenizer  # type: ignore
-    from sumy.summarizers.lex_rank import LexRankSummarizer  # type: ignore
-    _HAS_SUMY = True
-except Exception:
-    _HAS_SUMY = False
-    logger.debug("sumy não disponível; resumir_texto usará fallback simples.")
+# --- sumarização (opcional, usa sumy se disponível; ENABLE_SUMY=0 desliga) ---
+# import adiado para o primeiro resumo: sumy/nltk pesam no startup
+ENABLE_SUMY = os.getenv("ENABLE_SUMY", "1") == "1"
+
+@lru_cache(maxsize=1)
+def _get_sumy():
+    """(PlaintextParser, Tokenizer, LexRankSummarizer) ou None."""
+    if not ENABLE_SUMY:
+        return None
+    try:
+        from sumy.parsers.plaintext import PlaintextParser  # type: ignore
+        from sumy.nlp.tokenizers import Tokenizer  # type: ignore
+        from sumy.summarizers.lex_rank import LexRankSummarizer  # type: ignore
+        return PlaintextParser, Tokenizer, LexRankSummarizer
+    except Exception:
+        logger.debug("sumy não disponível; resumir_texto usará fallback simples.")
+        return None
 
 def resumir_texto(texto: str, sentencas: int = 2) -> str:
     """
@@ -78,7 +110,9 @@ def resumir_texto(texto: str, sentencas: int = 2) -> str:
     """
     if not texto:
         return texto
-    if _HAS_SUMY:
+    sumy = _get_sumy()
+    if sumy is not None:
+        PlaintextParser, Tokenizer, LexRankSummarizer = sumy
         try:
             parser = PlaintextParser.from_string(texto, Tokenizer("portuguese"))
             summarizer = LexRankSummarizer()
@@ -87,7 +121,7 @@ def resumir_texto(texto: str, sentencas: int = 2) -> str:
         except Exception as e:
             logger.debug("sumy falhou em resumir, fallback: %s", e)
     # Fallback: pegar as primeiras N sentenças básicas
-    sentences = re.split(r'(?<=[.!?])\s+', texto.strip())
+    sentences = _SENT_SPLIT_RE.split(texto.strip())
     return " ".join(sentences[:sentencas]).strip()
 
 def contem_conteudo_inadequado(texto: str, palavras_proibidas: set | None = None) -> bool:
@@ -97,17 +131,17 @@ def contem_conteudo_inadequado(texto: str, palavras_proibidas: set | None = None
     """
     if not texto:
         return False
-    voc = palavras_proibidas if palavras_proibidas is not None else PALAVRAS_PROIBIDAS
-    if not voc:
+    if palavras_proibidas is None:
+        padrao = _PALAVRAS_RE
+    else:
+        padrao = _regex_palavras(frozenset(palavras_proibidas)) if palavras_proibidas else None
+    if padrao is None:
         return False
-    texto_lower = texto.lower()
-    for palavra in voc:
-        if not palavra:
-            continue
-        # busca por palavra inteira
-        if re.search(rf"\b{re.escape(palavra)}\b", texto_lower, flags=re.UNICODE):
-            logger.info("Conteúdo bloqueado pela palavra proibida: %s", palavra)
-            return True
+    # uma passada pelo texto com todas as palavras (palavra inteira)
+    m = padrao.search(texto.lower())
+    if m:
+        logger.info("Conteúdo bloqueado pela palavra proibida: %s", m.group(0))
+        return True
     return False
 
 def processar_texto(texto: str, max_len: int = 500, sentencas_resumo: int = 2) -> str:
@@ -117,7 +151,7 @@ def processar_texto(texto: str, max_len: int = 500, sentencas_resumo: int = 2) -
     """
     if texto is None:
         return ""
-    txt = re.sub(r"\s+", " ", texto).strip()
+    txt = _WS_RE.sub(" ", texto).strip()
     if contem_conteudo_inadequado(txt):
         return "Desculpe, não posso exibir esse conteúdo."
     if len(txt) > max_len:
@@ -4,6 +4,7 @@ from __future__ import annotations
 import os
 import csv
 import json
+import time
 import logging
 import threading
 from datetime import datetime, timedelta
@@ -14,10 +15,24 @@ from normalizacao import normalizar
 from banco import (
     adicionar_memoria,
     listar_memorias,
+    listar_memorias_filtradas,
     remover_memoria_por_id,
     editar_memoria,
 )
 
+try:
+    from rapidfuzz import fuzz, process  # type: ignore
+except Exception:
+    fuzz = process = None
+
+# dateparser (opcional): um parser pt reaproveitado; dateparser.parse(..., languages=...)
+# monta um DateDataParser novo (e recarrega o locale) a cada chamada
+try:
+    import dateparser  # type: ignore
+    _date_parser = dateparser.DateDataParser(languages=["pt"])
+except Exception:
+    dateparser = _date_parser = None
+
 logger = logging.getLogger(__name__)
 os.makedirs(LOG_DIR, exist_ok=True)
 
@@ -33,8 +48,7 @@ def _parse_date_input(date_input: str) -> Optional[str]:
     date_input = date_input.strip()
     # tentativa com dateparser (opcional)
     try:
-        import dateparser
-        dt = dateparser.parse(date_input, languages=['pt'])
+        dt = _date_parser.get_date_data(date_input)["date_obj"] if _date_parser is not None else None
         if dt:
             # padroniza: sempre incluir horas
             if dt.hour == 0 and dt.minute == 0 and "h" not in date_input and ":" not in date_input:
@@ -231,8 +245,7 @@ def listar_memorias_interativa(conn) -> None:
         listar_e_mostrar(conn, t)
     elif opcao == "3":
         tag = input("Tag (ex: escola): ").strip().lower()
-        memorias = listar_memorias(conn, None)
-        filtradas = [m for m in memorias if len(m) > 6 and m[6] and tag in str(m[6]).lower()]
+        filtradas = listar_memorias_filtradas(conn, tag=tag) if tag else []
         if not filtradas:
             print("Nenhuma memória com essa tag.")
             return
@@ -246,17 +259,7 @@ def listar_memorias_interativa(conn) -> None:
             dias_i = 7
         agora = datetime.now()
         limite = agora + timedelta(days=dias_i)
-        memorias = listar_memorias(conn, None)
-        proximas = []
-        for m in memorias:
-            data = m[3] if len(m) > 3 else None
-            try:
-                if data:
-                    dt = datetime.strptime(str(data)[:19], "%Y-%m-%d %H:%M:%S")
-                    if agora <= dt <= limite:
-                        proximas.append(m)
-            except Exception:
-                continue
+        proximas = listar_memorias_filtradas(conn, date_from=agora, date_to=limite)
         if not proximas:
             print("Nenhuma memória nos próximos dias.")
             return
@@ -265,22 +268,14 @@ def listar_memorias_interativa(conn) -> None:
     elif opcao == "5":
         q = input("Digite termo de busca: ").strip().lower()
         memorias = listar_memorias(conn, None)
-        encontrados = []
-        # tenta fuzzy com rapidfuzz se disponível
-        try:
-            from rapidfuzz import fuzz
-            for m in memorias:
-                texto = " ".join([str(x) for x in m[2:6] if x])
-                score = fuzz.partial_ratio(q, texto.lower())
-                if score >= 60:
-                    encontrados.append((score, m))
-            encontrados.sort(key=lambda t: t[0], reverse=True)
-            encontrados = [m for _, m in encontrados]
-        except Exception:
-            for m in memorias:
-                texto = " ".join([str(x) for x in m[2:6] if x]).lower()
-                if q in texto:
-                    encontrados.append(m)
+        textos = [" ".join([str(x) for x in m[2:6] if x]).lower() for m in memorias]
+        # fuzzy com rapidfuzz se disponível: todas as linhas numa chamada só (loop em C)
+        if process is not None:
+            hits = process.extract(q, textos, scorer=fuzz.partial_ratio, processor=None,
+                                   score_cutoff=60, limit=None)
+            encontrados = [memorias[idx] for _, _, idx in hits]
+        else:
+            encontrados = [m for m, texto in zip(memorias, textos) if q in texto]
         if not encontrados:
             print("Nenhuma memória encontrada.")
             return
@@ -377,7 +372,6 @@ def agendar_verificacao_periodica(conn, intervalo_minutos: int = 60, dias_a_fren
             except Exception as e:
                 logger.error("Erro no agendamento de verificação: %s", e)
             finally:
-                import time
                 time.sleep(max(1, intervalo_minutos) * 60)
     t = threading.Thread(target=_loop, daemon=True)
     t.start()
@@ -6,17 +6,20 @@ import re
 import json
 import csv
 import logging
-import unicodedata
 import math
-from datetime import date, datetime
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from datetime import datetime
 from typing import Any, List, Optional, Tuple, Dict
 
 import numpy as np
 
 from config import LOG_DIR
-from normalizacao import normalizar, humanize_text
-from embeddings import calcular_embedding, cosine_similarity
-from banco import buscar_respostas_com_embedding
+from normalizacao import normalizar, humanize_text, remover_acentos
+from embeddings import embedding_consulta, indices_top_k, parse_embedding, pontuar_lote, vetor_unitario
+from candidatos import carregar_csv, materialize_embeddings, stack_embeddings, tokens_candidato
+import banco as banco_mod
+from banco import buscar_respostas_com_embedding, buscar_respostas_top_k, consultar_preparado
 
 logger = logging.getLogger(__name__)
 
@@ -28,11 +31,20 @@ SQL_LIMIT = int(os.environ.get("PIPELINE_SQL_LIMIT", "80"))
 EMB_WEIGHT_DEFAULT = float(os.environ.get("PIPELINE_EMB_WEIGHT", "0.75"))
 KW_WEIGHT_DEFAULT = 1.0 - EMB_WEIGHT_DEFAULT
 EMB_THRESHOLD_FALLBACK = float(os.environ.get("PIPELINE_EMB_THRESHOLD", "0.62"))
+# quantas respostas mais próximas por embedding entram como candidatas (top-k na matriz em cache)
+EMB_TOP_K = int(os.environ.get("PIPELINE_EMB_TOPK", "50"))
 
 # -----------------------
 # Helpers de query / texto (originais + pipeline)
 # -----------------------
+# variável global do servidor (só muda com restart): lida uma vez por processo
+_ft_min_word_len: Optional[int] = None
+
+
 def _get_ft_min_word_len(conn, default: int = 4) -> int:
+    global _ft_min_word_len
+    if _ft_min_word_len is not None:
+        return _ft_min_word_len
     try:
         cur = conn.cursor()
         cur.execute("SHOW VARIABLES LIKE 'ft_min_word_len'")
@@ -42,7 +54,8 @@ def _get_ft_min_word_len(conn, default: int = 4) -> int:
         except Exception:
             pass
         if row and len(row) >= 2:
-            return int(row[1])
+            _ft_min_word_len = int(row[1])
+            return _ft_min_word_len
     except Exception as e:
         logger.debug("Não foi possível obter ft_min_word_len: %s", e)
     return default
@@ -75,6 +88,27 @@ def _parse_keywords_field(kws_field: Any) -> List[str]:
     return []
 
 
+@lru_cache(maxsize=int(os.getenv("KW_CACHE_CAP", "16384")))
+def _keywords_texto(kws_field: str) -> frozenset:
+    # cacheado pelo próprio valor da coluna: keywords regravadas (keywords_seed) viram outra chave
+    try:
+        return frozenset(_parse_keywords_field(kws_field))
+    except TypeError:
+        return frozenset()
+
+
+def _keywords_conjunto(kws_field: Any) -> frozenset:
+    """Keywords de uma linha como frozenset; o JSON de cada valor distinto é decodificado uma vez só."""
+    if not kws_field:
+        return frozenset()
+    if isinstance(kws_field, str):
+        return _keywords_texto(kws_field)
+    try:
+        return frozenset(_parse_keywords_field(kws_field))
+    except TypeError:
+        return frozenset()
+
+
 def _keyword_overlap_score(q_kws: List[str], cand_kws: List[str]) -> float:
     if not q_kws or not cand_kws:
         return 0.0
@@ -87,34 +121,13 @@ def _keyword_overlap_score(q_kws: List[str], cand_kws: List[str]) -> float:
 # Embedding parsing/pick
 # -----------------------
 
-def _parse_embedding(emb_str: Any) -> Optional[np.ndarray]:
-    if not emb_str:
-        return None
-    # pode ser JSON string, lista, ou string com vírgulas
-    if isinstance(emb_str, (list, tuple)):
-        try:
-            return np.array(list(map(float, emb_str)), dtype=float)
-        except Exception:
-            return None
-    if isinstance(emb_str, str):
-        try:
-            parsed = json.loads(emb_str)
-            if isinstance(parsed, (list, tuple)):
-                return np.array(list(map(float, parsed)), dtype=float)
-        except Exception:
-            pass
-        try:
-            parts = [p for p in emb_str.replace("[", "").replace("]", "").split(",") if p.strip()]
-            return np.array(list(map(float, parts)), dtype=float)
-        except Exception:
-            logger.debug("Falha ao parsear embedding (prefix): %s", (emb_str[:80] if emb_str else ""))
-            return None
-    return None
-
-
 def _pick_vector_from_row(row: dict) -> Optional[np.ndarray]:
+    """Vetor do candidato com norma 1: o BLOB float32 (gravado já normalizado) ou o JSON legado normalizado aqui."""
+    binario = row.get("resposta_embedding_bin")
+    if binario:
+        return np.frombuffer(binario, dtype=np.float32)
     emb_field = row.get("resposta_embedding") or row.get("embedding_resposta") or row.get("pergunta_embedding") or row.get("embedding")
-    return _parse_embedding(emb_field)
+    return vetor_unitario(parse_embedding(emb_field))
 
 # -----------------------
 # Conexão
@@ -128,8 +141,9 @@ def _ensure_connection(conn):
     if _is_connection_obj(conn):
         return conn, False
     try:
-        from core import banco as banco_mod
-        init = getattr(banco_mod, "inicializar_banco", None)
+        # o mesmo módulo `banco` dos imports acima: um pool só por processo (importar
+        # core.banco criaria uma segunda cópia do módulo, com outro pool e outros caches)
+        init = getattr(banco_mod, "obter_conexao", None)
         if callable(init):
             c = init()
             if _is_connection_obj(c):
@@ -145,7 +159,7 @@ _RE_NUMBER = re.compile(r"\d+(?:[.,]\d+)?", flags=re.UNICODE)
 
 
 def strip_accents(s: str) -> str:
-    return ''.join(c for c in unicodedata.normalize('NFD', s) if unicodedata.category(c) != 'Mn')
+    return remover_acentos(s)
 
 
 # num2words é opcional — se não existir mantemos retorno numérico simples
@@ -155,6 +169,8 @@ except Exception:
     num2words = None
 
 
+# as respostas repetem os mesmos números: num2words (Python puro) roda uma vez por token
+@lru_cache(maxsize=8192)
 def number_to_words_simple(token: str) -> str:
     t = token.replace(",", ".")
     try:
@@ -184,48 +200,64 @@ def numbers_to_words_in_text(text: str) -> str:
     return _RE_NUMBER.sub(_repl, text)
 
 
+_RE_PALAVRA = re.compile(r"\w+")
+# "só"/"apenas"/"somente" + o campo pedido, por palavra inteira (substring casava "so"
+# dentro de "isso", "pessoa"...)
+_MARCAS_SO = frozenset({"so", "apenas", "somente"})
+_CAMPOS_PEDIDO = (
+    ("data", frozenset({"data", "datas"})),
+    ("numero", frozenset({"numero", "numeros", "nº"})),
+    ("nome", frozenset({"nome", "nomes"})),
+    ("preco", frozenset({"preco", "precos", "valor", "valores"})),
+)
+
+
 def user_requests_only_field(question: str) -> Optional[str]:
-    q = strip_accents((question or "").lower())
+    q_tokens = frozenset(_RE_PALAVRA.findall(strip_accents((question or "").lower())))
 
-    if not any(w in q for w in ("so", "apenas", "somente")):
+    if q_tokens.isdisjoint(_MARCAS_SO):
         return None
-    if "data" in q:
-        return "data"
-    if "numero" in q or "nº" in q:
-        return "numero"
-    if "nome" in q:
-        return "nome"
-    if "preco" in q or "preço" in q or "valor" in q:
-        return "preco"
+    for campo, palavras in _CAMPOS_PEDIDO:
+        if not q_tokens.isdisjoint(palavras):
+            return campo
     return None
 
 
+# padrões de extract_field_from_text, compilados uma vez
+_RE_DATA_DMA = re.compile(r"\b\d{1,2}[/-]\d{1,2}[/-]\d{2,4}\b")
+_RE_DATA_AMD = re.compile(r"\b\d{4}[/-]\d{1,2}[/-]\d{1,2}\b")
+_RE_DATA_EXTENSO = re.compile(r"\b\d{1,2}\s+de\s+\w{3,}\s+de\s+\d{4}\b", re.IGNORECASE)
+_RE_PRECO_RS = re.compile(r"R\$\s*\d+(?:[.,]\d+)?")
+_RE_PRECO = re.compile(r"\d+(?:[.,]\d+)?\s*(reais|rs|r\$)?", re.IGNORECASE)
+_RE_NOME = re.compile(r"\b([A-ZÀ-Ý][a-zà-ÿ]{1,}\s?){1,4}\b")
+
+
 def extract_field_from_text(field: str, text: str) -> Optional[str]:
     if not text:
         return None
     t = text
 
     if field == "data":
-        m = re.search(r"\b\d{1,2}[/-]\d{1,2}[/-]\d{2,4}\b", t)
+        m = _RE_DATA_DMA.search(t)
         if m:
             return m.group(0)
-        m = re.search(r"\b\d{4}[/-]\d{1,2}[/-]\d{1,2}\b", t)
+        m = _RE_DATA_AMD.search(t)
         if m:
             return m.group(0)
-        m = re.search(r"\b\d{1,2}\s+de\s+\w{3,}\s+de\s+\d{4}\b", t, flags=re.IGNORECASE)
+        m = _RE_DATA_EXTENSO.search(t)
         if m:
             return m.group(0)
         return None
 
     if field == "numero":
-        m = re.search(r"\d+(?:[.,]\d+)?", t)
+        m = _RE_NUMBER.search(t)
         return m.group(0) if m else None
 
     if field == "preco":
-        m = re.search(r"R\$\s*\d+(?:[.,]\d+)?", t)
+        m = _RE_PRECO_RS.search(t)
         if m:
             return m.group(0)
-        m = re.search(r"\d+(?:[.,]\d+)?\s*(reais|rs|r\$)?", t, flags=re.IGNORECASE)
+        m = _RE_PRECO.search(t)
         return m.group(0) if m else None
 
     if field == "nome":
@@ -234,7 +266,7 @@ def extract_field_from_text(field: str, text: str) -> Optional[str]:
             first = lines[0]
             if len(first.split()) <= 6:
                 return first
-        m = re.search(r"\b([A-ZÀ-Ý][a-zà-ÿ]{1,}\s?){1,4}\b", t)
+        m = _RE_NOME.search(t)
         if m:
             return m.group(0).strip()
         return None
@@ -245,151 +277,175 @@ def extract_field_from_text(field: str, text: str) -> Optional[str]:
 # DB search (LIKE param)
 # -----------------------
 
+# colunas de candidato que sql_search devolve (na ordem do SELECT)
+_CAMPOS_CANDIDATO = ["pergunta_id", "pergunta_texto", "pergunta_norm", "pergunta_embedding",
+                     "resposta_id", "resposta_texto", "resposta_norm", "resposta_embedding"]
+
+_SELECT_CANDIDATO = """
+  p.id AS pergunta_id,
+  p.texto AS pergunta_texto,
+  p.texto_normalizado AS pergunta_norm,
+  p.embedding AS pergunta_embedding,
+  r.id AS resposta_id,
+  r.texto AS resposta_texto,
+  r.texto_normalizado AS resposta_norm,
+  r.embedding_resposta AS resposta_embedding
+FROM perguntas p
+LEFT JOIN respostas r ON p.resposta_id = r.id
+"""
+
+# consulta FULLTEXT (p/ perguntas e respostas). Se algum MATCH não tiver FT index
+# o execute pode lançar, daí caímos no LIKE.
+_SQL_FULLTEXT = """
+SELECT""" + _SELECT_CANDIDATO + """WHERE
+  MATCH(p.texto_normalizado) AGAINST (%s IN BOOLEAN MODE)
+  OR MATCH(r.texto_normalizado) AGAINST (%s IN BOOLEAN MODE)
+ORDER BY GREATEST(
+  IFNULL(MATCH(p.texto_normalizado) AGAINST (%s IN BOOLEAN MODE), 0),
+  IFNULL(MATCH(r.texto_normalizado) AGAINST (%s IN BOOLEAN MODE), 0)
+) DESC
+LIMIT %s
+"""
+
+_SQL_LIKE = """
+SELECT""" + _SELECT_CANDIDATO + """WHERE p.texto_normalizado LIKE %s OR r.texto_normalizado LIKE %s
+LIMIT %s
+"""
+
+# as duas buscas fulltext do find_answer (+token* ordenada por relevância e +token sem
+# ordem) numa ida ao banco só; `src` diz de qual ramo veio cada linha. A ordem de um
+# ramo não sobrevive ao UNION, daí a relevância de volta no ORDER BY de fora.
+_SQL_FULLTEXT_UNIAO = """
+(SELECT 'sql' AS src,
+  p.id, p.texto, p.texto_normalizado, p.embedding,
+  r.id, r.texto, r.texto_normalizado, r.embedding_resposta,
+  GREATEST(
+    IFNULL(MATCH(p.texto_normalizado) AGAINST (%s IN BOOLEAN MODE), 0),
+    IFNULL(MATCH(r.texto_normalizado) AGAINST (%s IN BOOLEAN MODE), 0)
+  ) AS relevancia
+FROM perguntas p
+LEFT JOIN respostas r ON p.resposta_id = r.id
+WHERE
+  MATCH(p.texto_normalizado) AGAINST (%s IN BOOLEAN MODE)
+  OR MATCH(r.texto_normalizado) AGAINST (%s IN BOOLEAN MODE)
+ORDER BY relevancia DESC
+LIMIT %s)
+UNION ALL
+(SELECT 'ft' AS src, p.id, p.texto, NULL, NULL, r.id, r.texto, NULL, NULL, 0
+FROM perguntas p
+LEFT JOIN respostas r ON p.resposta_id = r.id
+WHERE
+  MATCH(p.texto_normalizado) AGAINST (%s IN BOOLEAN MODE)
+  OR MATCH(r.texto_normalizado) AGAINST (%s IN BOOLEAN MODE)
+LIMIT 200)
+ORDER BY src DESC, relevancia DESC
+"""
+
+
+def _boolean_wildcard(normalized_query: str, ft_min: int) -> str:
+    tokens = [t.strip() for t in normalized_query.split() if t.strip()]
+    tokens = [t for t in tokens if len(t) >= ft_min]
+    if not tokens:
+        tokens = [t.strip() for t in normalized_query.split()][:8]
+    tokens = tokens[:12]
+    # boolean wildcard: +token*
+    return " ".join("+" + t + "*" for t in tokens)
+
+
+def _linhas_para_candidatos(rows) -> List[Dict[str, Any]]:
+    # rows may be tuples (default cursor) or dicts depending on connector; handle ambos
+    results = []
+    for r in rows:
+        if isinstance(r, dict):
+            rec = {k: r.get(k) for k in _CAMPOS_CANDIDATO}
+        else:
+            rec = {k: (r[i] if i < len(r) else None) for i, k in enumerate(_CAMPOS_CANDIDATO)}
+        results.append(rec)
+    return results
+
+
+def _sql_like(conn, normalized_query: str, limit: int) -> List[Dict[str, Any]]:
+    try:
+        like_pat = f"%{normalized_query}%"
+        return _linhas_para_candidatos(consultar_preparado(conn, _SQL_LIKE, (like_pat, like_pat, limit)))
+    except Exception as e2:
+        logger.debug("LIKE fallback also failed: %s", e2)
+        return []
+
+
 def sql_search(conn, normalized_query: str, limit: int = SQL_LIMIT) -> List[Dict[str, Any]]:
     if conn is None:
         return []
 
-    cur = conn.cursor()
+    # cursores preparados (banco.consultar_preparado): o servidor faz parse/plano de cada
+    # SQL uma vez por conexão e as próximas buscas só mandam os parâmetros
     try:
-        # obter ft_min_word_len e montar tokens
-        ft_min = _get_ft_min_word_len(conn, default=3)
-        tokens = [t.strip() for t in normalized_query.split() if t.strip()]
-        tokens = [t for t in tokens if len(t) >= ft_min]
-        if not tokens:
-            tokens = [t.strip() for t in normalized_query.split()][:8]
-        tokens = tokens[:12]
-        # boolean wildcard: +token*
-        boolean_wild = " ".join("+" + t + "*" for t in tokens)
-
-        # consulta FULLTEXT (p/ perguntas e respostas). Se algum MATCH não tiver FT index
-        # o execute pode lançar, daí caímos no fallback.
-        sql = """
-        SELECT
-          p.id AS pergunta_id,
-          p.texto AS pergunta_texto,
-          p.texto_normalizado AS pergunta_norm,
-          p.embedding AS pergunta_embedding,
-          r.id AS resposta_id,
-          r.texto AS resposta_texto,
-          r.texto_normalizado AS resposta_norm,
-          r.embedding_resposta AS resposta_embedding,
-          MATCH(p.texto_normalizado) AGAINST (%s IN BOOLEAN MODE) AS score_p,
-          MATCH(r.texto_normalizado) AGAINST (%s IN BOOLEAN MODE) AS score_r
-        FROM perguntas p
-        LEFT JOIN respostas r ON p.resposta_id = r.id
-        WHERE
-          MATCH(p.texto_normalizado) AGAINST (%s IN BOOLEAN MODE)
-          OR MATCH(r.texto_normalizado) AGAINST (%s IN BOOLEAN MODE)
-        ORDER BY GREATEST(
-          IFNULL(MATCH(p.texto_normalizado) AGAINST (%s IN BOOLEAN MODE), 0),
-          IFNULL(MATCH(r.texto_normalizado) AGAINST (%s IN BOOLEAN MODE), 0)
-        ) DESC
-        LIMIT %s
-        """
-        params = (boolean_wild, boolean_wild, boolean_wild, boolean_wild, boolean_wild, boolean_wild, limit)
-        cur.execute(sql, params)
-        rows = cur.fetchall()
-
+        boolean_wild = _boolean_wildcard(normalized_query, _get_ft_min_word_len(conn, default=3))
+        rows = consultar_preparado(conn, _SQL_FULLTEXT, (boolean_wild,) * 4 + (limit,))
     except Exception as e:
         # fulltext falhou (provavelmente índice faltando ou sintaxe não suportada) -> fallback para LIKE
         logger.debug("FT search failed, falling back to LIKE. Erro: %s", e)
-        try:
-            like_pat = f"%{normalized_query}%"
-            sql2 = """
-            SELECT
-              p.id AS pergunta_id,
-              p.texto AS pergunta_texto,
-              p.texto_normalizado AS pergunta_norm,
-              p.embedding AS pergunta_embedding,
-              r.id AS resposta_id,
-              r.texto AS resposta_texto,
-              r.texto_normalizado AS resposta_norm,
-              r.embedding_resposta AS resposta_embedding
-            FROM perguntas p
-            LEFT JOIN respostas r ON p.resposta_id = r.id
-            WHERE p.texto_normalizado LIKE %s OR r.texto_normalizado LIKE %s
-            LIMIT %s
-            """
-            cur.execute(sql2, (like_pat, like_pat, limit))
-            rows = cur.fetchall()
-        except Exception as e2:
-            logger.debug("LIKE fallback also failed: %s", e2)
-            try:
-                cur.close()
-            except Exception:
-                pass
-            return []
+        return _sql_like(conn, normalized_query, limit)
+    return _linhas_para_candidatos(rows)
 
-    # normalize rows into list[dict] with expected keys
-    results = []
-    # rows may be tuples (default cursor) or dicts depending on connector; handle ambos
-    for r in rows:
-        rec = {}
-        if isinstance(r, dict):
-            # keep the same field names
-            rec["pergunta_id"] = r.get("pergunta_id")
-            rec["pergunta_texto"] = r.get("pergunta_texto")
-            rec["pergunta_norm"] = r.get("pergunta_norm")
-            rec["pergunta_embedding"] = r.get("pergunta_embedding")
-            rec["resposta_id"] = r.get("resposta_id")
-            rec["resposta_texto"] = r.get("resposta_texto")
-            rec["resposta_norm"] = r.get("resposta_norm")
-            rec["resposta_embedding"] = r.get("resposta_embedding")
-        else:
-            # fallback tuple mapping (compat com implementação antiga)
-            keys = ["pergunta_id","pergunta_texto","pergunta_norm","pergunta_embedding",
-                    "resposta_id","resposta_texto","resposta_norm","resposta_embedding"]
-            for i,k in enumerate(keys):
-                rec[k] = r[i] if i < len(r) else None
-        results.append(rec)
 
+def busca_textual(conn, normalized_query: str, limit: int = SQL_LIMIT) -> Tuple[List[Dict[str, Any]], Optional[List[Dict[str, Any]]]]:
+    """
+    sql_search + fulltext boolean (+token) numa consulta UNION ALL só. Retorna
+    (candidatos do sql_search, candidatos do boolean); sem índice FULLTEXT o primeiro
+    vem do LIKE e o segundo é None.
+    """
+    if conn is None:
+        return [], None
     try:
-        cur.close()
-    except Exception:
-        pass
-
-    return results
+        # pega ft_min_word_len para não descartar tokens curtos
+        ft_min = _get_ft_min_word_len(conn, default=3)
+        wild = _boolean_wildcard(normalized_query, ft_min)
+        boolean_query = _tokens_para_boolean_query(normalized_query, min_len=ft_min, max_terms=12)
+        rows = consultar_preparado(conn, _SQL_FULLTEXT_UNIAO, (wild,) * 4 + (limit, boolean_query, boolean_query))
+    except Exception as e:
+        logger.debug("FT search failed, falling back to LIKE. Erro: %s", e)
+        return _sql_like(conn, normalized_query, limit), None
+    sql_rows = [r[1:] for r in rows if r[0] == "sql"]
+    ft = [{
+        "pergunta_id": f[1],
+        "pergunta_texto": f[2],
+        "resposta_id": f[5],
+        "resposta_texto": f[6],
+        "resposta_norm": normalizar(f[6] or ""),
+    } for f in rows if f[0] == "ft"]
+    return _linhas_para_candidatos(sql_rows), ft
 
 # -----------------------
 # Ranking + CSV fallback
 # -----------------------
 
-def _parse_embedding_json(maybe_json: Optional[str]) -> Optional[List[float]]:
-    if not maybe_json:
-        return None
-    try:
-        return json.loads(maybe_json)
-    except Exception:
-        try:
-            return json.loads(maybe_json.strip().strip('"'))
-        except Exception:
-            return None
-
-
 def rank_candidates(candidates: List[Dict[str, Any]], query_emb: Optional[List[float]], query_norm: str,
-                    weight_emb: float = EMB_WEIGHT_DEFAULT, weight_kw: float = KW_WEIGHT_DEFAULT) -> List[Tuple[Dict[str, Any], float]]:
-    out = []
+                    weight_emb: float = EMB_WEIGHT_DEFAULT, weight_kw: float = KW_WEIGHT_DEFAULT,
+                    top_k: Optional[int] = None) -> List[Tuple[Dict[str, Any], float]]:
+    """
+    (candidato, score) em ordem decrescente. Com top_k, só os top_k melhores: seleção
+    parcial (argpartition) em vez de ordenar e montar as N tuplas.
+    """
+    scores = []
     q_tokens = set((query_norm or "").split())
-    for c in candidates:
-        resp_norm = (c.get("resposta_norm") or c.get("pergunta_norm") or "") or ""
-        resp_tokens = set(resp_norm.split())
+    # query normalizada uma vez para todos os candidatos
+    q_hat = vetor_unitario(query_emb) if query_emb is not None else None
+    # cosine de todos os candidatos numa chamada (simsimd ou GEMV M @ q) em vez de um cosine por candidato
+    emb_scores = None
+    if q_hat is not None and candidates:
+        M, _ = stack_embeddings(candidates, q_hat.size)
+        emb_scores = pontuar_lote(q_hat, M)
+    for i, c in enumerate(candidates):
+        resp_tokens = tokens_candidato(c)
         kw_score = 0.0
         if q_tokens and resp_tokens:
             inter = q_tokens.intersection(resp_tokens)
             kw_score = len(inter) / max(1, len(q_tokens))
-        emb_score = 0.0
-        if query_emb is not None:
-            emb_json = c.get("resposta_embedding") or c.get("pergunta_embedding")
-            target_emb = _parse_embedding_json(emb_json)
-            if target_emb:
-                try:
-                    emb_score = float(cosine_similarity(query_emb, target_emb))
-                except Exception:
-                    emb_score = 0.0
-        score = (weight_emb * emb_score) + (weight_kw * kw_score)
-        out.append((c, float(score)))
-    out.sort(key=lambda t: t[1], reverse=True)
-    return out
+        emb_score = float(emb_scores[i]) if emb_scores is not None else 0.0
+        scores.append((weight_emb * emb_score) + (weight_kw * kw_score))
+    s = np.asarray(scores, dtype=np.float64)
+    return [(candidates[i], float(s[i])) for i in indices_top_k(s, top_k)]
 
 
 def csv_fallback_search(csv_path: str, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
@@ -398,40 +454,86 @@ def csv_fallback_search(csv_path: str, query: str, top_k: int = 5) -> List[Dict[
     q_norm = normalizar(query)
     query_emb = None
     try:
-        query_emb = calcular_embedding(q_norm)
+        query_emb = embedding_consulta(q_norm)
     except Exception:
         query_emb = None
-    results = []
-    with open(csv_path, newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            texto = row.get("resposta") or row.get("answer") or row.get("resposta_texto") or row.get("texto") or ""
-            texto_norm = row.get("texto_normalizado") or normalizar(texto)
-            emb = None
-            if row.get("embedding"):
-                try:
-                    emb = json.loads(row.get("embedding"))
-                except Exception:
-                    emb = None
-            rec = {
-                "pergunta_id": row.get("id") or row.get("pergunta_id"),
-                "pergunta_texto": row.get("pergunta") or "",
-                "pergunta_norm": row.get("pergunta") or "",
-                "pergunta_embedding": None,
-                "resposta_id": row.get("id") or None,
-                "resposta_texto": texto,
-                "resposta_norm": texto_norm,
-                "resposta_embedding": json.dumps(emb, ensure_ascii=False) if emb else None
-            }
-            results.append(rec)
-    ranked = rank_candidates(results, query_emb, q_norm)
-    top = [r for r,score in ranked[:top_k]]
-    return top
+    registros, tokens, M = carregar_csv(csv_path)
+    if not registros or top_k <= 0:
+        return []
+    # mesmo score de rank_candidates, mas sobre a matriz em cache e só com o top-k ordenado
+    scores = np.zeros(len(registros), dtype=np.float32)
+    q_hat = vetor_unitario(query_emb) if query_emb is not None else None
+    if q_hat is not None and M.shape[1] == q_hat.size:
+        scores += EMB_WEIGHT_DEFAULT * pontuar_lote(q_hat, M)
+    q_tokens = set((q_norm or "").split())
+    if q_tokens:
+        kw = np.fromiter((len(q_tokens.intersection(t)) for t in tokens), dtype=np.float32, count=len(tokens))
+        scores += KW_WEIGHT_DEFAULT * kw / len(q_tokens)
+    idx = indices_top_k(scores, top_k)
+    # cópias: quem chama pode anotar os candidatos sem sujar o cache
+    return [dict(registros[i]) for i in idx]
 
 # -----------------------
 # Main pipeline: find_answer
 # -----------------------
 
+# pool para sobrepor, dentro de find_answer, o embedding da pergunta e a consulta no banco
+_executor = ThreadPoolExecutor(max_workers=int(os.environ.get("PIPELINE_WORKERS", "3")),
+                               thread_name_prefix="find_answer")
+
+def _resultado_embedding(f_emb) -> Optional[np.ndarray]:
+    try:
+        return f_emb.result()
+    except Exception:
+        return None
+
+
+_MESES = ["janeiro", "fevereiro", "março", "abril", "maio", "junho",
+          "julho", "agosto", "setembro", "outubro", "novembro", "dezembro"]
+_DIAS_SEMANA = ["segunda-feira", "terça-feira", "quarta-feira", "quinta-feira",
+                "sexta-feira", "sábado", "domingo"]
+# palavras que indicam a data/hora de um registro (evento, prazo...), não a de agora
+_CONTEXTO_DATA = ("evento", "aniversario", "nascimento", "vencimento", "prazo", "reuniao", "contrato")
+# intenções sobre a pergunta normalizada (sem acento/pontuação)
+# "que horas sao/e" só no fim da frase: "a que horas e a aula" pergunta o horário de outra coisa
+_RE_PEDE_HORA = re.compile(r"\bque horas? (?:sao|e)(?: agora)?(?: por favor)?$|\bhoras? agora\b|\bhora atual\b")
+_RE_PEDE_DIA_SEMANA = re.compile(r"\bdia da semana (?:e )?(?:hoje|estamos)\b|\bhoje e (?:que )?dia da semana\b")
+_RE_PEDE_DATA = re.compile(r"\b(?:que dia e hoje|data de hoje|data atual|dia de hoje)\b")
+
+
+def _resposta_deterministica(pergunta: str, q_norm: str) -> Optional[Dict[str, Any]]:
+    """
+    Perguntas curtas (até 6 palavras) sobre a data, a hora ou o dia da semana atuais:
+    resposta pronta, sem calcular embedding nem consultar banco/CSV. None se não for o caso.
+    """
+    tokens = q_norm.split()
+    if not tokens or len(tokens) > 6 or any(x in q_norm for x in _CONTEXTO_DATA):
+        return None
+    agora = datetime.now()
+    if _RE_PEDE_HORA.search(q_norm):
+        h, m = agora.hour, agora.minute
+        texto = f"{h} hora{'s' if h != 1 else ''}"
+        if m:
+            texto += f" e {m} minuto{'s' if m != 1 else ''}"
+        tipo = "current_time"
+    elif _RE_PEDE_DIA_SEMANA.search(q_norm):
+        texto = _DIAS_SEMANA[agora.weekday()]
+        tipo = "weekday"
+    elif _RE_PEDE_DATA.search(q_norm) or user_requests_only_field(pergunta) == "data":
+        texto = f"{agora.day} de {_MESES[agora.month - 1]} de {agora.year}"
+        tipo = "today_date"
+    else:
+        return None
+    return {
+        "text": texto,
+        "raw": texto,
+        "source": "generated",
+        "id": None,
+        "score": 1.0,
+        "explain": {"generated": tipo, "from_db_attempted": False, "used_csv": False}
+    }
+
+
 def find_answer(
     pergunta: str,
     conn=None,
@@ -447,36 +549,15 @@ def find_answer(
 
     q_norm = normalizar(pergunta)
 
-    # 1️⃣ detectar pedidos diretos de data
-    def _data_hoje_extenso() -> str:
-        meses = [
-            "janeiro", "fevereiro", "março", "abril", "maio", "junho",
-            "julho", "agosto", "setembro", "outubro", "novembro", "dezembro"
-        ]
-        d = date.today()
-        return f"{d.day} de {meses[d.month - 1]} de {d.year}"
-
-    _field_req_early = user_requests_only_field(pergunta)
-    if _field_req_early == "data":
-        q_raw = strip_accents(pergunta.lower())
-        if len(q_raw.split()) <= 6 and not any(x in q_raw for x in (
-            "evento", "aniversario", "nascimento", "vencimento", "prazo", "reuniao", "contrato"
-        )):
-            hoje = _data_hoje_extenso()
-            return {
-                "text": hoje,
-                "raw": hoje,
-                "source": "generated",
-                "id": None,
-                "score": 1.0,
-                "explain": {"generated": "today_date", "from_db_attempted": False, "used_csv": False}
-            }
-
-    # 2️⃣ calcular embedding
-    try:
-        query_emb = calcular_embedding(q_norm)
-    except Exception:
-        query_emb = None
+    # 1️⃣ data/hora/dia da semana: resposta gerada na hora, sem embedding, banco nem CSV
+    deterministica = _resposta_deterministica(pergunta, q_norm)
+    if deterministica is not None:
+        return deterministica
+
+    # 2️⃣ calcular embedding: em paralelo com as buscas no banco (o encode solta o GIL);
+    # o resultado só é esperado quando a busca por embedding precisa dele
+    f_emb = _executor.submit(embedding_consulta, q_norm)
+    query_emb = None
 
     explain = {"from_db_attempted": False, "attempts": [], "used_csv": False}
     candidates = []
@@ -490,85 +571,54 @@ def find_answer(
             explain["from_db_attempted"] = True
             explain["attempts"] = []
 
-            def _try_sql(limit):
-                try:
-                    c = sql_search(conn_obj, q_norm, limit=limit)
-                    explain["attempts"].append({"type": "sql_like", "limit": limit, "count": len(c)})
-                    return c
-                except Exception as e:
-                    logger.debug("Erro SQL_SEARCH (limit=%s): %s", limit, e)
-                    return []
-
-            # Tenta limites progressivos — agora com amostras maiores
-            for lim in [SQL_LIMIT, max(60, SQL_LIMIT * 2), 120, 200]:
-                cands = _try_sql(lim)
-                if cands:
-                    candidates.extend(cands)
-                # se já conseguiu um número razoável de candidatos, interrompe
-                if len(cands) >= lim // 2:
-                    break
-
-            # ---------------------------------------------------------
-            # Tenta full-text (caso o índice esteja criado)
-            # ---------------------------------------------------------
-            # ---------------------------------------------------------
-            # Tenta full-text boolean com tokens +wildcard (mais robusto)
-            # ---------------------------------------------------------
+            # sql_search + full-text boolean (+token) numa ida ao banco só (UNION ALL).
+            # Os antigos limites progressivos [SQL_LIMIT, 2*SQL_LIMIT, 120, 200] com parada em
+            # "achou >= lim//2" sempre davam as primeiras SQL_LIMIT linhas (abaixo de
+            # SQL_LIMIT//2 linhas, todas cabem no primeiro limite): o servidor só manda essas.
             try:
-                cur = conn_obj.cursor()
-                # pega ft_min_word_len para não descartar tokens curtos
-                ft_min = _get_ft_min_word_len(conn_obj, default=3)
-                boolean_query = _tokens_para_boolean_query(q_norm, min_len=ft_min, max_terms=12)
-                # consulta fulltext nos campos normalizados de perguntas e respostas
-                q_ft = f"""
-                SELECT
-                    p.id AS pergunta_id,
-                    p.texto AS pergunta_texto,
-                    r.id AS resposta_id,
-                    r.texto AS resposta_texto,
-                    MATCH(p.texto_normalizado) AGAINST (%s IN BOOLEAN MODE) AS score_p,
-                    MATCH(r.texto_normalizado) AGAINST (%s IN BOOLEAN MODE) AS score_r
-                FROM perguntas p
-                LEFT JOIN respostas r ON p.resposta_id = r.id
-                WHERE
-                    MATCH(p.texto_normalizado) AGAINST (%s IN BOOLEAN MODE)
-                    OR MATCH(r.texto_normalizado) AGAINST (%s IN BOOLEAN MODE)
-                LIMIT 200
-                """
-                params = (boolean_query, boolean_query, boolean_query, boolean_query)
-                cur.execute(q_ft, params)
-                ft = cur.fetchall()
-                explain["attempts"].append({"type": "fulltext_boolean", "count": len(ft)})
-                for f in ft:
-                    candidates.append({
-                        "pergunta_id": f[0],
-                        "pergunta_texto": f[1],
-                        "resposta_id": f[2],
-                        "resposta_texto": f[3],
-                        "resposta_norm": normalizar(f[3] or ""),
-                    })
-                try:
-                    cur.close()
-                except Exception:
-                    pass
+                cands, ft = busca_textual(conn_obj, q_norm, limit=SQL_LIMIT)
             except Exception as e:
-                logger.debug("Fulltext falhou (boolean): %s", e)
+                logger.debug("Erro SQL_SEARCH (limit=%s): %s", SQL_LIMIT, e)
+                cands, ft = [], None
+            explain["attempts"].append({"type": "sql_like", "limit": SQL_LIMIT, "count": len(cands)})
+            candidates.extend(cands)
+
+            if ft is not None:
+                explain["attempts"].append({"type": "fulltext_boolean", "count": len(ft)})
+                candidates.extend(ft)
 
             # ---------------------------------------------------------
             # Tenta carregar respostas com embeddings salvos no BD
             # ---------------------------------------------------------
             try:
-                emb_rows = buscar_respostas_com_embedding(conn_obj)
-                explain["attempts"].append({"type": "db_embeddings", "count": len(emb_rows)})
-                for rid, texto, emb in emb_rows:
-                    candidates.append({
-                        "pergunta_id": None,
-                        "pergunta_texto": "",
-                        "resposta_id": rid,
-                        "resposta_texto": texto,
-                        "resposta_norm": normalizar(texto),
-                        "resposta_embedding": json.dumps(emb, ensure_ascii=False) if emb is not None else None,
-                    })
+                query_emb = _resultado_embedding(f_emb)
+                if query_emb is not None:
+                    # só as EMB_TOP_K mais próximas, pontuadas na matriz normalizada em cache
+                    emb_rows = buscar_respostas_top_k(conn_obj, query_emb, k=EMB_TOP_K)
+                    explain["attempts"].append({"type": "db_embeddings_topk", "count": len(emb_rows)})
+                    for rid, texto, emb in emb_rows:
+                        candidates.append({
+                            "pergunta_id": None,
+                            "pergunta_texto": "",
+                            "resposta_id": rid,
+                            "resposta_texto": texto,
+                            "resposta_norm": normalizar(texto),
+                            "resposta_embedding": None,
+                            "_emb_np": emb,  # já com norma 1: materialize_embeddings não reprocessa
+                        })
+                else:
+                    emb_rows = buscar_respostas_com_embedding(conn_obj)
+                    explain["attempts"].append({"type": "db_embeddings", "count": len(emb_rows)})
+                    for rid, texto, emb in emb_rows:
+                        candidates.append({
+                            "pergunta_id": None,
+                            "pergunta_texto": "",
+                            "resposta_id": rid,
+                            "resposta_texto": texto,
+                            "resposta_norm": normalizar(texto),
+                            # lista já pronta (sem ida e volta por JSON)
+                            "resposta_embedding": emb,
+                        })
             except Exception as e:
                 logger.debug("Erro buscar_respostas_com_embedding: %s", e)
 
@@ -576,21 +626,32 @@ def find_answer(
             # Contagem de candidatos e de quantos têm embeddings válidos
             # ---------------------------------------------------------
             explain["db_count"] = len(candidates)
-            emb_ok = 0
-            for c in candidates:
-                emb = c.get("resposta_embedding") or c.get("pergunta_embedding")
-                if _parse_embedding_json(emb):
-                    emb_ok += 1
-            explain["db_embeddings_count"] = emb_ok
+            materialize_embeddings(candidates)
+            explain["db_embeddings_count"] = sum(1 for c in candidates if c["_emb_np"] is not None)
 
         except Exception as e:
             logger.debug("Erro geral na busca DB: %s", e)
+        finally:
+            # fase de banco acabou: a conexão volta ao pool já aqui, não só no fim do
+            # ranking/formatação (e também quando algo lança no meio do caminho)
+            if created_conn and conn_obj:
+                try:
+                    conn_obj.close()
+                except Exception:
+                    pass
+
 
+    if query_emb is None:
+        query_emb = _resultado_embedding(f_emb)
 
-    # 4️⃣ ranking dos candidatos DB
+    # quantos candidatos vamos considerar no rerank global
+    rerank_sample_size = 100
+
+    # 4️⃣ ranking dos candidatos DB (só o topo é usado: melhor score + amostra do rerank)
     ranked_db = rank_candidates(
         candidates, query_emb, q_norm,
-        weight_emb=weight_embedding, weight_kw=weight_keywords
+        weight_emb=weight_embedding, weight_kw=weight_keywords,
+        top_k=rerank_sample_size
     ) if candidates else []
 
     # melhor score vindo do DB (ou -1 se vazio)
@@ -617,7 +678,6 @@ def find_answer(
     # -------------------------
     reranked_all = []
     try:
-        rerank_sample_size = 100  # quantos candidatos vamos considerar no rerank global
         sample = []
         seen_keys = set()
         for lst in (ranked_db, ranked_csv):
@@ -638,12 +698,14 @@ def find_answer(
             # dar mais confiança ao embedding nesta fase
             rerank_emb_w = max(0.7, weight_embedding)
             rerank_kw_w = 1.0 - rerank_emb_w
+            # só o primeiro do rerank é usado
             reranked_all = rank_candidates(sample, query_emb, q_norm,
                                            weight_emb=rerank_emb_w,
-                                           weight_kw=rerank_kw_w)
+                                           weight_kw=rerank_kw_w,
+                                           top_k=1)
             explain["rerank_emb_w"] = rerank_emb_w
             explain["rerank_kw_w"] = rerank_kw_w
-            explain["reranked_count"] = len(reranked_all)
+            explain["reranked_count"] = len(sample)
     except Exception as e:
         logger.debug("Erro na fase de rerank híbrido: %s", e)
         reranked_all = []
@@ -693,11 +755,6 @@ def find_answer(
         chosen, chosen_score = ranked_db[0]
     else:
         # nenhuma fonte com confiança suficiente
-        try:
-            if created_conn and conn_obj:
-                conn_obj.close()
-        except Exception:
-            pass
         return {"text": "Desculpe — não encontrei uma resposta adequada.", "raw": "", "source": "none", "id": None, "score": 0.0, "explain": explain}
 
     top_rec = chosen
@@ -742,12 +799,6 @@ def find_answer(
         "explain": explain
     }
 
-    if created_conn and conn_obj:
-        try:
-            conn_obj.close()
-        except Exception:
-            pass
-
     try:
         final_text = humanize_text(final_text, source_meta=meta, for_tts=False)
     except Exception:
@@ -832,8 +883,7 @@ def obter_top_k_respostas(pergunta: str, conn, k: int = 3, max_candidatos: int =
         conn, created = _ensure_connection(conn)
     except Exception:
         try:
-            from core import banco as banco_mod
-            conn = banco_mod.inicializar_banco()
+            conn = banco_mod.obter_conexao()
             created = True
         except Exception:
             conn = None
@@ -841,47 +891,51 @@ def obter_top_k_respostas(pergunta: str, conn, k: int = 3, max_candidatos: int =
 
     cursor = None
     try:
-        cursor = conn.cursor()
+        # cursor de dicionário: as linhas são lidas por nome de coluna
+        cursor = conn.cursor(dictionary=True)
         sql = """
             SELECT p.id AS pid, p.texto AS pergunta_texto, p.texto_normalizado AS pergunta_norm,
                    p.embedding AS pergunta_embedding, p.keywords AS pergunta_keywords,
                    r.id AS rid, r.texto AS resposta_texto,
-                   r.texto_normalizado AS resposta_norm, r.embedding_resposta AS resposta_embedding
+                   r.texto_normalizado AS resposta_norm, r.embedding_resposta AS resposta_embedding,
+                   r.embedding_resposta_bin AS resposta_embedding_bin
             FROM perguntas p
             JOIN respostas r ON p.resposta_id = r.id
             LIMIT %s
         """
         cursor.execute(sql, (max_candidatos,))
-        candidatos = cursor.fetchall() or []
+        candidatos = [row for row in (cursor.fetchall() or []) if isinstance(row, dict)]
+        if not candidatos or k <= 0:
+            return []
 
         try:
-            q_emb = calcular_embedding(pergunta_norm)
+            q_emb = embedding_consulta(pergunta_norm)
         except Exception:
             q_emb = None
 
-        scored = []
         q_toks = [t for t in re.findall(r"[^\W\d_]+", pergunta_norm or "", flags=re.UNICODE) if len(t) > 1]
-        q_kws = q_toks[:10]
-
-        for row in candidatos:
-            # adaptar row para dict caso venha como tupla
-            if not isinstance(row, dict):
-                continue
-            cand_vec = _pick_vector_from_row(row)
-            emb_sim = 0.0
-            if q_emb is not None and cand_vec is not None:
-                try:
-                    emb_sim = float(cosine_similarity(q_emb, cand_vec))
-                except Exception:
-                    emb_sim = 0.0
-            cand_kws = _parse_keywords_field(row.get("pergunta_keywords") or row.get("keywords"))
-            kw_score = _keyword_overlap_score(q_kws, cand_kws)
-            combined = weight_embedding * emb_sim + weight_keywords * kw_score
-            scored.append((combined, row.get("resposta_texto")))
-
-        scored.sort(key=lambda t: t[0], reverse=True)
-        respostas = [r for _, r in scored[:k]]
-        return respostas
+        q_kws = frozenset(q_toks[:10])
+
+        # similaridade de todos os candidatos numa multiplicação só: vetores de norma 1
+        # empilhados em (N, D), linha zerada para quem não tem embedding da dimensão da query.
+        # M é float32 contígua de propósito: é o que pontuar_lote passa ao simsimd.cdist
+        emb_sims = np.zeros(len(candidatos), dtype=np.float32)
+        q_hat = vetor_unitario(q_emb) if q_emb is not None else None
+        if q_hat is not None:
+            M = np.zeros((len(candidatos), q_hat.size), dtype=np.float32)
+            for i, row in enumerate(candidatos):
+                cand_vec = _pick_vector_from_row(row)
+                if cand_vec is not None and cand_vec.size == q_hat.size:
+                    M[i] = cand_vec
+            emb_sims = pontuar_lote(q_hat, M)
+        # mesma conta de _keyword_overlap_score, com o conjunto da query montado uma vez
+        kw_scores = np.fromiter(
+            (len(q_kws.intersection(_keywords_conjunto(row.get("pergunta_keywords") or row.get("keywords"))))
+             for row in candidatos), dtype=np.float64, count=len(candidatos))
+        if q_kws:
+            kw_scores /= len(q_kws)
+        combined = weight_embedding * emb_sims.astype(np.float64) + weight_keywords * kw_scores
+        return [candidatos[i].get("resposta_texto") for i in indices_top_k(combined, k)]
 
     finally:
         try:
@@ -22,7 +22,7 @@ import logging
 import argparse
 from collections import Counter, defaultdict
 
-from banco import inicializar_banco
+from banco import BULK_CHUNK, atualizar_keywords_bulk, inicializar_banco
 from normalizacao import normalizar
 
 # ---------------------------------------------------------------------
@@ -57,7 +57,7 @@ except Exception:
 # ---------------------------------------------------------------------
 TOKEN_RE = re.compile(r"[^\W\d_]+", flags=re.UNICODE)
 
-STOPWORDS = {
+STOPWORDS = frozenset({
     # português + inglês compactas
     "a","o","as","os","um","uma","uns","umas","de","do","da","dos","das",
     "em","no","na","nos","nas","por","para","com","sem","sobre","entre",
@@ -67,7 +67,7 @@ STOPWORDS = {
     "ele","ela","nós","vós","the","a","an","in","on","for","of","and","or",
     "is","are","was","were","be","been","to","by","at","from","it","this",
     "that","as","if","then","but","so","with","can","will","would","could"
-}
+})
 
 MAX_KEYWORDS = 20
 
@@ -75,13 +75,13 @@ MAX_KEYWORDS = 20
 # Utilitários
 # ---------------------------------------------------------------------
 def tokenize(text: str):
-    """Tokeniza e limpa o texto."""
-    return [t.lower() for t in TOKEN_RE.findall(text or "")]
+    """Tokeniza e limpa o texto (um lower() no texto todo, não um por token)."""
+    return TOKEN_RE.findall((text or "").lower())
 
 def generate_keywords(text: str, max_keywords=MAX_KEYWORDS, tfidf_scores=None):
     """Gera lista de keywords (stems + bigrams)."""
     text = normalizar(text or "")
-    toks = [t for t in tokenize(text) if t not in STOPWORDS and len(t) > 1]
+    toks = [t for t in tokenize(text) if len(t) > 1 and t not in STOPWORDS]
     if not toks:
         return []
 
@@ -133,6 +133,28 @@ def compute_tfidf(all_docs):
         tfidf_docs.append(scores)
     return tfidf_docs
 
+# ---------------------------------------------------------------------
+# Leitura em lotes
+# ---------------------------------------------------------------------
+SEM_KEYWORDS = "(keywords IS NULL OR keywords = '')"
+
+def lotes_perguntas(cur, filtro: str, total: int):
+    """
+    Lê até `total` perguntas em blocos de BULK_CHUNK, paginando por chave (id > último):
+    memória limitada mesmo em tabela grande, sem o custo crescente de um OFFSET.
+    """
+    ultimo, lidas = 0, 0
+    extra = " AND " + filtro if filtro else ""
+    while lidas < total:
+        cur.execute("SELECT id, texto, texto_normalizado FROM perguntas WHERE id > %s" + extra +
+                    " ORDER BY id LIMIT %s", (ultimo, min(BULK_CHUNK, total - lidas)))
+        bloco = cur.fetchall()
+        if not bloco:
+            return
+        lidas += len(bloco)
+        ultimo = bloco[-1]["id"]
+        yield bloco
+
 # ---------------------------------------------------------------------
 # Principal
 # ---------------------------------------------------------------------
@@ -153,45 +175,51 @@ def main():
         return
 
     cur = conn.cursor(dictionary=True)
-    query = "SELECT id, texto, texto_normalizado, keywords FROM perguntas"
-    if args.incremental:
-        query += " WHERE keywords IS NULL OR keywords = ''"
+    filtro = SEM_KEYWORDS if args.incremental else ""
+    cur.execute("SELECT COUNT(*) AS n FROM perguntas" + (" WHERE " + filtro if filtro else ""))
+    total = cur.fetchone()["n"]
     if args.limit:
-        query += f" LIMIT {args.limit}"
-    cur.execute(query)
-    rows = cur.fetchall()
+        total = min(total, args.limit)
 
-    if not rows:
+    if not total:
         print("Nenhuma pergunta encontrada para processar.")
+        cur.close()
+        conn.close()
         return
 
-    print(f"🔍 Processando {len(rows)} perguntas...")
+    print(f"🔍 Processando {total} perguntas...")
 
     # ---------------------------------------------------------------
-    # Se TF-IDF habilitado, primeiro tokeniza tudo
+    # Se TF-IDF habilitado, primeiro tokeniza tudo (uma passada só de leitura)
     # ---------------------------------------------------------------
-    all_docs_tokens = [tokenize(normalizar(r["texto"] or r["texto_normalizado"] or "")) for r in rows]
-    tfidf_docs = compute_tfidf(all_docs_tokens) if args.tfidf else [None] * len(rows)
+    tfidf_por_id = {}
+    if args.tfidf:
+        ids, all_docs_tokens = [], []
+        for bloco in lotes_perguntas(cur, filtro, total):
+            for r in bloco:
+                ids.append(r["id"])
+                all_docs_tokens.append(tokenize(normalizar(r["texto"] or r["texto_normalizado"] or "")))
+        tfidf_por_id = dict(zip(ids, compute_tfidf(all_docs_tokens)))
 
     from tqdm import tqdm
     updated = 0
-    for i, r in enumerate(tqdm(rows, desc="Gerando keywords", unit="q")):
-        pid = r["id"]
-        texto = r["texto"] or r["texto_normalizado"] or ""
-        tfidf_scores = tfidf_docs[i] if args.tfidf else None
-        kws = generate_keywords(texto, tfidf_scores=tfidf_scores)
-        if not kws:
-            continue
-        kws_json = json.dumps(kws, ensure_ascii=False)
-        if not args.dry_run:
-            try:
-                cur.execute("UPDATE perguntas SET keywords = %s WHERE id = %s", (kws_json, pid))
-                updated += 1
-            except Exception as e:
-                print(f"⚠️ Erro ao atualizar id={pid}: {e}")
-
-    if not args.dry_run:
-        conn.commit()
+    with tqdm(total=total, desc="Gerando keywords", unit="q") as barra:
+        for bloco in lotes_perguntas(cur, filtro, total):
+            pendentes = []
+            for r in bloco:
+                texto = r["texto"] or r["texto_normalizado"] or ""
+                kws = generate_keywords(texto, tfidf_scores=tfidf_por_id.get(r["id"]))
+                if kws:
+                    pendentes.append((r["id"], json.dumps(kws, ensure_ascii=False)))
+            # um UPDATE (CASE id ...) e um commit por bloco, em vez de um round trip por pergunta
+            if pendentes and not args.dry_run:
+                try:
+                    atualizar_keywords_bulk(conn, pendentes)
+                    updated += len(pendentes)
+                except Exception as e:
+                    print(f"⚠️ Erro ao atualizar ids {pendentes[0][0]}..{pendentes[-1][0]}: {e}")
+                    conn.rollback()
+            barra.update(len(bloco))
 
     cur.close()
     conn.close()
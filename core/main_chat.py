@@ -12,12 +12,14 @@ import tempfile
 import pygame
 from TTS.api import TTS
 import random
+import secrets
 from pydub import AudioSegment
 import socket
 import threading
 from datetime import datetime, timedelta
 # imports do package (ajustados para executar como "python -m core.main_chat")
 from config import LOG_DIR, ROOT
+from protocolo import FRAME_KINDS, KIND_TEXT, extrair_frames, send_frame
 from banco import (
     inicializar_banco, adicionar_memoria, listar_memorias,
     remover_memoria_por_id, editar_memoria, gerar_alertas
@@ -72,6 +74,12 @@ AUDIO_DIR = os.getenv("AUDIO_DIR", os.path.join(ROOT, "audio"))
 ALERTA_JANELA_DIAS = int(os.getenv("ALERTA_JANELA_DIAS", "14"))
 ENRIQUECIMENTO_INTERVALO_MIN = int(os.getenv("ENRIQUECIMENTO_INTERVALO_MIN", "30"))
 ALERTAS_VERIFICAR_CADA_MIN = int(os.getenv("ALERTAS_VERIFICAR_CADA_MIN", "5"))
+# cliente na mesma máquina que anunciar "shm" no hello (cliente.py --shm) recebe o áudio
+# por memória compartilhada (arquivo em /dev/shm) em vez do socket
+AUDIO_SHM = os.getenv("AUDIO_SHM", "1") == "1"
+SHM_DIR = "/dev/shm"
+# segmento não consumido pelo cliente nesse prazo (segundos) é apagado pelo servidor
+AUDIO_SHM_TTL = float(os.getenv("AUDIO_SHM_TTL", "30"))
 
 # garante diretórios
 os.makedirs(AUDIO_DIR, exist_ok=True)
@@ -311,19 +319,83 @@ def iniciar_agendador_alertas(conn, horarios: list[str] | None = None) -> None:
 # ---------------------------------------------
 # Enviar áudio via socket
 # ---------------------------------------------
-def enviar_audio_para_cliente(client_socket: socket.socket, caminho_arquivo: str):
+def _cliente_local(client_socket: socket.socket) -> bool:
+    try:
+        return client_socket.getpeername()[0] in ("127.0.0.1", "::1")
+    except Exception:
+        return False
+
+# segmentos entregues e ainda não abertos pelo cliente: nome -> (prazo, socket)
+_shm_pendentes: dict[str, tuple[float, socket.socket]] = {}
+_shm_lock = threading.Lock()
+
+def _limpar_shm(client_socket: socket.socket | None = None) -> None:
+    """Apaga os segmentos vencidos (ou todos os de client_socket, ao desconectar)."""
+    agora = time.monotonic()
+    with _shm_lock:
+        nomes = [n for n, (prazo, sock) in _shm_pendentes.items()
+                 if prazo <= agora or (client_socket is not None and sock is client_socket)]
+        for n in nomes:
+            del _shm_pendentes[n]
+    for n in nomes:
+        try:
+            os.unlink(os.path.join(SHM_DIR, n))  # já consumido: o cliente apagou ao abrir
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"Falha ao apagar segmento {n}: {e}", extra={"author":"system"})
+
+def _enviar_audio_shm(client_socket: socket.socket, caminho_arquivo: str, tamanho: int) -> None:
+    """
+    Copia o wav para um arquivo em SHM_DIR (tmpfs) com os.sendfile, cópia feita pelo kernel,
+    e envia só o header com o nome. O cliente abre e apaga o arquivo; se não o fizer em
+    AUDIO_SHM_TTL segundos ou desconectar antes, _limpar_shm apaga.
+    """
+    _limpar_shm()
+    nome = f"chatbot_{os.getpid()}_{secrets.token_hex(8)}"
+    caminho_shm = os.path.join(SHM_DIR, nome)
+    fd = os.open(caminho_shm, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    try:
+        with open(caminho_arquivo, "rb") as f:
+            off = 0
+            while off < tamanho:
+                n = os.sendfile(fd, f.fileno(), off, tamanho - off)
+                if not n:
+                    break
+                off += n
+    except Exception:
+        os.close(fd)
+        os.unlink(caminho_shm)
+        raise
+    os.close(fd)
+    with _shm_lock:
+        _shm_pendentes[nome] = (time.monotonic() + AUDIO_SHM_TTL, client_socket)
+    header = {"type":"audio","format":"wav","filename": os.path.basename(caminho_arquivo),
+              "size": tamanho, "shm": nome}
+    client_socket.sendall((json.dumps(header) + "\n").encode("utf-8"))
+
+def enviar_audio_para_cliente(client_socket: socket.socket, caminho_arquivo: str, shm: bool = False):
+    """shm=True só para cliente que anunciou suporte no hello; os demais recebem pelo socket."""
     if not os.path.exists(caminho_arquivo):
         logger.error(f"Arquivo de áudio não encontrado: {caminho_arquivo}", extra={"author":"system"})
         return False
     try:
         tamanho = os.path.getsize(caminho_arquivo)
+        if shm and AUDIO_SHM and os.path.isdir(SHM_DIR) and _cliente_local(client_socket):
+            try:
+                _enviar_audio_shm(client_socket, caminho_arquivo, tamanho)
+                logger.info(f"Áudio enviado via memória compartilhada ({tamanho} bytes).", extra={"author":"system"})
+                return True
+            except Exception as e:
+                logger.error(f"Falha na memória compartilhada, usando socket: {e}", extra={"author":"system"})
         header = {"type":"audio","format":"wav","filename": os.path.basename(caminho_arquivo), "size": tamanho}
-        client_socket.sendall((json.dumps(header) + "\n").encode("utf-8"))
         with open(caminho_arquivo, "rb") as f:
-            while True:
-                chunk = f.read(65536)
-                if not chunk: break
-                client_socket.sendall(chunk)
+            # header e primeiro bloco do wav saem juntos
+            primeiro = f.read(65536)
+            send_frame(client_socket, (json.dumps(header) + "\n").encode("utf-8"), primeiro)
+            # restante via sendfile: no Linux os bytes não passam pelo Python (cai para send no Windows)
+            if len(primeiro) < tamanho:
+                client_socket.sendfile(f, offset=len(primeiro))
         logger.info(f"Áudio enviado ({tamanho} bytes).", extra={"author":"system"})
         return True
     except Exception as e:
@@ -485,6 +557,24 @@ def processar_pergunta(pergunta: str, conn, enviar_resposta=None):
 # ---------------------------------------------
 # Loop do servidor (rede)
 # ---------------------------------------------
+def _ler_frames_binarios(client: socket.socket, data: bytes) -> list[str]:
+    """Decodifica os frames binários em data (lendo do socket o que faltar); retorna os textos."""
+    buf = bytearray(data)
+    textos = []
+    while True:
+        frames, descartados = extrair_frames(buf)
+        if descartados:
+            logger.warning(f"Protocolo binário: {descartados} bytes fora de frame descartados (ressincronizado).",
+                           extra={"author":"system"})
+        textos.extend(p.decode("utf-8", errors="ignore") for kind, p in frames if kind == KIND_TEXT)
+        if not buf:
+            return textos
+        # frame incompleto no fim do buffer: espera o restante
+        chunk = client.recv(65536)
+        if not chunk:
+            return textos
+        buf += chunk
+
 def iniciar_chat(modo_rede: bool = False, host: str = "0.0.0.0", port: int = 5000) -> None:
     conn = inicializar_banco()
     # pre-aquecimento (normalização/embeddings)
@@ -530,11 +620,59 @@ def iniciar_chat(modo_rede: bool = False, host: str = "0.0.0.0", port: int = 500
             speaker.speak("Servidor do Chatbot iniciado.")
             while True:
                 client, addr = s.accept()
+                client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
                 threading.Thread(target=_handle_client, args=(client, addr, conn), daemon=True).start()
 
 def _handle_client(client, addr, conn):
+    try:
+        _atender_cliente(client, addr, conn)
+    finally:
+        _limpar_shm(client)
+
+def _atender_cliente(client, addr, conn):
     with client:
         print(f"Conectado por {addr}")
+        # capacidades anunciadas pelo cliente no hello (ex.: "shm")
+        caps = set()
+
+        def enviar_resposta_cliente(text_or_json):
+            try:
+                # Se já vier um dict (payload JSON), envie-o diretamente como JSON (linha única + \n)
+                if isinstance(text_or_json, dict):
+                    client.sendall((json.dumps(text_or_json) + "\n").encode("utf-8"))
+                    return
+
+                if isinstance(text_or_json, bytes):
+                    text = text_or_json.decode("utf-8", errors="ignore")
+                else:
+                    text = str(text_or_json)
+
+                # comportamento antigo: se TTS habilitado, envia áudio; senão envia como text payload
+                if ENABLE_TTS and speaker.enabled and speaker.ok:
+                    arquivo_wav = os.path.join(speaker.audio_dir, "output.wav")
+                    try:
+                        # pega kwargs default (p.ex. {"speaker_wav": [...], "language": "pt"}) se existirem
+                        kws = getattr(speaker, "_tts_default_tts_kwargs", {}) or {}
+                        try:
+                            # Chamada preferida: passa os kwargs (clonagem, idioma, etc.)
+                            speaker._tts.tts_to_file(text=text, file_path=arquivo_wav, **kws)
+                        except TypeError:
+                            # Caso a assinatura seja diferente/antiga, tente sem kwargs
+                            speaker._tts.tts_to_file(text, arquivo_wav)
+                    except Exception:
+                        # fallback para o método speak (mantendo compatibilidade com versões antigas)
+                        try:
+                            speaker.speak(text)
+                        except Exception:
+                            pass
+
+                    enviar_audio_para_cliente(client, arquivo_wav, shm="shm" in caps)
+                else:
+                    payload = {"type":"text","content": text}
+                    client.sendall((json.dumps(payload) + "\n").encode("utf-8"))
+            except Exception as e:
+                logger.error(f"enviar_resposta_cliente erro: {e}", extra={"author":"system"})
+
         while True:
             try:
                 data = client.recv(4096)
@@ -542,50 +680,33 @@ def _handle_client(client, addr, conn):
                 print("Erro recv:", e); break
             if not data:
                 break
-            pergunta = data.decode("utf-8", errors="ignore").strip()
-            if not pergunta:
-                continue
-            print(f"Você: {pergunta}")
-
-            def enviar_resposta_cliente(text_or_json):
+            if data.startswith(b'{"type":"hello"'):
+                # hello: primeira linha da conexão; o que vier junto segue como mensagem
+                linha, _, data = data.partition(b"\n")
                 try:
-                    # Se já vier um dict (payload JSON), envie-o diretamente como JSON (linha única + \n)
-                    if isinstance(text_or_json, dict):
-                        client.sendall((json.dumps(text_or_json) + "\n").encode("utf-8"))
-                        return
-
-                    if isinstance(text_or_json, bytes):
-                        text = text_or_json.decode("utf-8", errors="ignore")
-                    else:
-                        text = str(text_or_json)
-
-                    # comportamento antigo: se TTS habilitado, envia áudio; senão envia como text payload
-                    if ENABLE_TTS and speaker.enabled and speaker.ok:
-                        arquivo_wav = os.path.join(speaker.audio_dir, "output.wav")
-                        try:
-                            # pega kwargs default (p.ex. {"speaker_wav": [...], "language": "pt"}) se existirem
-                            kws = getattr(speaker, "_tts_default_tts_kwargs", {}) or {}
-                            try:
-                                # Chamada preferida: passa os kwargs (clonagem, idioma, etc.)
-                                speaker._tts.tts_to_file(text=text, file_path=arquivo_wav, **kws)
-                            except TypeError:
-                                # Caso a assinatura seja diferente/antiga, tente sem kwargs
-                                speaker._tts.tts_to_file(text, arquivo_wav)
-                        except Exception:
-                            # fallback para o método speak (mantendo compatibilidade com versões antigas)
-                            try:
-                                speaker.speak(text)
-                            except Exception:
-                                pass
-
-                        enviar_audio_para_cliente(client, arquivo_wav)
-                    else:
-                        payload = {"type":"text","content": text}
-                        client.sendall((json.dumps(payload) + "\n").encode("utf-8"))
+                    caps.update(json.loads(linha).get("caps") or [])
+                except (ValueError, AttributeError, TypeError):
+                    pass
+                if not data:
+                    continue
+            if data[:1] in FRAME_KINDS:
+                # cliente com --binary-proto: frames (tipo, tamanho) + payload
+                try:
+                    perguntas = _ler_frames_binarios(client, data)
                 except Exception as e:
-                    logger.error(f"enviar_resposta_cliente erro: {e}", extra={"author":"system"})
-
-            resposta, encerrar = processar_pergunta(pergunta, conn, enviar_resposta=enviar_resposta_cliente)
+                    print("Erro frame binário:", e); break
+            else:
+                perguntas = [data.decode("utf-8", errors="ignore")]
+
+            encerrar = False
+            for pergunta in perguntas:
+                pergunta = pergunta.strip()
+                if not pergunta:
+                    continue
+                print(f"Você: {pergunta}")
+                resposta, encerrar = processar_pergunta(pergunta, conn, enviar_resposta=enviar_resposta_cliente)
+                if encerrar:
+                    break
             if encerrar:
                 break
 
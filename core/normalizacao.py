@@ -1,8 +1,10 @@
 from __future__ import annotations
 
+import os
 import re
 import unicodedata
 import logging
+from functools import lru_cache
 from typing import Optional
 
 logger = logging.getLogger("normalizacao")
@@ -10,8 +12,24 @@ if not logger.handlers:
     logging.basicConfig(level=logging.INFO)
 
 
-def normalizar(texto: Optional[str]) -> str:
-    """Normaliza texto para buscas/índices.
+# marcas combinantes do bloco latino (U+0300..U+036F, todas categoria Mn)
+_RE_COMBINANTES = re.compile("[\u0300-\u036f]+")
+
+
+def remover_acentos(s: str) -> str:
+    """Remove acentos/diacríticos: NFD + regex (em C) nas marcas combinantes. Se ainda
+    sobrar não-ASCII (outros alfabetos, outras marcas) usa o filtro por categoria."""
+    if s.isascii():
+        return s
+    s = unicodedata.normalize("NFD", s)
+    r = _RE_COMBINANTES.sub("", s)
+    if r.isascii():
+        return r
+    return "".join(ch for ch in r if unicodedata.category(ch) != "Mn")
+
+
+def _normalizar_raw(texto: Optional[str]) -> str:
+    """Normaliza texto para buscas/índices (sem cache; ver `normalizar`).
     - lowercasing
     - remoção de acentos (NFD)
     - remoção de pontuação (mantém dígitos e underscores)
@@ -24,8 +42,7 @@ def normalizar(texto: Optional[str]) -> str:
     s = s.strip().lower()
 
     # decompor acentos e remover marcas
-    s = unicodedata.normalize("NFD", s)
-    s = "".join(ch for ch in s if unicodedata.category(ch) != "Mn")
+    s = remover_acentos(s)
 
     # substituir quebras por espaço
     s = re.sub(r"[\r\n\t]+", " ", s)
@@ -39,6 +56,24 @@ def normalizar(texto: Optional[str]) -> str:
     return s
 
 
+# textos de resposta/CSV/fulltext se repetem entre consultas: cache grande o bastante
+# para o acervo inteiro (cada entrada é só o par de strings)
+NORMALIZAR_CACHE = int(os.getenv("NORMALIZAR_CACHE", "65536"))
+
+
+@lru_cache(maxsize=NORMALIZAR_CACHE)
+def _normalizar_str(texto: str) -> str:
+    return _normalizar_raw(texto)
+
+
+def normalizar(texto: Optional[str]) -> str:
+    """`_normalizar_raw` com cache LRU para strings (mesmo texto normaliza uma vez só).
+    Entradas que não são str vão direto para a versão sem cache."""
+    if isinstance(texto, str):
+        return _normalizar_str(texto)
+    return _normalizar_raw(texto)
+
+
 def atualizar_texto_normalizado(conn) -> None:
     """Atualiza colunas texto_normalizado nas tabelas perguntas e respostas."""
     if conn is None:
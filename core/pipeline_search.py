@@ -8,7 +8,7 @@ Módulo autocontido para:
  - retorna texto pronto para TTS e meta (fonte/id/similaridade)
 
 Dependências (já instaladas por você): mysql-connector-python, numpy, num2words
-Reutiliza: normalizacao.normalizar, banco.inicializar_banco, core.embeddings (calcular_embedding, cosine_similarity)
+Reutiliza: normalizacao.normalizar, banco.inicializar_banco, core.embeddings (embedding_consulta, vetor_unitario, pontuar_lote, indices_top_k)
 """
 
 from __future__ import annotations
@@ -20,24 +20,34 @@ import os
 from datetime import date
 import unicodedata
 import math
+from functools import lru_cache
+
+import numpy as np
 
 # bibliotecas do seu projeto (assume que estão presentes)
 try:
-    from core.normalizacao import normalizar
+    from core.normalizacao import normalizar, remover_acentos
 except Exception:
     def normalizar(s: str) -> str:
         return (s or "").strip().casefold()
 
+    def remover_acentos(s: str) -> str:
+        return ''.join(c for c in unicodedata.normalize('NFD', s) if unicodedata.category(c) != 'Mn')
+
 try:
-    from core.banco import inicializar_banco
+    from core.banco import inicializar_banco, obter_conexao
 except Exception:
     inicializar_banco = None
+    obter_conexao = None
 
 try:
     import core.embeddings as embmod
 except Exception:
     embmod = None
 
+# helpers de candidatos/CSV compartilhados com gerenciador_respostas
+from core.candidatos import carregar_csv, stack_embeddings, tokens_candidato
+
 try:
     from num2words import num2words
 except Exception:
@@ -58,9 +68,11 @@ _RE_NUMBER = re.compile(r"\d+(?:[.,]\d+)?", flags=re.UNICODE)
 
 
 def strip_accents(s: str) -> str:
-    return ''.join(c for c in unicodedata.normalize('NFD', s) if unicodedata.category(c) != 'Mn')
+    return remover_acentos(s)
 
 
+# as respostas repetem os mesmos números: num2words (Python puro) roda uma vez por token
+@lru_cache(maxsize=8192)
 def number_to_words_simple(token: str) -> str:
     t = token.replace(",", ".")
     try:
@@ -90,51 +102,67 @@ def numbers_to_words_in_text(text: str) -> str:
     return _RE_NUMBER.sub(_repl, text)
 
 
+_RE_PALAVRA = re.compile(r"\w+")
+# "só"/"apenas"/"somente" + o campo pedido, por palavra inteira (substring casava "so"
+# dentro de "isso", "pessoa"...)
+_MARCAS_SO = frozenset({"so", "apenas", "somente"})
+_CAMPOS_PEDIDO = (
+    ("data", frozenset({"data", "datas"})),
+    ("numero", frozenset({"numero", "numeros", "nº"})),
+    ("nome", frozenset({"nome", "nomes"})),
+    ("preco", frozenset({"preco", "precos", "valor", "valores"})),
+)
+
+
 def user_requests_only_field(question: str) -> Optional[str]:
     """
     Detecta intenção simples do usuário pedindo "só" algo (com ou sem acento).
     """
-    q = strip_accents((question or "").lower())
+    q_tokens = frozenset(_RE_PALAVRA.findall(strip_accents((question or "").lower())))
 
-    if not any(w in q for w in ("so", "apenas", "somente")):
+    if q_tokens.isdisjoint(_MARCAS_SO):
         return None
-    if "data" in q:
-        return "data"
-    if "numero" in q or "nº" in q:
-        return "numero"
-    if "nome" in q:
-        return "nome"
-    if "preco" in q or "preço" in q or "valor" in q:
-        return "preco"
+    for campo, palavras in _CAMPOS_PEDIDO:
+        if not q_tokens.isdisjoint(palavras):
+            return campo
     return None
 
 
+# padrões de extract_field_from_text, compilados uma vez
+_RE_DATA_DMA = re.compile(r"\b\d{1,2}[/-]\d{1,2}[/-]\d{2,4}\b")
+_RE_DATA_AMD = re.compile(r"\b\d{4}[/-]\d{1,2}[/-]\d{1,2}\b")
+_RE_DATA_EXTENSO = re.compile(r"\b\d{1,2}\s+de\s+\w{3,}\s+de\s+\d{4}\b", re.IGNORECASE)
+_RE_PRECO_RS = re.compile(r"R\$\s*\d+(?:[.,]\d+)?")
+_RE_PRECO = re.compile(r"\d+(?:[.,]\d+)?\s*(reais|rs|r\$)?", re.IGNORECASE)
+_RE_NOME = re.compile(r"\b([A-ZÀ-Ý][a-zà-ÿ]{1,}\s?){1,4}\b")
+
+
 def extract_field_from_text(field: str, text: str) -> Optional[str]:
     if not text:
         return None
     t = text
 
     if field == "data":
-        m = re.search(r"\b\d{1,2}[/-]\d{1,2}[/-]\d{2,4}\b", t)
+        m = _RE_DATA_DMA.search(t)
         if m:
             return m.group(0)
-        m = re.search(r"\b\d{4}[/-]\d{1,2}[/-]\d{1,2}\b", t)
+        m = _RE_DATA_AMD.search(t)
         if m:
             return m.group(0)
-        m = re.search(r"\b\d{1,2}\s+de\s+\w{3,}\s+de\s+\d{4}\b", t, flags=re.IGNORECASE)
+        m = _RE_DATA_EXTENSO.search(t)
         if m:
             return m.group(0)
         return None
 
     if field == "numero":
-        m = re.search(r"\d+(?:[.,]\d+)?", t)
+        m = _RE_NUMBER.search(t)
         return m.group(0) if m else None
 
     if field == "preco":
-        m = re.search(r"R\$\s*\d+(?:[.,]\d+)?", t)
+        m = _RE_PRECO_RS.search(t)
         if m:
             return m.group(0)
-        m = re.search(r"\d+(?:[.,]\d+)?\s*(reais|rs|r\$)?", t, flags=re.IGNORECASE)
+        m = _RE_PRECO.search(t)
         return m.group(0) if m else None
 
     if field == "nome":
@@ -143,7 +171,7 @@ def extract_field_from_text(field: str, text: str) -> Optional[str]:
             first = lines[0]
             if len(first.split()) <= 6:
                 return first
-        m = re.search(r"\b([A-ZÀ-Ý][a-zà-ÿ]{1,}\s?){1,4}\b", t)
+        m = _RE_NOME.search(t)
         if m:
             return m.group(0).strip()
         return None
@@ -202,75 +230,55 @@ def sql_search(conn, normalized_query: str, limit: int = SQL_LIMIT) -> List[Dict
 # ---------------------------------------------------------------------
 # Ranking + fallback CSV
 # ---------------------------------------------------------------------
-def _parse_embedding_json(maybe_json: Optional[str]) -> Optional[List[float]]:
-    if not maybe_json:
-        return None
-    try:
-        return json.loads(maybe_json)
-    except Exception:
-        try:
-            return json.loads(maybe_json.strip().strip('"'))
-        except Exception:
-            return None
-
-
 def rank_candidates(candidates: List[Dict[str, Any]], query_emb: Optional[List[float]], query_norm: str,
-                    weight_emb: float = EMB_WEIGHT, weight_kw: float = KW_WEIGHT) -> List[Tuple[Dict[str, Any], float]]:
-    out = []
+                    weight_emb: float = EMB_WEIGHT, weight_kw: float = KW_WEIGHT,
+                    top_k: Optional[int] = None) -> List[Tuple[Dict[str, Any], float]]:
+    """
+    (candidato, score) em ordem decrescente. Com top_k, só os top_k melhores: seleção
+    parcial (argpartition) em vez de ordenar e montar as N tuplas.
+    """
+    scores = []
     q_tokens = set((query_norm or "").split())
-    for c in candidates:
-        resp_norm = (c.get("resposta_norm") or c.get("pergunta_norm") or "") or ""
-        resp_tokens = set(resp_norm.split())
+    # query normalizada uma vez para todos os candidatos
+    q_hat = embmod.vetor_unitario(query_emb) if (query_emb is not None and embmod is not None) else None
+    # cosine de todos os candidatos numa chamada (simsimd ou GEMV M @ q) em vez de um cosine por candidato
+    emb_scores = None
+    if q_hat is not None and candidates:
+        M, _ = stack_embeddings(candidates, q_hat.size)
+        emb_scores = embmod.pontuar_lote(q_hat, M)
+    for i, c in enumerate(candidates):
+        resp_tokens = tokens_candidato(c)
         kw_score = 0.0
         if q_tokens and resp_tokens:
             inter = q_tokens.intersection(resp_tokens)
             kw_score = len(inter) / max(1, len(q_tokens))
-        emb_score = 0.0
-        if query_emb is not None and embmod is not None:
-            emb_json = c.get("resposta_embedding") or c.get("pergunta_embedding")
-            target_emb = _parse_embedding_json(emb_json)
-            if target_emb:
-                try:
-                    emb_score = float(embmod.cosine_similarity(query_emb, target_emb))
-                except Exception:
-                    emb_score = 0.0
-        score = (weight_emb * emb_score) + (weight_kw * kw_score)
-        out.append((c, float(score)))
-    out.sort(key=lambda t: t[1], reverse=True)
-    return out
+        emb_score = float(emb_scores[i]) if emb_scores is not None else 0.0
+        scores.append((weight_emb * emb_score) + (weight_kw * kw_score))
+    s = np.asarray(scores, dtype=np.float64)
+    return [(candidates[i], float(s[i])) for i in embmod.indices_top_k(s, top_k)]
 
 
 def csv_fallback_search(csv_path: str, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
     if not os.path.exists(csv_path):
         return []
     q_norm = normalizar(query)
-    query_emb = embmod.calcular_embedding(q_norm) if embmod else None
-    results = []
-    with open(csv_path, newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            texto = row.get("resposta") or row.get("answer") or row.get("resposta_texto") or row.get("texto") or ""
-            texto_norm = row.get("texto_normalizado") or normalizar(texto)
-            emb = None
-            if row.get("embedding"):
-                try:
-                    emb = json.loads(row.get("embedding"))
-                except Exception:
-                    emb = None
-            rec = {
-                "pergunta_id": row.get("id") or row.get("pergunta_id"),
-                "pergunta_texto": row.get("pergunta") or "",
-                "pergunta_norm": row.get("pergunta") or "",
-                "pergunta_embedding": None,
-                "resposta_id": row.get("id") or None,
-                "resposta_texto": texto,
-                "resposta_norm": texto_norm,
-                "resposta_embedding": json.dumps(emb, ensure_ascii=False) if emb else None
-            }
-            results.append(rec)
-    ranked = rank_candidates(results, query_emb, q_norm)
-    top = [r for r,score in ranked[:top_k]]
-    return top
+    query_emb = embmod.embedding_consulta(q_norm) if embmod else None
+    registros, tokens, M = carregar_csv(csv_path)
+    if not registros or top_k <= 0:
+        return []
+    # mesmo score de rank_candidates, mas sobre a matriz em cache e só com o top-k ordenado
+    scores = np.zeros(len(registros), dtype=np.float32)
+    q_hat = embmod.vetor_unitario(query_emb) if (query_emb is not None and embmod is not None) else None
+    if q_hat is not None and M.shape[1] == q_hat.size:
+        scores += EMB_WEIGHT * embmod.pontuar_lote(q_hat, M)
+    q_tokens = set((q_norm or "").split())
+    if q_tokens:
+        kw = np.fromiter((len(q_tokens.intersection(t)) for t in tokens), dtype=np.float32, count=len(tokens))
+        scores += KW_WEIGHT * kw / len(q_tokens)
+    # desempate estável, igual ao csv_fallback_search de gerenciador_respostas
+    idx = embmod.indices_top_k(scores, top_k)
+    # cópias: quem chama pode anotar os candidatos sem sujar o cache
+    return [dict(registros[i]) for i in idx]
 
 
 # ---------------------------------------------------------------------
@@ -325,14 +333,14 @@ def find_answer(
     query_emb = None
     try:
         if embmod:
-            query_emb = embmod.calcular_embedding(q_norm)
+            query_emb = embmod.embedding_consulta(q_norm)
     except Exception:
         query_emb = None
 
     candidates = []
     explain = {"from_db_attempted": False, "db_count": 0, "used_csv": False}
-    if use_db and inicializar_banco is not None:
-        conn_local = conn or inicializar_banco()
+    if use_db and obter_conexao is not None:
+        conn_local = conn or obter_conexao()
         try:
             explain["from_db_attempted"] = True
             candidates = sql_search(conn_local, q_norm, limit=SQL_LIMIT)
@@ -344,13 +352,14 @@ def find_answer(
                 except Exception:
                     pass
 
-    ranked = rank_candidates(candidates, query_emb, q_norm, weight_emb=weight_embedding, weight_kw=weight_keywords) if candidates else []
+    # só o melhor é usado: top_k=1 evita ordenar todos os candidatos
+    ranked = rank_candidates(candidates, query_emb, q_norm, weight_emb=weight_embedding, weight_kw=weight_keywords, top_k=1) if candidates else []
 
     if not ranked or (ranked and ranked[0][1] < emb_threshold):
         csv_cands = csv_fallback_search(csv_path, pergunta, top_k=top_k)
         explain["used_csv"] = True if csv_cands else False
         if csv_cands:
-            ranked_csv = rank_candidates(csv_cands, query_emb, q_norm, weight_emb=weight_embedding, weight_kw=weight_keywords)
+            ranked_csv = rank_candidates(csv_cands, query_emb, q_norm, weight_emb=weight_embedding, weight_kw=weight_keywords, top_k=1)
             ranked = (ranked or []) + ranked_csv
             ranked.sort(key=lambda t: t[1], reverse=True)
 
@@ -0,0 +1,66 @@
+# core/protocolo.py
+"""
+Protocolo binário opcional cliente <-> servidor (--binary-proto).
+
+Cada frame é um header fixo (tipo, tamanho do payload) seguido do payload,
+sem passar pelo serializador JSON. Usado por cliente.py e core/main_chat.py;
+não importa nada do resto do core para o cliente continuar leve.
+"""
+from __future__ import annotations
+
+import socket
+import struct
+
+FRAME_HDR = struct.Struct("!BI")  # (tipo, tamanho do payload)
+KIND_TEXT, KIND_AUDIO, KIND_CMD = 1, 2, 3
+FRAME_KINDS = (bytes([KIND_TEXT]), bytes([KIND_AUDIO]), bytes([KIND_CMD]))
+FRAME_MAX = 16 * 1024 * 1024  # header com tamanho maior que isso é lixo, não frame
+
+_KINDS = frozenset((KIND_TEXT, KIND_AUDIO, KIND_CMD))
+
+
+def send_frame(sock: socket.socket, *parts: bytes) -> None:
+    """Envia as partes de uma mensagem numa única escrita (sendmsg scatter-gather)."""
+    if not hasattr(sock, "sendmsg"):
+        sock.sendall(b"".join(parts))
+        return
+    sent = sock.sendmsg(parts)
+    if sent < sum(len(p) for p in parts):
+        # escrita parcial: completa o restante com sendall
+        sock.sendall(b"".join(parts)[sent:])
+
+
+def cabecalho_frame(kind: int, payload: bytes) -> bytes:
+    """Header do frame; vai junto com o payload em send_frame(sock, header, payload)."""
+    return FRAME_HDR.pack(kind, len(payload))
+
+
+def extrair_frames(buf: bytearray) -> tuple[list[tuple[int, bytes]], int]:
+    """
+    Consome de buf os frames completos e devolve (frames, bytes descartados).
+    Byte que não inicia um header válido (tipo desconhecido ou tamanho absurdo)
+    é descartado até o próximo header válido: o stream se ressincroniza em vez
+    de perder o resto do buffer. Frame incompleto fica em buf esperando mais dados.
+    """
+    frames = []
+    descartados = 0
+    i, n = 0, len(buf)
+    while i < n:
+        if buf[i] not in _KINDS:
+            i += 1
+            descartados += 1
+            continue
+        if n - i < FRAME_HDR.size:
+            break
+        kind, tamanho = FRAME_HDR.unpack_from(buf, i)
+        if tamanho > FRAME_MAX:
+            i += 1
+            descartados += 1
+            continue
+        fim = i + FRAME_HDR.size + tamanho
+        if fim > n:
+            break
+        frames.append((kind, bytes(buf[i + FRAME_HDR.size:fim])))
+        i = fim
+    del buf[:i]
+    return frames, descartados
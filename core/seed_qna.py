@@ -16,20 +16,22 @@ Uso:
 import csv
 import sys
 import os
-import json
 import argparse
 import logging
 from datetime import datetime
 
-from banco import inicializar_banco
+import numpy as np
+
+from banco import (inicializar_banco, inserir_respostas_bulk, inserir_perguntas_bulk,
+                   atualizar_embeddings_resposta_bulk, carregar_matriz_normalizada)
 from normalizacao import normalizar
 
 # tentativa de importar util de embeddings (opcional)
 try:
-    from embeddings import calcular_embedding, cosine_similarity
+    from embeddings import calcular_embedding, pontuar_lote, vetor_unitario
 except Exception:
     calcular_embedding = None
-    cosine_similarity = None
+    pontuar_lote = vetor_unitario = None
 
 # tqdm optional
 try:
@@ -40,52 +42,36 @@ except Exception:
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 log = logging.getLogger("seed_qna")
 
-def _parse_embedding_json(maybe):
-    if not maybe:
-        return None
-    if isinstance(maybe, (list, tuple)):
-        return maybe
-    try:
-        return json.loads(maybe)
-    except Exception:
-        try:
-            s = str(maybe).strip().strip('"')
-            return json.loads(s)
-        except Exception:
-            return None
+class _MatrizEmbeddings:
+    """Embeddings normalizados (N, D) para a checagem semântica; cresce dobrando a capacidade."""
 
-def fetch_existing_embeddings(conn):
-    """Retorna dict {id: embedding_list} para respostas existentes (embedding_resposta quando disponível)."""
-    cur = conn.cursor()
-    cur.execute("SELECT id, embedding_resposta FROM respostas WHERE embedding_resposta IS NOT NULL AND embedding_resposta != ''")
-    rows = cur.fetchall() or []
-    res = {}
-    for r in rows:
-        rid = r[0]
-        emb = _parse_embedding_json(r[1])
-        if emb:
-            res[rid] = emb
-    try:
-        cur.close()
-    except Exception:
-        pass
-    return res
+    def __init__(self, M=None):
+        self.M = M if M is not None and len(M) else None
+        self.n = len(M) if self.M is not None else 0
 
-def semantic_duplicate_check(text_emb, existing_emb_map, threshold=0.9):
-    """Retorna True se existir embedding no mapa com cosine >= threshold."""
-    if not text_emb or not existing_emb_map or cosine_similarity is None:
+    def adicionar(self, emb):
+        v = vetor_unitario(emb)
+        if v is None:
+            return
+        if self.M is None:
+            self.M = np.zeros((64, v.size), dtype=np.float32)
+        if v.size != self.M.shape[1]:
+            return
+        if self.n == len(self.M):
+            self.M = np.concatenate([self.M, np.zeros_like(self.M)])
+        self.M[self.n] = v
+        self.n += 1
+
+
+def semantic_duplicate_check(text_emb, existentes, threshold=0.9):
+    """Retorna True se algum embedding em `existentes` (_MatrizEmbeddings) tiver cosine >= threshold."""
+    if not text_emb or existentes is None or not existentes.n or pontuar_lote is None:
         return False
     try:
-        for emb in existing_emb_map.values():
-            try:
-                sim = float(cosine_similarity(text_emb, emb))
-            except Exception:
-                continue
-            if sim >= threshold:
-                return True
+        scores = pontuar_lote(text_emb, existentes.M[:existentes.n])
+        return bool(scores.size) and float(scores.max()) >= threshold
     except Exception:
         return False
-    return False
 
 def importar_csv(path: str, atualizar_existentes: bool=False, dry_run: bool=False,
                  dedupe_semantic: bool=False, dedupe_threshold: float=0.9,
@@ -104,11 +90,12 @@ def importar_csv(path: str, atualizar_existentes: bool=False, dry_run: bool=Fals
     start = datetime.now()
 
     # carregar embeddings existentes se for dedupe semântico ou compute_emb
-    existing_emb_map = {}
-    if dedupe_semantic or compute_emb:
+    existentes = _MatrizEmbeddings()
+    if (dedupe_semantic or compute_emb) and pontuar_lote is not None:
         try:
-            existing_emb_map = fetch_existing_embeddings(conn)
-            log.info("Carregadas %d embeddings existentes para checagem semântica.", len(existing_emb_map))
+            _, M = carregar_matriz_normalizada(conn, "respostas")
+            existentes = _MatrizEmbeddings(M.copy())
+            log.info("Carregadas %d embeddings existentes para checagem semântica.", existentes.n)
         except Exception as e:
             log.debug("Falha ao carregar embeddings existentes: %s", e)
 
@@ -121,71 +108,93 @@ def importar_csv(path: str, atualizar_existentes: bool=False, dry_run: bool=Fals
             return
 
         rows = list(reader)
-        for row in tqdm(rows, desc="Processando linhas", unit="lin"):
-            pergunta = (row.get("pergunta") or "").strip()
-            resposta = (row.get("resposta") or "").strip()
-            if not pergunta or not resposta:
-                skipped += 1
-                continue
 
-            p_norm = normalizar(pergunta)
-            r_norm = normalizar(resposta)
+    # índices do que já existe no banco: 2 SELECTs no total em vez de 2 por linha
+    cur.execute("SELECT id, texto_normalizado FROM respostas")
+    respostas_existentes = {}
+    for rid, norm in cur.fetchall() or []:
+        respostas_existentes.setdefault(norm, rid)
+    cur.execute("SELECT id, texto_normalizado FROM perguntas")
+    perguntas_existentes = {}
+    for pid, norm in cur.fetchall() or []:
+        perguntas_existentes.setdefault(norm, pid)
+
+    # o que será inserido, acumulado para INSERTs multi-row no final
+    novas_respostas = []       # textos
+    novas_respostas_emb = []   # embedding de cada nova resposta (ou None)
+    nova_resposta_idx = {}     # r_norm -> índice em novas_respostas
+    novas_perguntas = []       # [pergunta, r_norm]
+    nova_pergunta_idx = {}     # p_norm -> índice em novas_perguntas
+    updates = []               # (r_norm, pergunta_id)
+
+    for row in tqdm(rows, desc="Processando linhas", unit="lin"):
+        pergunta = (row.get("pergunta") or "").strip()
+        resposta = (row.get("resposta") or "").strip()
+        if not pergunta or not resposta:
+            skipped += 1
+            continue
+
+        p_norm = normalizar(pergunta)
+        r_norm = normalizar(resposta)
+
+        # se dedupe semântico ativo, calcular embedding da resposta/pergunta e comparar
+        if dedupe_semantic and calcular_embedding is not None:
+            try:
+                emb_q = calcular_embedding(p_norm)
+            except Exception:
+                emb_q = None
+            # Checamos contra embeddings de respostas existentes
+            if emb_q and semantic_duplicate_check(emb_q, existentes, threshold=dedupe_threshold):
+                semantic_skipped += 1
+                continue
 
-            # se dedupe semântico ativo, calcular embedding da resposta/pergunta e comparar
-            if dedupe_semantic and calcular_embedding is not None:
+        # evitar duplicata exata de resposta (texto_normalizado), no banco ou neste lote
+        if r_norm not in respostas_existentes and r_norm not in nova_resposta_idx and not dry_run:
+            nova_resposta_idx[r_norm] = len(novas_respostas)
+            novas_respostas.append(resposta)
+            inserted_r += 1
+            emb_new = None
+            # opcional: registrar embedding novo no map para futuras comparações dentro deste run
+            if compute_emb and calcular_embedding is not None:
                 try:
-                    emb_q = calcular_embedding(p_norm)
+                    emb_new = calcular_embedding(r_norm)
+                    existentes.adicionar(emb_new)
                 except Exception:
-                    emb_q = None
-                # Checamos contra embeddings de respostas existentes
-                if emb_q and semantic_duplicate_check(emb_q, existing_emb_map, threshold=dedupe_threshold):
-                    semantic_skipped += 1
-                    continue
-
-            # evitar duplicata exata de resposta (texto_normalizado)
-            cur.execute("SELECT id FROM respostas WHERE texto_normalizado = %s", (r_norm,))
-            r = cur.fetchone()
-            if r:
-                resposta_id = r[0]
-            else:
-                if dry_run:
-                    resposta_id = None
+                    log.debug("Falha ao calcular embedding para resposta nova: %s", resposta[:80])
+            novas_respostas_emb.append(emb_new)
+
+        # checar pergunta duplicada por normalização (no banco ou neste lote)
+        if p_norm in perguntas_existentes or p_norm in nova_pergunta_idx:
+            if atualizar_existentes:
+                if p_norm in perguntas_existentes:
+                    updates.append((r_norm, perguntas_existentes[p_norm]))
                 else:
-                    cur.execute("INSERT INTO respostas (texto, texto_normalizado) VALUES (%s, %s)",
-                                (resposta, r_norm))
-                    resposta_id = cur.lastrowid
-                    inserted_r += 1
-                    # opcional: registrar embedding novo no map para futuras comparações dentro deste run
-                    if compute_emb and calcular_embedding is not None and resposta_id:
-                        try:
-                            emb_new = calcular_embedding(r_norm)
-                            existing_emb_map[resposta_id] = emb_new
-                            # gravar direto no campo embedding_resposta
-                            cur.execute("UPDATE respostas SET embedding_resposta = %s WHERE id = %s",
-                                        (json.dumps(list(map(float, emb_new)), ensure_ascii=False), resposta_id))
-                        except Exception:
-                            log.debug("Falha ao calcular/gravar embedding para resposta_id=%s", resposta_id)
-
-            # checar pergunta duplicada por normalização
-            cur.execute("SELECT id, resposta_id FROM perguntas WHERE texto_normalizado = %s", (p_norm,))
-            existing = cur.fetchone()
-            if existing:
-                if atualizar_existentes:
-                    if not dry_run:
-                        cur.execute("UPDATE perguntas SET resposta_id = %s WHERE id = %s", (resposta_id, existing[0]))
-                    updated += 1
-                else:
-                    skipped += 1
-                continue
-
-            if dry_run:
-                inserted_q += 1  # contar como se fosse inserida no dry-run
+                    novas_perguntas[nova_pergunta_idx[p_norm]][1] = r_norm
+                updated += 1
             else:
-                cur.execute("INSERT INTO perguntas (texto, texto_normalizado, resposta_id) VALUES (%s, %s, %s)",
-                            (pergunta, p_norm, resposta_id))
-                inserted_q += 1
+                skipped += 1
+            continue
+
+        nova_pergunta_idx[p_norm] = len(novas_perguntas)
+        novas_perguntas.append([pergunta, r_norm])
+        inserted_q += 1  # no dry-run conta como se fosse inserida
 
     if not dry_run:
+        # tudo numa transação só (commit no fim): uma falha no meio não deixa importação pela metade
+        ids_r = inserir_respostas_bulk(conn, novas_respostas, commit=False)
+        resposta_ids = dict(respostas_existentes)
+        for r_norm, idx in nova_resposta_idx.items():
+            resposta_ids[r_norm] = ids_r[idx]
+        # gravar embedding_resposta (JSON) e a cópia float32 binária: um UPDATE por bloco
+        try:
+            atualizar_embeddings_resposta_bulk(
+                conn, [(rid, list(map(float, emb_new))) for rid, emb_new in zip(ids_r, novas_respostas_emb) if emb_new],
+                commit=False)
+        except Exception:
+            log.exception("Falha ao gravar embeddings das novas respostas")
+        inserir_perguntas_bulk(conn, [(p, resposta_ids.get(r)) for p, r in novas_perguntas], commit=False)
+        for r_norm, pid in updates:
+            cur.execute("UPDATE perguntas SET resposta_id = %s WHERE id = %s", (resposta_ids.get(r_norm), pid))
         conn.commit()
     try:
         cur.close()
@@ -9,6 +9,12 @@ ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
 if ROOT not in sys.path:
     sys.path.insert(0, ROOT)
 
+# os módulos de core/ se importam sem prefixo (from banco import ...), como em produção;
+# antes do import abaixo, senão core.embeddings falha e pipeline_search fica sem embmod
+CORE = os.path.join(ROOT, "core")
+if CORE not in sys.path:
+    sys.path.insert(1, CORE)
+
 # agora o import deve encontrar 'tools' que está na raiz do projeto
 from core.pipeline_search import find_answer, numbers_to_words_in_text, user_requests_only_field
 
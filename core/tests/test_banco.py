@@ -0,0 +1,230 @@
+# tests/test_banco.py
+import numpy as np
+import pytest
+
+import banco
+import embedding_store
+
+
+@pytest.fixture(autouse=True)
+def _store_temporario(tmp_path, monkeypatch):
+    # escritas de embedding apagam o .npy do store: nunca o de data/ de verdade
+    monkeypatch.setattr(embedding_store, "STORE_DIR", str(tmp_path))
+    monkeypatch.setattr(banco, "_emb_cache", {})
+
+
+class _Cursor:
+    def __init__(self, conn, prepared=False):
+        self.conn = conn
+        self.prepared = prepared
+        self.lastrowid = 0
+        self._linhas = []
+
+    def execute(self, sql, params=()):
+        self.conn.executados.append((sql, tuple(params)))
+        self.conn.preparados.append(self.prepared)
+        self.lastrowid, self._linhas = self.conn.responder(sql, tuple(params))
+
+    def fetchall(self):
+        return self._linhas
+
+    def fetchone(self):
+        return self._linhas[0] if self._linhas else None
+
+    def __iter__(self):
+        return iter(self._linhas)
+
+    def close(self):
+        pass
+
+
+class FakeConn:
+    """Conexão mínima: registra (sql, params) e responde via `responder`."""
+
+    def __init__(self, responder=None):
+        self.executados = []
+        self.preparados = []  # prepared=True/False de cada execute, na ordem
+        self.commits = 0
+        self.responder = responder or (lambda sql, params: (0, []))
+
+    def cursor(self, prepared=False, dictionary=False, buffered=True):
+        return _Cursor(self, prepared)
+
+    def commit(self):
+        self.commits += 1
+
+
+def test_atualizar_embeddings_bulk_case_por_bloco(monkeypatch):
+    monkeypatch.setattr(banco, "BULK_CHUNK", 2)
+    conn = FakeConn()
+    pares = [(7, [3.0, 4.0]), (9, [0.0, 2.0]), (11, [1.0, 0.0])]
+    banco.atualizar_embeddings_bulk(conn, "perguntas", pares, commit=False)
+
+    assert len(conn.executados) == 2 and conn.commits == 0
+    sql, params = conn.executados[0]
+    assert sql == ("UPDATE perguntas SET embedding = CASE id WHEN %s THEN %s WHEN %s THEN %s END, "
+                   "embedding_bin = CASE id WHEN %s THEN %s WHEN %s THEN %s END WHERE id IN (%s,%s)")
+    assert params[0] == 7 and params[2] == 9 and params[-2:] == (7, 9)
+    assert params[1] == banco.embedding_para_json([3.0, 4.0])
+    # BLOB sai normalizado
+    np.testing.assert_allclose(np.frombuffer(params[5], dtype=np.float32), [0.6, 0.8], rtol=1e-6)
+    sql, params = conn.executados[1]
+    assert "respostas" not in sql and params[-1] == 11 and sql.count("WHEN") == 2
+
+
+def test_atualizar_embeddings_bulk_respostas_commit():
+    conn = FakeConn()
+    banco.atualizar_embeddings_bulk(conn, "respostas", [(1, [1.0, 0.0])])
+    sql, _ = conn.executados[0]
+    assert sql.startswith("UPDATE respostas SET embedding_resposta = CASE id")
+    assert "embedding_resposta_bin = CASE id" in sql
+    assert conn.commits == 1
+
+
+def _responder_insert(primeiro_id, incremento=1):
+    """lastrowid = primeiro id de cada INSERT (avançando como o InnoDB) e o @@auto_increment_increment."""
+    proximo = [primeiro_id]
+
+    def responder(sql, params):
+        if sql.startswith("SELECT @@auto_increment_increment"):
+            return 0, [(incremento,)]
+        n = sql.count("),(") + 1
+        primeiro = proximo[0]
+        proximo[0] += n * incremento
+        return primeiro, []
+    return responder
+
+
+def test_inserir_multi_blocos_e_ids(monkeypatch):
+    monkeypatch.setattr(banco, "BULK_CHUNK", 2)
+    conn = FakeConn(_responder_insert(10))
+    ids = banco.inserir_respostas_bulk(conn, ["A", "B", "C"])
+
+    assert ids == [10, 11, 12]
+    inserts = [(sql, p) for sql, p in conn.executados if sql.startswith("INSERT")]
+    assert inserts[0][0] == "INSERT INTO respostas (texto, texto_normalizado) VALUES (%s, %s),(%s, %s)"
+    assert inserts[0][1] == ("A", "a", "B", "b")
+    assert inserts[1][0].endswith("VALUES (%s, %s)") and inserts[1][1] == ("C", "c")
+    assert conn.commits == 2
+
+
+def test_inserir_multi_respeita_incremento_e_commit(monkeypatch):
+    monkeypatch.setattr(banco, "BULK_CHUNK", 2)
+    conn = FakeConn(_responder_insert(5, incremento=3))
+    ids = banco.inserir_perguntas_bulk(conn, [("p1", 1), ("p2", None), ("p3", 2)], commit=False)
+
+    assert ids == [5, 8, 11]
+    assert conn.commits == 0
+
+
+def test_bloco_final_nao_fica_preparado(monkeypatch):
+    # só o SQL do bloco cheio (texto fixo) fica em cache; o do resto muda com o tamanho
+    monkeypatch.setattr(banco, "BULK_CHUNK", 2)
+    conn = FakeConn(_responder_insert(1))
+    banco.inserir_respostas_bulk(conn, ["A", "B", "C"])
+    banco.atualizar_embeddings_bulk(conn, "respostas", [(1, [1.0]), (2, [1.0]), (3, [1.0])])
+
+    por_sql = dict(zip((sql for sql, _ in conn.executados), conn.preparados))
+    multi = [sql for sql in por_sql if sql.startswith(("INSERT", "UPDATE"))]
+    assert [por_sql[sql] for sql in multi] == [True, False, True, False]
+    assert sorted(banco._preparados[conn]) == sorted(
+        [sql for sql, preparado in por_sql.items() if preparado])
+
+
+def _unit(*v):
+    v = np.asarray(v, dtype=np.float32)
+    return v / np.linalg.norm(v)
+
+
+def test_sem_cache_fifo(monkeypatch):
+    monkeypatch.setattr(banco, "SEM_CACHE_CAP", 2)
+    banco._sem_cache_limpar()
+    banco._sem_cache_guardar("a", _unit(1, 0, 0), "ra", 0.9)
+    banco._sem_cache_guardar("b", _unit(0, 1, 0), "rb", 0.9)
+    banco._sem_cache_guardar("c", _unit(0, 0, 1), "rc", 0.9)  # sai "a", a mais antiga
+
+    assert banco._sem_cache_texto("a", 0.5) is None
+    assert banco._sem_cache_buscar(_unit(1, 0, 0), 0.5) is None
+    assert banco._sem_cache_texto("b", 0.5) == "rb"
+    assert banco._sem_cache_buscar(_unit(0, 0.1, 1), 0.5) == "rc"
+
+    banco._sem_cache_guardar("d", _unit(1, 1, 0), "rd", 0.9)  # sai "b"
+    assert banco._sem_cache_texto("b", 0.5) is None
+    assert banco._sem_cache_texto("c", 0.5) == "rc"
+    assert banco._sem_cache_texto("d", 0.5) == "rd"
+    banco._sem_cache_limpar()
+
+
+def test_sem_cache_respeita_threshold():
+    banco._sem_cache_limpar()
+    banco._sem_cache_guardar("x", _unit(1, 0), "rx", 0.7)
+    assert banco._sem_cache_texto("x", 0.6) == "rx"
+    assert banco._sem_cache_texto("x", 0.8) is None
+    assert banco._sem_cache_buscar(_unit(1, 0.05), 0.8) is None
+    banco._sem_cache_limpar()
+
+
+def test_insert_limpa_sem_cache():
+    banco._sem_cache_limpar()
+    banco._sem_cache_guardar("x", _unit(1, 0), "rx", 0.9)
+    banco.inserir_resposta(FakeConn(lambda sql, params: (42, [])), "nova resposta")
+    assert banco._sem_cache_texto("x", 0.0) is None
+
+
+def _responder_respostas(impressao, linhas):
+    """Banco com as respostas `linhas` = [(id, texto, vetor)] e a impressão (COUNT, MAX(id)) dada."""
+    def responder(sql, params):
+        if sql.startswith("SELECT COUNT(*), COALESCE(MAX(id), 0) FROM respostas"):
+            return 0, [impressao]
+        if sql.startswith("SELECT id, texto, embedding_resposta_bin"):
+            return 0, [(rid, texto, np.asarray(v, dtype=np.float32).tobytes(), None) for rid, texto, v in linhas]
+        if sql.startswith("SELECT id, texto FROM respostas"):
+            return 0, [(rid, texto) for rid, texto, _ in linhas]
+        return 0, []
+    return responder
+
+
+def _leu_linhas(conn):
+    return any(sql.startswith("SELECT id, texto, embedding_resposta_bin") for sql, _ in conn.executados)
+
+
+def test_matriz_respostas_vem_do_store_com_a_mesma_impressao(monkeypatch):
+    linhas = [(9, "r9", [3.0, 4.0]), (4, "r4", [1.0, 0.0])]
+    conn = FakeConn(_responder_respostas((2, 9), linhas))
+    ids, textos, M = banco._matriz_respostas(conn)
+    assert ids == [9, 4] and textos == ["r9", "r4"] and _leu_linhas(conn)
+
+    # outro processo: memória vazia, o .npy gravado acima serve
+    monkeypatch.setattr(banco, "_emb_cache", {})
+    conn = FakeConn(_responder_respostas((2, 9), linhas))
+    ids2, textos2, M2 = banco._matriz_respostas(conn)
+    assert ids2 == ids and textos2 == textos and not _leu_linhas(conn)
+    np.testing.assert_allclose(M2, M, atol=1e-3)
+
+    # banco mudou por fora (restore, outra máquina): impressão diferente relê o MySQL
+    monkeypatch.setattr(banco, "_emb_cache", {})
+    conn = FakeConn(_responder_respostas((3, 12), linhas + [(12, "r12", [0.0, 1.0])]))
+    ids3, _, _ = banco._matriz_respostas(conn)
+    assert ids3 == [9, 4, 12] and _leu_linhas(conn)
+
+
+@pytest.mark.parametrize("escrever", [
+    lambda conn: banco.atualizar_embedding_pergunta(conn, 1, [1.0, 0.0]),
+    lambda conn: banco.atualizar_embeddings_bulk(conn, "perguntas", [(1, [1.0, 0.0])]),
+])
+def test_escrita_de_pergunta_remove_store(escrever):
+    embedding_store.salvar("perguntas", [1], np.array([[1.0, 0.0]], dtype=np.float32))
+    assert embedding_store.carregar("perguntas") is not None
+    escrever(FakeConn())
+    assert embedding_store.carregar("perguntas") is None
+
+
+def test_carregar_matriz_normalizada_e_a_matriz_da_busca():
+    conn = FakeConn(_responder_respostas((1, 5), [(5, "r5", [0.0, 2.0])]))
+    ids, M = banco.carregar_matriz_normalizada(conn, "respostas")
+    ids2, textos, M2 = banco._matriz_respostas(conn)
+    assert ids == ids2 == [5] and textos == ["r5"]
+    assert M is M2  # uma cópia só em memória, usada pela busca e pelo seed_qna
+    np.testing.assert_allclose(M, [[0.0, 1.0]])
+    with pytest.raises(ValueError):
+        banco.carregar_matriz_normalizada(conn, "memorias")
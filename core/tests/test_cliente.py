@@ -0,0 +1,72 @@
+# tests/test_cliente.py
+import base64
+import json
+import socket
+import threading
+
+import cliente
+
+
+def test_audio_inline_reconhecido_sem_parse():
+    wav = b"RIFF" + bytes(4000)
+    linha = json.dumps({"type": "audio", "filename": "a.wav",
+                        "content": base64.b64encode(wav).decode()}).encode()
+    assert len(linha) > cliente.INLINE_MIN
+    assert cliente._RE_AUDIO_INLINE.search(linha)
+    # texto que só cita o header vem escapado no JSON e não casa
+    texto = json.dumps({"type": "text", "content": '{"type": "audio"}' * 100}).encode()
+    assert not cliente._RE_AUDIO_INLINE.search(texto)
+
+
+def test_decode_inline_audio_enfileira():
+    wav = b"RIFF" + bytes(64)
+    linha = json.dumps({"type": "audio", "content": base64.b64encode(wav).decode()}).encode()
+    q = cliente.AudioRing(2)
+    cliente._decode_inline_audio(q, linha)
+    assert q.get() == (wav, "recv_audio.wav")
+
+
+def test_audio_ring_volta_do_buffer_mantem_ordem():
+    q = cliente.AudioRing(3)
+    saida = []
+    for i in range(0, 40, 2):  # dois put por volta em capacidade 3: head/tail dão várias voltas
+        q.put(i)
+        q.put(i + 1)
+        saida += [q.get(), q.get()]
+    assert saida == list(range(40))
+    assert q._head == q._tail == 40
+
+
+def test_audio_ring_produtor_bloqueia_com_fila_cheia():
+    q = cliente.AudioRing(2)
+    t = threading.Thread(target=lambda: [q.put(i) for i in range(50)])
+    t.start()
+    assert [q.get() for _ in range(50)] == list(range(50))
+    t.join(timeout=5)
+    assert not t.is_alive()
+
+
+def test_recv_line_and_rest_sobra_vira_pending():
+    a, b = socket.socketpair()
+    try:
+        a.sendall(b'{"type":"text"}\n{"type":"cmd"}\nRIFF')
+        linha, resto = cliente.recv_line_and_rest(b, timeout=1.0)
+        assert linha == b'{"type":"text"}'
+        # a segunda linha já está na sobra: sai sem recv
+        linha, resto = cliente.recv_line_and_rest(b, timeout=0.01, pending=resto)
+        assert (linha, resto) == (b'{"type":"cmd"}', b"RIFF")
+        # sobra sem newline: completa com o que chegar do socket
+        a.sendall(b'WAVE"}\nxx')
+        linha, resto = cliente.recv_line_and_rest(b, timeout=1.0, pending=b'{"x":"')
+        assert (linha, resto) == (b'{"x":"WAVE"}', b"xx")
+    finally:
+        a.close(); b.close()
+
+
+def test_recv_line_and_rest_timeout_devolve_parcial():
+    a, b = socket.socketpair()
+    try:
+        a.sendall(b"parcial")
+        assert cliente.recv_line_and_rest(b, timeout=0.05) == (None, b"parcial")
+    finally:
+        a.close(); b.close()
@@ -0,0 +1,35 @@
+# tests/test_embedding_store.py
+import numpy as np
+import pytest
+
+import embedding_store
+
+
+def _matriz(n=8, d=16):
+    M = np.random.default_rng(0).standard_normal((n, d)).astype(np.float32)
+    return M / np.linalg.norm(M, axis=1, keepdims=True)
+
+
+@pytest.mark.parametrize("dtype, tol", [("float16", 1e-3), ("int8", 2e-2)])
+def test_salvar_carregar_ida_e_volta(tmp_path, monkeypatch, dtype, tol):
+    monkeypatch.setattr(embedding_store, "STORE_DIR", str(tmp_path))
+    monkeypatch.setattr(embedding_store, "STORE_DTYPE", dtype)
+    M = _matriz()
+    ids = list(range(10, 18))
+    embedding_store.salvar("respostas", ids, M)
+    r = embedding_store.carregar("respostas")
+    assert r is not None
+    ids2, M2 = r
+    assert ids2 == ids
+    assert M2.dtype == np.float32 and M2.shape == M.shape
+    assert np.allclose(np.linalg.norm(M2, axis=1), 1.0, atol=1e-5)
+    assert np.abs(M2 - M).max() < tol
+
+
+def test_remover_invalida(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_store, "STORE_DIR", str(tmp_path))
+    monkeypatch.setattr(embedding_store, "STORE_DTYPE", "int8")
+    embedding_store.salvar("perguntas", [1, 2], _matriz(2, 4))
+    embedding_store.remover("perguntas")
+    assert embedding_store.carregar("perguntas") is None
+    assert not list(tmp_path.iterdir())
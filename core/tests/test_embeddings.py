@@ -0,0 +1,34 @@
+# tests/test_embeddings.py
+import numpy as np
+import pytest
+
+from embeddings import indices_top_k, parse_embedding
+
+
+@pytest.mark.filterwarnings("error")
+@pytest.mark.parametrize("valor", [
+    "[0.5, -1, 2e-1]",
+    '"[0.5,-1,0.2]"',
+    "0.5, -1, 0.2",
+    " [0.5,-1,0.2 ",
+    [0.5, -1, 0.2],
+    (0.5, -1, 0.2),
+    np.array([0.5, -1, 0.2]),
+])
+def test_parse_embedding_formatos(valor):
+    v = parse_embedding(valor)
+    assert v.dtype == np.float32
+    np.testing.assert_allclose(v, [0.5, -1.0, 0.2], rtol=1e-6)
+
+
+@pytest.mark.parametrize("valor", [None, "", "[]", "abc", "1,,2", [], {"a": 1}])
+def test_parse_embedding_invalido(valor):
+    assert parse_embedding(valor) is None
+
+
+@pytest.mark.parametrize("k", [None, 0, 1, 3, 5, 8, 20])
+def test_indices_top_k_igual_ao_sort_estavel(k):
+    # muitos empates, inclusive no corte do k-ésimo
+    scores = np.array([0.5, 0.9, 0.5, 0.1, 0.9, 0.5, 0.3, 0.5, 0.9, 0.1])
+    esperado = np.argsort(-scores, kind="stable")
+    assert indices_top_k(scores, k).tolist() == esperado[:k if k is not None else None].tolist()
@@ -0,0 +1,80 @@
+# tests/test_gerenciador_respostas.py
+import numpy as np
+import pytest
+
+import gerenciador_respostas
+from gerenciador_respostas import _resposta_deterministica, obter_top_k_respostas
+from normalizacao import normalizar
+
+
+def _tipo(pergunta):
+    r = _resposta_deterministica(pergunta, normalizar(pergunta))
+    return r["explain"]["generated"] if r else None
+
+
+@pytest.mark.parametrize("pergunta, tipo", [
+    ("Que horas são?", "current_time"),
+    ("que horas são agora", "current_time"),
+    ("Que horas são, por favor?", "current_time"),
+    ("qual a hora atual", "current_time"),
+    ("Que dia é hoje?", "today_date"),
+    ("hoje é que dia da semana?", "weekday"),
+])
+def test_resposta_deterministica_reconhece(pergunta, tipo):
+    assert _tipo(pergunta) == tipo
+
+
+@pytest.mark.parametrize("pergunta", [
+    "A que horas é a aula?",
+    "a que horas são as aulas",
+    "que horas é a reunião",
+    "qual a data do meu aniversário",
+    "que horas são em Tóquio quando aqui for meio dia",
+    "Qual é a capital da França?",
+])
+def test_resposta_deterministica_ignora(pergunta):
+    assert _tipo(pergunta) is None
+
+
+class _CursorLinhas:
+    """Linhas como dict só com cursor(dictionary=True); senão tuplas, como o mysql.connector."""
+
+    def __init__(self, linhas, dictionary):
+        self._linhas = linhas if dictionary else [tuple(r.values()) for r in linhas]
+
+    def execute(self, sql, params=()):
+        pass
+
+    def fetchall(self):
+        return self._linhas
+
+    def close(self):
+        pass
+
+
+class _ConnLinhas:
+    def __init__(self, linhas):
+        self.linhas = linhas
+
+    def cursor(self, dictionary=False, **kw):
+        return _CursorLinhas(self.linhas, dictionary)
+
+
+def _linha(texto, vetor, keywords):
+    v = np.asarray(vetor, dtype=np.float32)
+    return {"pid": 1, "pergunta_texto": "", "pergunta_norm": "", "pergunta_embedding": None,
+            "pergunta_keywords": keywords, "rid": 1, "resposta_texto": texto, "resposta_norm": "",
+            "resposta_embedding": None, "resposta_embedding_bin": (v / np.linalg.norm(v)).tobytes()}
+
+
+def test_obter_top_k_respostas_retorna_candidatos(monkeypatch):
+    # regressão: com cursor de tuplas todas as linhas eram descartadas e a função devolvia []
+    monkeypatch.setattr(gerenciador_respostas, "embedding_consulta",
+                        lambda texto: np.array([1.0, 0.0, 0.0], dtype=np.float32))
+    conn = _ConnLinhas([
+        _linha("longe", [0.0, 1.0, 0.0], "gato"),
+        _linha("perto", [1.0, 0.1, 0.0], "capital,franca"),
+        _linha("meio", [1.0, 1.0, 0.0], "capital"),
+    ])
+    assert obter_top_k_respostas("qual a capital da França", conn, k=2) == ["perto", "meio"]
+
@@ -1,5 +1,7 @@
     # tests/test_pipeline.py
 import os
+import core.pipeline_search as pipeline_search
+import gerenciador_respostas
 from core.pipeline_search import find_answer, numbers_to_words_in_text, user_requests_only_field
 from core.normalizacao import normalizar
 
@@ -27,3 +29,15 @@ def test_sql_injection_safe():
     evil = "x' OR '1'='1; -- "
     res = find_answer(evil, use_db=False, csv_path="meus_qna.csv")
     assert isinstance(res, dict)
+
+def test_csv_fallback_empates_iguais_nos_dois_pipelines(tmp_path, monkeypatch):
+    # sem embedding, só keywords: uma em cada três respostas casa as duas palavras, as
+    # outras empatam com uma; no corte do top-k vale a ordem do CSV (sort estável)
+    monkeypatch.setattr(pipeline_search.embmod, "embedding_consulta", lambda q: None)
+    monkeypatch.setattr(gerenciador_respostas, "embedding_consulta", lambda q: None)
+    csv_path = tmp_path / "qna.csv"
+    linhas = ["pergunta,resposta"] + [f"p{i},capital {'franca ' if i % 3 == 0 else ''}{i}" for i in range(12)]
+    csv_path.write_text("\n".join(linhas) + "\n", encoding="utf-8")
+    a = [c["pergunta_texto"] for c in pipeline_search.csv_fallback_search(str(csv_path), "capital franca", top_k=5)]
+    b = [c["pergunta_texto"] for c in gerenciador_respostas.csv_fallback_search(str(csv_path), "capital franca", top_k=5)]
+    assert a == b == ["p0", "p3", "p6", "p9", "p1"]
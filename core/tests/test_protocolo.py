@@ -0,0 +1,44 @@
+# tests/test_protocolo.py
+import socket
+
+from protocolo import KIND_AUDIO, KIND_TEXT, cabecalho_frame, extrair_frames, send_frame
+
+
+def _frame(kind, payload):
+    return cabecalho_frame(kind, payload) + payload
+
+
+def test_frames_ida_e_volta():
+    buf = bytearray(_frame(KIND_TEXT, "olá".encode()) + _frame(KIND_AUDIO, b"\x00" * 10))
+    frames, descartados = extrair_frames(buf)
+    assert frames == [(KIND_TEXT, "olá".encode()), (KIND_AUDIO, b"\x00" * 10)]
+    assert descartados == 0 and not buf
+
+
+def test_frame_incompleto_fica_no_buffer():
+    dados = _frame(KIND_TEXT, b"abcdef")
+    buf = bytearray(dados[:-2])
+    assert extrair_frames(buf) == ([], 0)
+    assert buf == dados[:-2]
+    buf += dados[-2:]
+    assert extrair_frames(buf) == ([(KIND_TEXT, b"abcdef")], 0)
+
+
+def test_ressincroniza_apos_lixo():
+    # lixo entre frames e um header com tamanho absurdo não derrubam o resto
+    lixo = b"xyz" + bytes([KIND_TEXT]) + (2**32 - 1).to_bytes(4, "big")
+    buf = bytearray(_frame(KIND_TEXT, b"um") + lixo + _frame(KIND_TEXT, b"dois"))
+    frames, descartados = extrair_frames(buf)
+    assert frames == [(KIND_TEXT, b"um"), (KIND_TEXT, b"dois")]
+    assert descartados == len(lixo)
+    assert not buf
+
+
+def test_send_frame_uma_escrita():
+    a, b = socket.socketpair()
+    try:
+        send_frame(a, cabecalho_frame(KIND_TEXT, b"oi"), b"oi")
+        buf = bytearray(b.recv(64))
+        assert extrair_frames(buf) == ([(KIND_TEXT, b"oi")], 0)
+    finally:
+        a.close(); b.close()
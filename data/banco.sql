@@ -21,6 +21,8 @@ CREATE TABLE IF NOT EXISTS perguntas (
 );
 
 ALTER TABLE perguntas ADD COLUMN keywords TEXT DEFAULT NULL;
+ALTER TABLE respostas ADD COLUMN embedding_resposta_bin BLOB DEFAULT NULL;
+ALTER TABLE perguntas ADD COLUMN embedding_bin BLOB DEFAULT NULL;
 
 -- Tabela de memória pessoal
 CREATE TABLE IF NOT EXISTS memoria_pessoal (
@@ -73,6 +75,36 @@ PREPARE stmt FROM @sql;
 EXECUTE stmt;
 DEALLOCATE PREPARE stmt;
 
+-- Índice para as consultas de memória por tipo ordenadas por data
+SELECT COUNT(*) INTO @idx_exists
+FROM information_schema.STATISTICS
+WHERE TABLE_SCHEMA = 'chatbot'
+  AND TABLE_NAME = 'memoria_pessoal'
+  AND INDEX_NAME = 'idx_memoria_tipo_data';
+
+SET @sql = IF(@idx_exists = 0,
+              'CREATE INDEX idx_memoria_tipo_data ON memoria_pessoal(tipo, data_evento)',
+              'SELECT "index_already_exists"');
+
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- Índice para os filtros de memória por intervalo de datas (sem tipo)
+SELECT COUNT(*) INTO @idx_exists
+FROM information_schema.STATISTICS
+WHERE TABLE_SCHEMA = 'chatbot'
+  AND TABLE_NAME = 'memoria_pessoal'
+  AND INDEX_NAME = 'idx_memoria_data';
+
+SET @sql = IF(@idx_exists = 0,
+              'CREATE INDEX idx_memoria_data ON memoria_pessoal(data_evento)',
+              'SELECT "index_already_exists"');
+
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
 -- Normalização básica dos textos já existentes
 SET SQL_SAFE_UPDATES = 0;
 